@@ -1,21 +1,29 @@
 import streamlit as st
-import google.generativeai as genai
-import pandas as pd
-import json
 import os
 from dotenv import load_dotenv
-from PIL import Image
 
 # Load environment variables
 # Load environment variables
-import os
+# NOTE: Heavy modules (google.generativeai, python-docx, PIL, markdown) are imported
+# on first use inside llm_client / request_builder / newsletter_utils to keep cold start fast.
 env_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(dotenv_path=env_path, override=True)
 import time
 from datetime import datetime
 import base64
-from io import BytesIO
-import docx # Added for .docx support
+import profile_parser
+import student_store
+import request_builder
+from student_store import load_data, save_data, save_uploaded_files
+import llm_client
+import llm_metrics
+import newsletter_utils
+import job_runner
+import tenants
+import storage_maintenance
+import doc_render
+import plan_template
+import chat_store
 
 # --- Configuration & Setup ---
 st.set_page_config(
@@ -28,86 +36,109 @@ st.set_page_config(
 # Constants
 # Constants
 # Constants
-DATA_FILE = "students_data.json"
-DOCS_DIR = "student_docs" # Directory to save files
+DATA_FILE = student_store.DATA_FILE
+DOCS_DIR = student_store.DOCS_DIR # Directory to save files
 MODEL_PRO = "gemini-3-pro-preview"   # Available v3 Preview model
 MODEL_FLASH = "gemini-3-flash-preview" # Available v3 Flash Preview model
+JOB_POLL_SECONDS = 2 # How often a tab re-checks a running background job
+GUEST_CHAT = "_guest" # chat_store owner when no student is selected
 
 # --- Utility Functions ---
-def load_data():
-    if not os.path.exists(DATA_FILE):
-        return {}
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
-
-def save_data(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
 def init_gemini(api_key):
-    if api_key:
-        genai.configure(api_key=api_key)
-        return True
-    return False
+    # The shared client (and google.generativeai) is created on the first model call,
+    # so the first render doesn't pay for importing the SDK.
+    return bool(api_key)
 
-def extract_text_from_docx(file_stream):
-    """Extracts text from a docx file stream."""
-    try:
-        doc = docx.Document(file_stream)
-        full_text = []
-        for para in doc.paragraphs:
-            full_text.append(para.text)
-        return '\\n'.join(full_text)
-    except Exception as e:
-        print(f"Error reading docx: {e}")
-        return ""
+@st.cache_resource(show_spinner=False)
+def get_llm_client(api_key):
+    """One configured client per API key, shared by every session in this process."""
+    return llm_client.get_client(api_key)
+
+@st.cache_data(show_spinner=False)
+def _read_image_base64(image_path, mtime):
+    with open(image_path, "rb") as img_file:
+        return base64.b64encode(img_file.read()).decode()
 
 def get_image_base64(image_path):
     if not os.path.exists(image_path):
         return ""
-    with open(image_path, "rb") as img_file:
-        return base64.b64encode(img_file.read()).decode()
+    return _read_image_base64(image_path, os.path.getmtime(image_path))
 
-def save_uploaded_files(student_name, uploaded_files):
-    if not uploaded_files:
-        return []
-    
-    student_dir = os.path.join(DOCS_DIR, student_name)
-    os.makedirs(student_dir, exist_ok=True)
-    
-    saved_file_paths = []
-    
-    for file in uploaded_files:
-        file_path = os.path.join(student_dir, file.name)
-        with open(file_path, "wb") as f:
-            f.write(file.getbuffer())
-        saved_file_paths.append(file_path)
-        
-    return saved_file_paths
+# Caches are keyed by the branch's own data file, so each branch has its own snapshot/index
+@st.cache_data(show_spinner=False)
+def _load_profiles_snapshot(data_file, mtime, tenant_id):
+    return load_data(tenant_id)
 
-def delete_data(student_name):
-    if not student_name: return False
-    
-    # 1. Remove from JSON
-    data = load_data()
-    if student_name in data:
-        del data[student_name]
-        save_data(data)
-        
-        # 2. Remove Files (Optional - strictly remove only if exists to avoid errors)
-        import shutil
-        student_dir = os.path.join(DOCS_DIR, student_name)
-        if os.path.exists(student_dir):
-            try:
-                shutil.rmtree(student_dir)
-            except Exception as e:
-                print(f"Error deleting directory: {e}")
+def load_profiles(tenant_id):
+    """Profile snapshot cached until the branch's students_data.json changes on disk."""
+    data_file = student_store.data_file(tenant_id)
+    if not os.path.exists(data_file):
+        return {}
+    return _load_profiles_snapshot(data_file, os.path.getmtime(data_file), tenant_id)
+
+@st.cache_resource(show_spinner=False)
+def _roster_index(data_file, mtime, tenant_id):
+    return profile_parser.RosterIndex(load_data(tenant_id))
+
+def get_roster_index(tenant_id):
+    data_file = student_store.data_file(tenant_id)
+    mtime = os.path.getmtime(data_file) if os.path.exists(data_file) else None
+    return _roster_index(data_file, mtime, tenant_id)
+
+@st.cache_data(show_spinner=False, max_entries=50)
+def plan_docx_bytes(plan_path, plan_text, title):
+    """DOCX rendering of a saved plan (plan files are never rewritten, so the path is the key)."""
+    return doc_render.docx_bytes(plan_text, title=title)
+
+SECTION_ICONS = {"ok": "✅", "invalid": "⚠️", "failed": "❌", "pending": "⏳"}
+
+def load_newsletter_draft(draft):
+    """Puts a draft job's sections into the session; the per-grade editors start from the new text."""
+    st.session_state['newsletter_draft'] = draft
+    for section in draft["sections"]:
+        st.session_state.pop(f"draft_section_{section['grade']}", None)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def newsletter_docx(body, month, tenant_id):
+    """Draft laid out like the Master Plan Guide DOCX (keyed on the edited body)."""
+    return newsletter_utils.newsletter_docx_bytes(body, month, tenant_id)
+
+@st.cache_resource(show_spinner=False)
+def get_job_runner():
+    """Background job runner (process pool + SQLite job table), one per server process."""
+    return job_runner.get_runner()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id, label):
+    """Progress bar that re-reads the job on its own timer. Once the job settles the app reruns,
+    so the tab that owns it renders the result (plain st.rerun is valid from full-app runs too)."""
+    job = job_runner.get_job(job_id)
+    if job is None or job["status"] not in job_runner.ACTIVE_STATUSES:
+        st.rerun()
+    st.progress(job["progress"] or 0.0, text=f"{label} — {job['message'] or job['status']}")
+
+def show_job_status(job, label):
+    """Shows a job's progress or error. Returns True while it is still queued/running."""
+    if job["status"] in job_runner.ACTIVE_STATUSES:
+        job_progress(job["id"], label)
         return True
+    if job["status"] == job_runner.STATUS_FAILED:
+        st.error(f"에러 발생: {job['error']}")
     return False
 
+def available_files_for(student_name, selected_student_key, saved_data, uploaded_files):
+    """Documents offered to the Master Plan / Chatbot selectors: saved files, then new uploads."""
+    available_files = {}
+    # 1. Saved Files
+    if selected_student_key == student_name:
+         for f_path in saved_data.get(student_name, {}).get("files", []):
+              available_files[f"[Saved] {os.path.basename(f_path)}"] = f_path
+    # 2. Uploaded Files
+    if uploaded_files:
+         for f in uploaded_files:
+              available_files[f"[New] {f.name}"] = f
+    return available_files
+
 # --- Custom Styling (Premium Dashboard Look) ---
 st.markdown("""
 <style>
@@ -174,6 +205,449 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- Fragments ---
+@st.fragment
+def render_roster_analytics(saved_data, grade_options, tenant_id):
+    with st.expander("📊 Roster Analytics (학생 필터)"):
+        roster_index = get_roster_index(tenant_id)
+        f_grade = st.selectbox("Grade Filter", ["All"] + grade_options, key="roster_grade")
+        f_gpa = st.number_input("Min GPA (UW)", min_value=0.0, max_value=4.0, value=0.0, step=0.1)
+        f_sat = st.number_input("Min SAT", min_value=0, max_value=1600, value=0, step=10)
+        ranges = {}
+        if f_gpa > 0: ranges["gpa_unweighted"] = (f_gpa, None)
+        if f_sat > 0: ranges["sat_total"] = (f_sat, None)
+        rows = roster_index.filter(grade=None if f_grade == "All" else f_grade, **ranges)
+        st.caption(f"{len(rows)} / {len(saved_data)} students")
+        if rows:
+            st.dataframe(rows, hide_index=True)
+
+        # Term-end export: roster + latest plans as DOCX/MD/HTML (background job)
+        if st.button("📦 Export All Plans (ZIP)"):
+            st.session_state['export_job'] = get_job_runner().submit("bulk_export", {}, tenant=tenant_id)
+        if 'export_job' in st.session_state:
+            export_job = job_runner.get_job(st.session_state['export_job'])
+            # While active, job_progress polls and reruns the app once the export settles
+            if export_job and not show_job_status(export_job, "Exporting...") \
+                    and export_job["status"] == job_runner.STATUS_DONE:
+                result = export_job["result"]
+                with open(result["path"], "rb") as f:
+                    st.download_button(f"⬇️ Download ({result['students']} students, {result['with_plan']} plans)",
+                                       f, file_name=os.path.basename(result["path"]), mime="application/zip")
+
+# Each tab is an independently rerunnable fragment: a chat turn or a button in the
+# email tab only re-executes that tab, not the header, sidebar and other tabs.
+
+@st.fragment
+def render_master_plan_tab(ctx, available_files):
+    api_key = ctx["api_key"]
+    student_name = ctx["student_name"]
+    student_grade = ctx["student_grade"]
+    target_university = ctx["target_university"]
+    intended_major = ctx["intended_major"]
+    current_status = ctx["current_status"]
+
+    st.subheader(f"🚀 Master Plan for {student_name if student_name else 'Student'}")
+
+    selected_filenames = []
+    if available_files:
+        with st.expander("📂 Select Documents for Analysis (분석할 파일 선택)", expanded=True):
+             st.write("Check the files you want to use:")
+             for fname in available_files.keys():
+                 # Default to True (Checked)
+                 if st.checkbox(fname, value=True, key=f"mp_{fname}"):
+                     selected_filenames.append(fname)
+    else:
+         st.info("No documents available. Generating plan based on profile text only.")
+
+
+    if st.button("✨ Generate Master Plan", type="primary"):
+        if not student_name or not current_status:
+            st.error("Please enter student profile and summary first.")
+        else:
+            if not selected_filenames: 
+                 st.warning("No documents selected. Analyzing based on text only.")
+
+            # Runs in the background job runner so a rerun/refresh doesn't kill it
+            payload = {
+                "student_name": student_name,
+                "student_grade": student_grade,
+                "target_university": target_university,
+                "intended_major": intended_major,
+                "current_status": current_status,
+                "files": job_runner.stage_files(selected_filenames, available_files),
+                "model": MODEL_PRO,
+            }
+            get_job_runner().submit("master_plan", payload, student=student_name,
+                                    secrets={"GOOGLE_API_KEY": api_key}, tenant=ctx["tenant"])
+
+    # Latest Master Plan job for this student (read from the job table, so it survives refresh)
+    jobs = job_runner.list_jobs(kind="master_plan", student=student_name, limit=1, tenant=ctx["tenant"]) if student_name else []
+    if jobs:
+        job = jobs[0]
+        if not show_job_status(job, "🔄 데이터 분석 및 로드맵 생성 중... (Gemini 3 Pro)") \
+                and job["status"] == job_runner.STATUS_FAILED:
+            st.error("API Key 또는 모델 권한을 확인해주세요.")
+
+    # Latest saved plan (every generated plan is kept in student_plans/)
+    plan = student_store.latest_plan(student_name, ctx["tenant"]) if student_name else None
+    if plan:
+        st.caption(f"Generated {plan['created']}")
+        col_dl1, col_dl2, _ = st.columns([1, 1, 4])
+        with col_dl1:
+            st.download_button("⬇️ DOCX", plan_docx_bytes(plan["path"], plan["text"], f"{student_name} – Master Plan"),
+                               file_name=f"{student_name}_master_plan.docx",
+                               mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+        with col_dl2:
+            st.download_button("⬇️ Markdown", plan["text"], file_name=f"{student_name}_master_plan.md", mime="text/markdown")
+        st.markdown(plan["text"], unsafe_allow_html=True)
+
+
+@st.fragment
+def render_chat_tab(ctx, available_files_chat):
+    api_key = ctx["api_key"]
+    student_name = ctx["student_name"]
+    student_grade = ctx["student_grade"]
+    target_university = ctx["target_university"]
+    intended_major = ctx["intended_major"]
+    current_status = ctx["current_status"]
+
+    st.subheader(f"💬 US Admissions Chatbot for {student_name if student_name else 'Student'}")
+    st.caption("⚡ Powered by Gemini-3-Flash")
+
+    # Chat File Selection
+    selected_filenames_chat = []
+    if available_files_chat:
+         with st.expander("📂 Context Documents (대화에 참고할 파일 설정)", expanded=False):
+             st.write("Select files for chatbot context:")
+             for fname in available_files_chat.keys():
+                 if st.checkbox(fname, value=True, key=f"chat_{fname}"):
+                     selected_filenames_chat.append(fname)
+
+    # Chat History (chat_store: one append-only log per student and session)
+    tenant_id = ctx["tenant"]
+    chat_owner = student_name or GUEST_CHAT
+    sessions = chat_store.list_sessions(chat_owner, tenant_id)
+    session_key = f"chat_session_{tenant_id}_{chat_owner}"
+    if session_key not in st.session_state:
+        st.session_state[session_key] = sessions[0]["id"] if sessions else None # Resume the latest conversation
+
+    col_s1, col_s2 = st.columns([4, 1])
+    with col_s1:
+        labels = {s["id"]: chat_store.session_label(s) for s in sessions}
+        if sessions and st.session_state[session_key] in labels:
+            picked = st.selectbox("Conversation (대화 기록)", list(labels), format_func=labels.get,
+                                  index=list(labels).index(st.session_state[session_key]))
+            if picked != st.session_state[session_key]:
+                st.session_state[session_key] = picked
+                st.rerun(scope="fragment")
+    with col_s2:
+        if st.button("➕ New Chat", disabled=st.session_state[session_key] is None):
+            st.session_state[session_key] = None
+            st.rerun(scope="fragment")
+    session_id = st.session_state[session_key]
+
+    # Display Chat: the newest page first, older turns on demand
+    if session_id:
+        total = chat_store.turn_count(chat_owner, session_id, tenant_id)
+        first_key = f"chat_first_{session_id}"
+        first = st.session_state.get(first_key, max(0, total - chat_store.PAGE_SIZE))
+        if first > 0 and st.button(f"⬆️ Load older messages ({first} more)"):
+            first = max(0, first - chat_store.PAGE_SIZE)
+        st.session_state[first_key] = first
+        for message in chat_store.load_turns(chat_owner, session_id, first, total, tenant_id):
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+
+    # Chat Input
+    if prompt := st.chat_input("Ask about US Admissions (e.g., 'Does NYU require SAT?')"):
+        # Add user message
+        if session_id is None:
+            session_id = st.session_state[session_key] = chat_store.new_session(chat_owner, tenant_id)
+        chat_store.append_turn(chat_owner, session_id, "user", prompt, tenant_id)
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        # Generate response
+        with st.chat_message("assistant"):
+            message_placeholder = st.empty()
+            full_response = ""
+
+            try:
+                # System context + selected files + the most recent turns (not the whole log)
+                history_for_api = request_builder.build_chat_request(
+                    student_name, student_grade, target_university, intended_major, current_status,
+                    selected_filenames_chat, available_files_chat,
+                    chat_store.model_history(chat_owner, session_id, tenant_id))
+
+                with st.spinner("Thinking... (분석 중입니다)"):
+                    response = get_llm_client(api_key).generate(
+                        MODEL_FLASH, history_for_api,
+                        call_site="chatbot", tags={"student": student_name, "grade": student_grade})
+
+                full_response = response.text
+                message_placeholder.markdown(full_response)
+
+                chat_store.append_turn(chat_owner, session_id, "assistant", full_response, tenant_id)
+
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+
+@st.fragment
+def render_email_tab(api_key, tenant_id):
+    tenant = tenants.get_tenant(tenant_id)
+    st.subheader("📧 Automated Monthly Newsletter (General Monthly Master Plan)")
+    st.caption(f"Manage subscribers and send monthly guides. — {tenant.name}")
+
+    # 1. Subscriber Management
+    st.write("### 👥 Subscribers (구독자 관리)")
+
+    # Load Subscribers (this branch only)
+    subscribers = newsletter_utils.load_subscribers(tenant_id)
+
+    col_sub1, col_sub2 = st.columns([3, 1])
+    with col_sub1:
+        new_emails_input = st.text_area("Add Email Address(es)", placeholder="Paste list of emails here (one per line, or comma separated)", height=100)
+    with col_sub2:
+        st.write("")
+        st.write("")
+        if st.button("Add (+)", type="secondary"):
+            if new_emails_input:
+                # Parse inputs (split by newline or comma)
+                raw_list = new_emails_input.replace(',', '\n').split('\n')
+                valid_emails = []
+                for e in raw_list:
+                    e = e.strip()
+                    if "@" in e:
+                        valid_emails.append(e)
+
+                if valid_emails:
+                    added = newsletter_utils.save_subscribers(valid_emails, tenant_id)
+                    if added > 0:
+                        st.success(f"Successfully added {added} new subscribers!")
+                        time.sleep(1)
+                        st.rerun(scope="fragment")
+                    else:
+                        st.warning("All valid emails already exist.")
+                else:
+                    st.error("No valid emails found in input.")
+            else:
+                st.warning("Please enter emails.")
+
+    if subscribers:
+        st.dataframe({"Subscribers": subscribers}, hide_index=True)
+
+        # Remove Option (Bulk)
+        emails_to_remove = st.multiselect("Select Subscribers to Remove", subscribers)
+
+        col_rem1, col_rem2 = st.columns([1, 1])
+        with col_rem1:
+            if st.button("🗑️ Remove Selected"):
+                if emails_to_remove:
+                    newsletter_utils.remove_subscribers(emails_to_remove, tenant_id)
+                    st.success(f"Removed {len(emails_to_remove)} subscribers.")
+                    time.sleep(1)
+                    st.rerun(scope="fragment")
+                else:
+                    st.warning("Select valid emails to remove.")
+
+        with col_rem2:
+            if st.button("⚠️ Remove ALL Subscribers", type="primary"):
+                newsletter_utils.remove_subscribers(subscribers, tenant_id)
+                st.success("All subscribers removed.")
+                time.sleep(1)
+                st.rerun(scope="fragment")
+
+    else:
+        st.info("No subscribers yet. Add one above!")
+
+    st.divider()
+
+    # 2. Email Configuration
+    st.write("### ⚙️ Sender Configuration (발신자 설정)")
+    st.info("Gmail 'App Password' is required for automation.")
+
+    col_conf1, col_conf2 = st.columns(2)
+    with col_conf1:
+        # We don't save this to file for security in this simple demo, 
+        # we rely on .env or session state. 
+        # Ideally, user sets this in .env manually.
+        current_sender, current_password = tenant.sender_credentials()
+        st.text_input(f"Sender Email (From .env: {tenant.sender_email_env})", value=current_sender or "", disabled=True)
+
+    with col_conf2:
+         is_password_set = bool(current_password)
+         st.text_input("App Password Status", value="✅ Set in .env" if is_password_set else "❌ Not Set", disabled=True)
+
+    st.divider()
+
+    # 3. Preview & Test
+    st.write("### 📢 Content Preview & Test (미리보기 및 발송)")
+
+    preview_grade = st.selectbox("Select Grade for Preview", plan_template.load_template()["grades"])
+
+    if st.button("👁️ Generate Preview for This Month"):
+        current_month = datetime.now().strftime("%B")
+        with st.spinner(f"Generating optimized plan for {preview_grade} ({current_month})..."):
+            preview_content = newsletter_utils.generate_monthly_plan(api_key, preview_grade, current_month)
+            st.markdown(preview_content)
+            st.session_state['last_preview'] = preview_content
+
+    st.write("")
+    st.write("---")
+    st.subheader("🚀 Bulk Email Sender (대량 발송)")
+
+    # Step 1: Generate Draft (background job)
+    if st.button("📝 STAGE 1: Generate Draft for Review (내용 생성 및 확인)"):
+        current_month = datetime.now().strftime("%B")
+        st.session_state['draft_job'] = get_job_runner().submit(
+            "newsletter_draft", {"month": current_month}, secrets={"GOOGLE_API_KEY": api_key}, tenant=tenant_id)
+
+    # Pick up a draft job started before a refresh
+    if 'draft_job' not in st.session_state and 'newsletter_draft' not in st.session_state:
+        recent = job_runner.list_jobs(kind="newsletter_draft", limit=1, tenant=tenant_id)
+        if recent and recent[0]["status"] in job_runner.ACTIVE_STATUSES:
+            st.session_state['draft_job'] = recent[0]["id"]
+        elif recent and recent[0]["status"] == job_runner.STATUS_DONE and recent[0]["result"].get("draft"):
+            finished = datetime.fromtimestamp(recent[0]["finished_at"]).strftime("%Y-%m-%d %H:%M")
+            if st.button(f"📥 Load Last Generated Draft ({finished})"):
+                load_newsletter_draft(recent[0]["result"]["draft"])
+                st.rerun(scope="fragment")
+
+    if 'draft_job' in st.session_state:
+        draft_job = job_runner.get_job(st.session_state['draft_job'])
+        # While active, job_progress polls and reruns the app once the job settles
+        if not (draft_job and show_job_status(draft_job, "Generating content for all grades... (This may take ~30 seconds)")):
+            del st.session_state['draft_job']
+        if draft_job and draft_job["status"] == job_runner.STATUS_DONE:
+            # Store in session state
+            load_newsletter_draft(draft_job["result"]["draft"])
+            if draft_job["result"]["ready"]:
+                st.success("Draft Generated! Please review below.")
+            else:
+                st.warning("Some grades failed. Regenerate them below – the others are kept.")
+
+    # Step 2: Review & Send
+    if 'newsletter_draft' in st.session_state:
+        draft = st.session_state['newsletter_draft']
+        st.write("### 📝 Review & Edit Draft (내용 확인 및 수정)")
+        st.info("학년별 내용을 확인하고 필요하면 직접 수정하세요. 수정된 내용 그대로 발송됩니다.")
+
+        # One editable section per grade; a hand edit marks the section as reviewed (ok)
+        for section in draft["sections"]:
+            grade = section["grade"]
+            icon = SECTION_ICONS.get(section["status"], "⏳")
+            with st.expander(f"{icon} {grade} – {section['status']}", expanded=section["status"] != newsletter_utils.SECTION_OK):
+                if section["error"]:
+                    st.error(section["error"])
+                for key, problem in section["problems"].items():
+                    st.warning(f"{plan_template.part_label(key)}: {problem}")
+                edited = st.text_area("Content", value=section["content"], height=300, key=f"draft_section_{grade}")
+                if edited != section["content"]:
+                    newsletter_utils.edit_section(draft, grade, edited)
+                    st.rerun(scope="fragment")
+
+        grades = [s["grade"] for s in draft["sections"]]
+        regen = st.multiselect("Sections to regenerate (재생성할 학년)", grades,
+                               default=newsletter_utils.pending_sections(draft))
+        if st.button("🔄 Regenerate Selected (선택 학년만 재생성)", disabled=not regen):
+            st.session_state['draft_job'] = get_job_runner().submit(
+                "newsletter_draft", {"month": draft["month"], "draft": draft, "grades": regen},
+                secrets={"GOOGLE_API_KEY": api_key}, tenant=tenant_id)
+            st.rerun(scope="fragment")
+
+        ready = newsletter_utils.draft_ready(draft)
+        if not ready:
+            st.warning(f"Sending is disabled until every grade is ok ({newsletter_utils.draft_summary(draft)})")
+        else:
+            st.download_button("⬇️ Download as Guide DOCX",
+                               newsletter_docx(newsletter_utils.draft_body(draft, tenant_id), draft["month"], tenant_id),
+                               file_name=f"Elite Prep Master Plan Guide - {draft['month']}.docx",
+                               mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+
+        col_send1, col_send2 = st.columns([1, 1])
+        with col_send1:
+            if st.button("🚀 STAGE 2: Send to ALL Subscribers (최종 발송)", type="primary", disabled=not ready):
+                # Force reload env to get latest credentials (absolute path)
+                env_path = os.path.join(os.path.dirname(__file__), '.env')
+                load_dotenv(dotenv_path=env_path, override=True)
+                sender, pwd = tenant.sender_credentials()
+
+                if not sender or not pwd:
+                    st.error(f"Please set {tenant.sender_email_env} and {tenant.sender_password_env} in .env file first.")
+
+                elif not subscribers:
+                    st.error("No subscribers to send to.")
+                else:
+                    st.session_state['send_job'] = get_job_runner().submit("newsletter_send", {
+                        "recipients": subscribers,
+                        "subject": newsletter_utils.newsletter_subject(draft["month"]),
+                        "body": newsletter_utils.draft_body(draft, tenant_id), # Includes any hand edits
+                    }, secrets={"SENDER_EMAIL": sender, "SENDER_PASSWORD": pwd}, tenant=tenant_id)
+
+        with col_send2:
+             if st.button("🗑️ Discard Draft (초안 삭제)"):
+                del st.session_state['newsletter_draft']
+                st.rerun(scope="fragment")
+
+    # Sending progress (background job)
+    if 'send_job' in st.session_state:
+        send_job = job_runner.get_job(st.session_state['send_job'])
+        # While active, job_progress polls and reruns the app once the job settles
+        if not (send_job and show_job_status(send_job, "Sending Emails...")):
+            del st.session_state['send_job']
+        if send_job and send_job["status"] == job_runner.STATUS_DONE:
+            st.success("✅ Newsletter Sent Successfully!")
+            st.success(send_job["result"]["message"])
+            if send_job["result"].get("metrics"):
+                st.caption(f"📈 {newsletter_utils.format_send_metrics(send_job['result']['metrics'])}")
+            # Clear draft after successful send
+            st.session_state.pop('newsletter_draft', None)
+
+    # 4. Delivery Metrics (from newsletter_utils.send_email)
+    send_history = newsletter_utils.load_send_history(tenant=tenant_id)
+    if send_history:
+        with st.expander("📈 Delivery Metrics (발송 성능)"):
+            last = send_history[-1]
+            col_d1, col_d2, col_d3, col_d4 = st.columns(4)
+            col_d1.metric("Recipients/sec", last["recipients_per_sec"])
+            col_d2.metric("Sent", f"{last['sent']}/{last['recipients_total']}")
+            col_d3.metric("Retries", last["retries"])
+            col_d4.metric("Total Time", f"{last['total_s']}s")
+            st.write("Phase Breakdown (seconds):")
+            st.json(last["phases_s"])
+            if last["error_classes"]:
+                st.write("Errors:", last["error_classes"])
+            st.dataframe([
+                {k: v for k, v in m.items() if k not in ("phases_s", "error_classes")} for m in reversed(send_history)
+            ], hide_index=True)
+
+
+@st.fragment
+def render_usage_tab():
+    st.subheader("📈 Usage & Latency")
+    st.caption("Per-feature latency (p50/p95) and token spend for every Gemini call.")
+
+    window = st.selectbox("Time Window", ["Last 24 hours", "Last 7 days", "Last 30 days", "All time"], index=1)
+    window_seconds = {"Last 24 hours": 86400, "Last 7 days": 7 * 86400, "Last 30 days": 30 * 86400}.get(window)
+    since = time.time() - window_seconds if window_seconds else None
+
+    by_feature = llm_metrics.summarize(since=since, group_by=("call_site", "model"))
+    if by_feature:
+        col_m1, col_m2, col_m3 = st.columns(3)
+        col_m1.metric("Calls", sum(r["calls"] for r in by_feature))
+        col_m2.metric("Prompt Tokens", f"{sum(r['prompt_tokens'] for r in by_feature):,}")
+        col_m3.metric("Output Tokens", f"{sum(r['output_tokens'] for r in by_feature):,}")
+        st.dataframe(by_feature, hide_index=True)
+
+        with st.expander("By Student / Grade"):
+            st.dataframe(llm_metrics.summarize(since=since, group_by=("call_site", "student", "grade")), hide_index=True)
+        with st.expander("Prometheus Export"):
+            st.code(llm_metrics.export_prometheus(since=since), language="text")
+    else:
+        st.info("No model calls recorded yet.")
+
+
 # --- Main App Logic ---
 
 def main():
@@ -216,11 +690,22 @@ def main():
         else:
             st.success("✅ 시스템 연결됨")
 
+        # Branch (tenant) - every list, file and cache below is scoped to it
+        branches = tenants.list_tenants()
+        tenant_id = branches[0].id
+        if len(branches) > 1:
+            branch_ids = [t.id for t in branches]
+            requested = st.query_params.get("branch")
+            tenant_id = st.selectbox("🏢 Branch (지점)", branch_ids,
+                                     index=branch_ids.index(requested) if requested in branch_ids else 0,
+                                     format_func=lambda tid: tenants.get_tenant(tid).name)
+            st.query_params["branch"] = tenant_id
+
         st.divider()
         st.subheader("📁 Student Profile (학생 프로필)")
         
-        # Load Data
-        saved_data = load_data()
+        # Load Data (cached snapshot, refreshed when the file changes)
+        saved_data = load_profiles(tenant_id)
         student_list = list(saved_data.keys())
         
         # Select Student to Edit/View
@@ -271,16 +756,22 @@ def main():
         if st.button("💾 Save Profile (Includes Files)"):
             if student_name:
                 # Save & Merge Files
-                data = load_data() # Load latest data
+                data = load_data(tenant_id) # Load latest data
                 existing_files = []
                 
                 # Check if we are updating an existing student (by name match)
                 if student_name in data:
+                     # Drop references to files that no longer exist (this student only)
+                     storage_maintenance.reconcile_student(data, student_name, tenant_id)
                      existing_files = data[student_name].get("files", [])
                 
                 new_files = []
                 if uploaded_files:
-                    new_files = save_uploaded_files(student_name, uploaded_files)
+                    try:
+                        new_files = save_uploaded_files(student_name, uploaded_files, tenant_id)
+                    except student_store.QuotaExceeded as e:
+                        st.error(f"⚠️ {e}")
+                        new_files = e.saved # Keep whatever fit within the limit
                 
                 # Combine and remove duplicates while preserving order
                 saved_paths = list(dict.fromkeys(existing_files + new_files))
@@ -289,508 +780,55 @@ def main():
                     "target": target_university,
                     "major": intended_major,
                     "status": current_status,
+                    "profile": profile_parser.parse_profile(current_status, api_key), # Structured GPA/SAT/ACT/AP/ECs
                     "files": saved_paths,
                     "last_updated": str(datetime.now())
                 }
-                save_data(data)
+                save_data(data, tenant_id)
                 st.success(f"Saved profile & {len(saved_paths)} files for '{student_name}'!")
             else:
                 st.error("Please enter specific student name.")
         
+        # Roster Analytics (uses parsed profile fields)
+        if saved_data:
+            render_roster_analytics(saved_data, grade_options, tenant_id)
+
         # Delete Profile Option - REMOVED as per user request (Manual deletion only)
         # if selected_student_key != "Create New (신규)":
         #    ... (Code removed for safety)
 
     # Main Area Tabs
-    tab1, tab2, tab3 = st.tabs(["📊 US Master Plan Generator", "💬 US Admissions Chatbot", "📧 Monthly Automated Email System"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 US Master Plan Generator", "💬 US Admissions Chatbot", "📧 Monthly Automated Email System", "📈 Usage & Latency"])
+
+    # Documents shared by the Master Plan and Chatbot tabs (scanned once per run)
+    ctx = {
+        "api_key": api_key,
+        "tenant": tenant_id,
+        "student_name": student_name,
+        "student_grade": student_grade,
+        "target_university": target_university,
+        "intended_major": intended_major,
+        "current_status": current_status,
+    }
+    available_files = available_files_for(student_name, selected_student_key, saved_data, uploaded_files)
 
     # --- Tab 1: Master Plan Generator (Gemini 3 Pro) ---
     with tab1:
-        st.subheader(f"🚀 Master Plan for {student_name if student_name else 'Student'}")
-        
-        # Prepare Analysis Files (Consolidated)
-        available_files = {}
-        # 1. Saved Files
-        if selected_student_key == student_name:
-             for f_path in saved_data.get(student_name, {}).get("files", []):
-                  available_files[f"[Saved] {os.path.basename(f_path)}"] = f_path
-        # 2. Uploaded Files
-        if uploaded_files:
-             for f in uploaded_files:
-                  available_files[f"[New] {f.name}"] = f
-        
-        selected_filenames = []
-        if available_files:
-            with st.expander("📂 Select Documents for Analysis (분석할 파일 선택)", expanded=True):
-                 st.write("Check the files you want to use:")
-                 for fname in available_files.keys():
-                     # Default to True (Checked)
-                     if st.checkbox(fname, value=True, key=f"mp_{fname}"):
-                         selected_filenames.append(fname)
-        else:
-             st.info("No documents available. Generating plan based on profile text only.")
-
-        
-        if st.button("✨ Generate Master Plan", type="primary"):
-            if not student_name or not current_status:
-                st.error("Please enter student profile and summary first.")
-            else:
-                with st.spinner("🔄 데이터 분석 및 로드맵 생성 중... (Gemini 3 Pro)"):
-                    try:
-                        # Prepare prompt
-                        system_prompt = f"""
-                        You are an expert US College Admissions Consultant (Elite Level).
-                        You strictly follow the 2026 US Common App & University specific trends.
-                        
-                        [Student Profile]
-                        - Name: {student_name}
-                        - Grade: {student_grade}
-                        - Target Colleges: {target_university}
-                        - Intended Major: {intended_major}
-                        - Profile Summary: {current_status}
-                        
-                        [Request]
-                        Create a highly detailed 'US College Admissions Master Plan' in Korean.
-                        
-                        1. **Holistic Review Strategy**: Analyze GPA (Weighted/Unweighted), Rigor (AP/IB), Standardized Tests (SAT/ACT), and Extracurriculars. Identify the student's "Spike" or "Theme".
-                        2. **Timeline & Monthly Action Plan**: Provide a month-by-month checklist up to graduation. Include specific times for SAT/ACT attempts, Summer Programs (RSI, TASP, etc.), Internship hunting, and Essay brainstorming.
-                        3. **College List Strategy**: Suggest a balanced list (Reach, Match, Safety) if targets are unrealistic, or refine strategies for the targets.
-                        4. **Application Strategy**: Early Decision (ED) vs Early Action (EA) vs Regular Decision (RD) recommendations.
-                        
-                        Output in clean Markdown (Korean). Use a Table for the Monthly Action Plan.
-                        """
-                        
-                        # Handle Files - Logic to handle file content or upload to Gemini
-                        content_parts = [system_prompt]
-                        
-                        # Handle Files - Logic to handle file content or upload to Gemini
-                        content_parts = [system_prompt]
-                        
-                        files_to_process = []
-                        
-                        # File Selection Logic
-                        files_to_process = []
-                        
-                        # Process selected files
-                        if selected_filenames:
-                            for fname in selected_filenames:
-                                file_source = available_files[fname]
-                                
-                                # Case A: UploadedFile object
-                                if hasattr(file_source, "type"): 
-                                    file = file_source
-                                    if file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" or file.name.endswith(".docx"):
-                                        extracted_text = extract_text_from_docx(file)
-                                        if extracted_text:
-                                            content_parts.append(f"\\n[Attached Document Content: {file.name}]\\n{extracted_text}\\n")
-                                    else:
-                                        files_to_process.append({
-                                            "name": file.name,
-                                            "mime_type": file.type,
-                                            "data": file.getvalue()
-                                        })
-                                # Case B: File Path (Saved file)
-                                else:
-                                    file_path = file_source
-                                    if os.path.exists(file_path):
-                                        ext = os.path.splitext(file_path)[1].lower()
-                                        mime_type = "application/pdf"
-                                        
-                                        if ext == ".docx":
-                                            with open(file_path, "rb") as f:
-                                                extracted_text = extract_text_from_docx(f)
-                                                if extracted_text:
-                                                     content_parts.append(f"\\n[Attached Document Content: {os.path.basename(file_path)}]\\n{extracted_text}\\n")
-                                            continue 
-                                        
-                                        if ext == ".pdf": mime_type = "application/pdf"
-                                        elif ext in [".jpg", ".jpeg"]: mime_type = "image/jpeg"
-                                        elif ext == ".png": mime_type = "image/png"
-                                        elif ext == ".doc": mime_type = "application/msword"
-                                        elif ext == ".xlsx": mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                        elif ext == ".xls": mime_type = "application/vnd.ms-excel"
-                                        elif ext == ".csv": mime_type = "text/csv"
-                                        elif ext == ".txt": mime_type = "text/plain"
-                                        
-                                        try:
-                                            with open(file_path, "rb") as f:
-                                                files_to_process.append({
-                                                    "name": os.path.basename(file_path),
-                                                    "mime_type": mime_type,
-                                                    "data": f.read()
-                                                })
-                                        except Exception as e:
-                                            print(f"Error reading file {file_path}: {e}")
-
-                        if files_to_process:
-                            for f_obj in files_to_process:
-                                content_parts.append({
-                                    "mime_type": f_obj["mime_type"],
-                                    "data": f_obj["data"]
-                                })
-                        elif not selected_filenames: 
-                             st.warning("No documents selected. Analyzing based on text only.")
-
-                        model = genai.GenerativeModel(MODEL_PRO) # Using requested 3-pro
-                        # Note: In a real scenario with "gemini-3-pro" available, we'd swap the string.
-                        # I will use a variable to mimic the intent.
-                        
-                        # Real code implementation note: 
-                        # If 'gemini-3-pro' does not exist yet, this will fail. 
-                        # I will code it to use "gemini-1.5-pro" but label it as requested in UI.
-                        # OR if the user purely wants the code structure, I can use "gemini-3-pro" string.
-                        # I'll use "gemini-1.5-pro" to ensure runnable code, but comment about v3.
-                        
-                        # model = genai.GenerativeModel('gemini-1.5-pro') 
-                        
-                        response = model.generate_content(content_parts)
-                        
-                        # Clean up common hallucinated tags if necessary, but enabling HTML usually fixes standard <br>
-                        # Replacing <br-> just in case it's a model artifact
-                        cleaned_text = response.text.replace("<br->", "<br>- ")
-                        
-                        st.markdown(cleaned_text, unsafe_allow_html=True)
-                        
-                        # Save result locally for record
-                        # (Optional implementation detail)
-                        
-                    except Exception as e:
-                        st.error(f"에러 발생: {e}")
-                        st.error("API Key 또는 모델 권한을 확인해주세요.")
+        render_master_plan_tab(ctx, available_files)
 
     # --- Tab 2: Consulting Chatbot (Gemini 3 Flash) ---
     with tab2:
-        st.subheader(f"💬 US Admissions Chatbot for {student_name if student_name else 'Student'}")
-        st.caption("⚡ Powered by Gemini-3-Flash")
-        
-        # Chat File Selection
-        available_files_chat = {}
-        if selected_student_key == student_name:
-             for f_path in saved_data.get(student_name, {}).get("files", []):
-                  available_files_chat[f"[Saved] {os.path.basename(f_path)}"] = f_path
-        if uploaded_files:
-             for f in uploaded_files:
-                  available_files_chat[f"[New] {f.name}"] = f
-        
-        selected_filenames_chat = []
-        if available_files_chat:
-             with st.expander("📂 Context Documents (대화에 참고할 파일 설정)", expanded=False):
-                 st.write("Select files for chatbot context:")
-                 for fname in available_files_chat.keys():
-                     if st.checkbox(fname, value=True, key=f"chat_{fname}"):
-                         selected_filenames_chat.append(fname)
-        
-        # Chat History
-        if "messages" not in st.session_state:
-            st.session_state.messages = []
+        render_chat_tab(ctx, available_files)
 
-        # Display Chat
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-
-        # Chat Input
-        if prompt := st.chat_input("Ask about US Admissions (e.g., 'Does NYU require SAT?')"):
-            # Add user message
-            st.session_state.messages.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.markdown(prompt)
-
-            # Generate response
-            with st.chat_message("assistant"):
-                message_placeholder = st.empty()
-                full_response = ""
-                
-                try:
-                    # Retrieve files for context
-                    chat_context_parts = []
-                    
-                    # System Prompt Text
-                    system_text = f"""
-                    You are a knowledgeable US College Admissions Chatbot.
-                    Student Info: {student_name}, {student_grade}, Target: {target_university}, Major: {intended_major}.
-                    
-                    [Attached Documents]
-                    The user has provided the following files (Transcripts, Essays, etc.). 
-                    Use the information in these files to answer specific questions (e.g., "What is my GPA?", "Critique my essay").
-                    
-                    Answer questions about Common App, Essays, SAT/ACT, Financial Aid, and specific university culture.
-                    Be concise and encouraging. 
-                    IMPORTANT: Always answer in Korean (한국어).
-                    """
-                    chat_context_parts.append(system_text)
-
-                    # Add Saved Files to Context
-                    if selected_filenames_chat:
-                        for fname in selected_filenames_chat:
-                             file_source = available_files_chat[fname]
-                             
-                             # Case A: UploadedFile object
-                             if hasattr(file_source, "type"):
-                                 file = file_source
-                                 if file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document" or file.name.endswith(".docx"):
-                                     extracted_text = extract_text_from_docx(file)
-                                     if extracted_text:
-                                         chat_context_parts.append(f"\\n[Attached Document Content: {file.name}]\\n{extracted_text}\\n")
-                                 else:
-                                     chat_context_parts.append({
-                                         "mime_type": file.type,
-                                         "data": file.getvalue()
-                                     })
-
-                             # Case B: File Path (Saved file)
-                             else:
-                                 file_path = file_source
-                                 if os.path.exists(file_path):
-                                     ext = os.path.splitext(file_path)[1].lower()
-                                     mime_type = "application/pdf"
-                                     if ext == ".docx":
-                                         try:
-                                             with open(file_path, "rb") as f:
-                                                 extracted_text = extract_text_from_docx(f)
-                                                 if extracted_text:
-                                                     chat_context_parts.append(f"\\n[Attached Document Content: {os.path.basename(file_path)}]\\n{extracted_text}\\n")
-                                         except Exception as e:
-                                             print(f"Error reading docx {file_path}: {e}")
-                                         continue 
-
-                                     if ext == ".pdf": mime_type = "application/pdf"
-                                     elif ext in [".jpg", ".jpeg"]: mime_type = "image/jpeg"
-                                     elif ext == ".png": mime_type = "image/png"
-                                     elif ext == ".doc": mime_type = "application/msword"
-                                     elif ext == ".xlsx": mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                     elif ext == ".xls": mime_type = "application/vnd.ms-excel"
-                                     elif ext == ".csv": mime_type = "text/csv"
-                                     elif ext == ".txt": mime_type = "text/plain"
-                                     
-                                     try:
-                                         with open(file_path, "rb") as f:
-                                             chat_context_parts.append({
-                                                "mime_type": mime_type,
-                                                "data": f.read()
-                                             })
-                                     except Exception as e:
-                                         print(f"Error reading file {file_path}: {e}")
-
-                    # Use Flash model
-                    model_flash = genai.GenerativeModel(MODEL_FLASH) # Logic for 3-flash
-                    
-                    # Construct history for API (System Context + User Turn)
-                    # Note: We inject the files into the very first turn to serve as "Context"
-                    history_for_api = [
-                        {"role": "user", "parts": chat_context_parts}
-                    ]
-                    
-                    # Add Model acknowledgment to simulate a history where model knows context
-                    history_for_api.append({"role": "model", "parts": ["네, 학생의 자료와 정보를 숙지했습니다. 무엇이든 물어보세요!"]})
-                    
-                    # Append actual conversation history
-                    for m in st.session_state.messages:
-                        role = "user" if m["role"] == "user" else "model"
-                        history_for_api.append({"role": role, "parts": [m["content"]]})
-                    
-                    with st.spinner("Thinking... (분석 중입니다)"):
-                        response = model_flash.generate_content(history_for_api)
-                    
-                    full_response = response.text
-                    message_placeholder.markdown(full_response)
-                    
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
-                    
-                except Exception as e:
-                    st.error(f"Error: {e}")
+    # --- Tab 3: Monthly Automated Email System ---
     with tab3:
-        st.subheader("📧 Automated Monthly Newsletter (General Monthly Master Plan)")
-        st.caption("Manage subscribers and send monthly guides.")
-        
-        # 1. Subscriber Management
-        st.write("### 👥 Subscribers (구독자 관리)")
-        
-        # Load Subscribers
-        import newsletter_utils
-        subscribers = newsletter_utils.load_subscribers()
-        
-        col_sub1, col_sub2 = st.columns([3, 1])
-        with col_sub1:
-            new_emails_input = st.text_area("Add Email Address(es)", placeholder="Paste list of emails here (one per line, or comma separated)", height=100)
-        with col_sub2:
-            st.write("")
-            st.write("")
-            if st.button("Add (+)", type="secondary"):
-                if new_emails_input:
-                    # Parse inputs (split by newline or comma)
-                    raw_list = new_emails_input.replace(',', '\n').split('\n')
-                    valid_emails = []
-                    for e in raw_list:
-                        e = e.strip()
-                        if "@" in e:
-                            valid_emails.append(e)
-                    
-                    if valid_emails:
-                        added = newsletter_utils.save_subscribers(valid_emails)
-                        if added > 0:
-                            st.success(f"Successfully added {added} new subscribers!")
-                            time.sleep(1)
-                            st.rerun()
-                        else:
-                            st.warning("All valid emails already exist.")
-                    else:
-                        st.error("No valid emails found in input.")
-                else:
-                    st.warning("Please enter emails.")
-        
-        if subscribers:
-            st.dataframe(pd.DataFrame({"Subscribers": subscribers}), hide_index=True)
-            
-            # Remove Option (Bulk)
-            emails_to_remove = st.multiselect("Select Subscribers to Remove", subscribers)
-            
-            col_rem1, col_rem2 = st.columns([1, 1])
-            with col_rem1:
-                if st.button("🗑️ Remove Selected"):
-                    if emails_to_remove:
-                        newsletter_utils.remove_subscribers(emails_to_remove)
-                        st.success(f"Removed {len(emails_to_remove)} subscribers.")
-                        time.sleep(1)
-                        st.rerun()
-                    else:
-                        st.warning("Select valid emails to remove.")
-            
-            with col_rem2:
-                if st.button("⚠️ Remove ALL Subscribers", type="primary"):
-                    newsletter_utils.remove_subscribers(subscribers)
-                    st.success("All subscribers removed.")
-                    time.sleep(1)
-                    st.rerun()
+        render_email_tab(api_key, tenant_id)
 
-        else:
-            st.info("No subscribers yet. Add one above!")
-            
-        st.divider()
-        
-        # 2. Email Configuration
-        st.write("### ⚙️ Sender Configuration (발신자 설정)")
-        st.info("Gmail 'App Password' is required for automation.")
-        
-        col_conf1, col_conf2 = st.columns(2)
-        with col_conf1:
-            # We don't save this to file for security in this simple demo, 
-            # we rely on .env or session state. 
-            # Ideally, user sets this in .env manually.
-            current_sender = os.getenv("SENDER_EMAIL", "")
-            st.text_input("Sender Email (From .env)", value=current_sender, disabled=True)
-        
-        with col_conf2:
-             is_password_set = bool(os.getenv("SENDER_PASSWORD"))
-             st.text_input("App Password Status", value="✅ Set in .env" if is_password_set else "❌ Not Set", disabled=True)
-        
-        st.divider()
-        
-        # 3. Preview & Test
-        st.write("### 📢 Content Preview & Test (미리보기 및 발송)")
-        
-        preview_grade = st.selectbox("Select Grade for Preview", ["9th Grade", "10th Grade", "11th Grade", "12th Grade"])
-        
-        if st.button("👁️ Generate Preview for This Month"):
-            current_month = datetime.now().strftime("%B")
-            with st.spinner(f"Generating optimized plan for {preview_grade} ({current_month})..."):
-                preview_content = newsletter_utils.generate_monthly_plan(api_key, preview_grade, current_month)
-                st.markdown(preview_content)
-                st.session_state['last_preview'] = preview_content
-        
-        st.write("")
-        st.write("---")
-        st.subheader("🚀 Bulk Email Sender (대량 발송)")
-        
-        # Step 1: Generate Draft
-        if st.button("📝 STAGE 1: Generate Draft for Review (내용 생성 및 확인)"):
-            with st.spinner("Generating content for all grades... (This may take ~30 seconds)"):
-                try:
-                    # Current logic to generate content
-                    current_month = datetime.now().strftime("%B")
-                    full_body = f"# Elite Prep – {current_month} Academic Master Plan\n\n"
-                    
-                    grades = ["9th Grade", "10th Grade", "11th Grade", "12th Grade"]
-                    progress_bar = st.progress(0)
-                    
-                    for i, grade in enumerate(grades):
-                        content = newsletter_utils.generate_monthly_plan(api_key, grade, current_month)
-                        full_body += f"## 📌 {grade}\n{content}\n\n---\n\n"
-                        progress_bar.progress((i + 1) / len(grades))
-                    
-                    # Append Footer Signature
-                    full_body += """
-Sent by Elite Prep Master Plan & Academic Consulting
-
-Andy Lee  | Branch Director <br>
-Elite Prep Suwanee powered by Elite Open School <br>
-1291 Old Peachtree Rd. NW #127, Suwanee, GA 30024 <br>
-Tel & Text: 470.253.1004
-"""
-                    
-                    # Store in session state
-                    st.session_state['draft_email_content'] = full_body
-                    st.session_state['draft_month'] = current_month
-                    st.success("Draft Generated! Please review below.")
-                    st.rerun()
-                    
-                except Exception as e:
-                    st.error(f"Error generating draft: {e}")
-
-        # Step 2: Review & Send
-        if 'draft_email_content' in st.session_state:
-            st.write("### 📝 Review & Edit Draft (내용 확인 및 수정)")
-            st.info("아래 내용을 확인하고 필요하면 직접 수정하세요. 수정된 내용 그대로 발송됩니다.")
-            
-            # Editable Text Area
-            edited_body = st.text_area("Email Content", value=st.session_state['draft_email_content'], height=400)
-            
-            # Update session state if edited
-            if edited_body != st.session_state['draft_email_content']:
-                st.session_state['draft_email_content'] = edited_body
-
-            col_send1, col_send2 = st.columns([1, 1])
-            with col_send1:
-                if st.button("🚀 STAGE 2: Send to ALL Subscribers (최종 발송)", type="primary"):
-                    # Force reload env to get latest credentials (absolute path)
-                    env_path = os.path.join(os.path.dirname(__file__), '.env')
-                    load_dotenv(dotenv_path=env_path, override=True)
-                    sender = os.getenv("SENDER_EMAIL")
-                    pwd = os.getenv("SENDER_PASSWORD")
-                    
-                    if not sender or not pwd:
-                        st.error("Please set SENDER_EMAIL and SENDER_PASSWORD in .env file first.")
-
-                    elif not subscribers:
-                        st.error("No subscribers to send to.")
-                    else:
-                        with st.status("Sending Emails...", expanded=True) as status:
-                            current_month = st.session_state.get('draft_month', datetime.now().strftime("%B"))
-                            
-                            success, msg = newsletter_utils.send_email(
-                                sender, 
-                                pwd, 
-                                subscribers, 
-                                f"[{current_month}] Monthly Academic Master Plan", 
-                                st.session_state['draft_email_content'] # Use the (potentially edited) content
-                            )
-                            
-                            if success:
-                                status.update(label="✅ Newsletter Sent Successfully!", state="complete", expanded=False)
-                                st.success(msg)
-                                # Clear draft after successful send
-                                del st.session_state['draft_email_content']
-                                time.sleep(2)
-                                st.rerun()
-                            else:
-                                status.update(label="❌ Failed", state="error")
-                                st.error(msg)
-            
-            with col_send2:
-                 if st.button("🗑️ Discard Draft (초안 삭제)"):
-                    del st.session_state['draft_email_content']
-                    st.rerun()
+    # --- Tab 4: Usage & Latency (LLM call metrics) ---
+    with tab4:
+        render_usage_tab()
 
 if __name__ == "__main__":
+    llm_metrics.serve_prometheus() # No-op unless LLM_METRICS_PROM_PORT is set
     main()
 
@@ -1,30 +1,44 @@
 import os
-import time
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 import newsletter_utils
+import scheduler
+import tenants
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'), override=True)
 
-def main():
+def main(month=None, tenant_id=None):
+    tenant = tenants.get_tenant(tenant_id)
+    # Same lock as the scheduler daemon's sends, so an overlapping cron run can't double-send
+    send_lock = tenant.path(scheduler.SEND_LOCK)
+    if not scheduler.acquire_lock(send_lock):
+        print("🔒 Another newsletter run is in progress. Exiting.")
+        return
+    try:
+        return send_newsletter(month, tenant)
+    finally:
+        scheduler.release_lock(send_lock)
+
+def send_newsletter(month=None, tenant=None):
+    tenant = tenants.get_tenant(tenant)
     print("--- 📧 Automated Newsletter Sender Started ---")
-    print(f"Time: {datetime.now()}")
+    print(f"Time: {datetime.now()}  Branch: {tenant.name}")
     
     # 1. Configuration Check
     api_key = os.getenv("GOOGLE_API_KEY")
-    sender_email = os.getenv("SENDER_EMAIL")
-    sender_password = os.getenv("SENDER_PASSWORD")
+    sender_email, sender_password = tenant.sender_credentials()
     
     if not api_key:
         print("❌ Error: GOOGLE_API_KEY is missing.")
         return
     if not sender_email or not sender_password:
-        print("❌ Error: Email credentials (SENDER_EMAIL, SENDER_PASSWORD) are missing.")
+        print(f"❌ Error: Email credentials ({tenant.sender_email_env}, {tenant.sender_password_env}) are missing.")
         return
 
     # 2. Load Subscribers
-    subscribers = newsletter_utils.load_subscribers()
+    subscribers = newsletter_utils.load_subscribers(tenant.id)
     if not subscribers:
         print("⚠️ No subscribers found. Exiting.")
         return
@@ -32,54 +46,65 @@ def main():
     print(f"✅ Found {len(subscribers)} subscribers: {subscribers}")
     
     # 3. Generate Content
-    current_month = datetime.now().strftime("%B") # e.g., "January"
+    current_month = month or datetime.now().strftime("%B") # e.g., "January"
     print(f"📊 Generating content for: {current_month}")
     
-    # Updated Header to match app.py
-    full_markdown_body = f"# Elite Prep – {current_month} Academic Master Plan\n\n"
-    
-    grades = ["9th Grade", "10th Grade", "11th Grade", "12th Grade"]
-    
-    for grade in grades:
-        print(f"   > Generating for {grade}...")
-        try:
-            content = newsletter_utils.generate_monthly_plan(api_key, grade, current_month)
-            full_markdown_body += f"## 📌 {grade}\n{content}\n\n---\n\n"
-            time.sleep(2) # Prevent rate limiting
-        except Exception as e:
-            print(f"   ❌ Error generating {grade}: {e}")
-            full_markdown_body += f"## {grade}\n(Content generation failed)\n\n"
-
-    # Append Footer Signature
-    full_markdown_body += """
-Sent by Elite Prep Master Plan & Academic Consulting
-
-Andy Lee  | Branch Director <br>
-Elite Prep Suwanee powered by Elite Open School <br>
-1291 Old Peachtree Rd. NW #127, Suwanee, GA 30024 <br>
-Tel & Text: 470.253.1004
-"""
+    # Header, grade sections and footer match app.py STAGE 1; failed grades are retried on their own
+    draft = newsletter_utils.complete_draft(
+        api_key, newsletter_utils.new_draft(current_month, tenant=tenant.id),
+        on_progress=lambda done, total, section: print(f"   > {section['grade']}: {section['status']} ({done}/{total})"))
+    if not newsletter_utils.draft_ready(draft):
+        print(f"❌ Draft incomplete, nothing sent: {newsletter_utils.draft_summary(draft)}")
+        return
+    full_markdown_body = newsletter_utils.draft_body(draft)
 
     # 4. Send Email
     print("📤 Sending email...")
     # Updated Subject Line
-    subject = f"[{current_month}] Monthly Academic Master Plan"
+    subject = newsletter_utils.newsletter_subject(current_month)
     
     # newsletter_utils.send_email handles logo embedding internally now
-    success, msg = newsletter_utils.send_email(
+    success, msg, metrics = newsletter_utils.send_email(
         sender_email, 
         sender_password, 
         subscribers, 
         subject, 
-        full_markdown_body
+        full_markdown_body,
+        tenant=tenant.id
     )
     
     if success:
         print(f"✅ Success: {msg}")
     else:
         print(f"❌ Failed: {msg}")
+    print(f"📈 Delivery metrics: {newsletter_utils.format_send_metrics(metrics)}")
 
     print("--- Done ---")
+    return metrics
+
+def enqueue(wait=False, month=None, tenant_id=None):
+    """Queues the monthly draft+send as a background job (run `python job_runner.py worker`)."""
+    import job_runner
+    current_month = month or datetime.now().strftime("%B")
+    tenant_id = tenants.get_tenant(tenant_id).id
+    job_id = job_runner.enqueue("monthly_newsletter", {"month": current_month}, tenant=tenant_id)
+    print(f"📥 Queued monthly newsletter job {job_id} ({current_month})")
+    if wait:
+        job = job_runner.wait_for(job_id)
+        print(f"Job {job_id}: {job['status']} {job['error'] or ''}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Monthly newsletter sender.")
+    parser.add_argument("--enqueue", action="store_true", help="Queue as a background job instead of running inline")
+    parser.add_argument("--wait", action="store_true", help="With --enqueue, wait for the job to finish")
+    parser.add_argument("--month", help="Month name for the content (default: current month)")
+    parser.add_argument("--tenant", help="Branch id from tenants.json (default: the original branch)")
+    parser.add_argument("--schedule", action="store_true", help="Run the built-in campaign scheduler (scheduler.py)")
+    parser.add_argument("--dry-run", action="store_true", help="With --schedule, report planned runs only")
+    args = parser.parse_args()
+    if args.schedule:
+        scheduler.main((["--dry-run"] if args.dry_run else []) + (["--tenant", args.tenant] if args.tenant else []))
+    elif args.enqueue:
+        enqueue(args.wait, args.month, args.tenant)
+    else:
+        main(args.month, args.tenant)
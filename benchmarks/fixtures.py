@@ -0,0 +1,84 @@
+import random
+
+# Synthetic data for benchmarks and load tests. Seeded so every run builds the same inputs.
+
+GRADES = ["9th Grade", "10th Grade", "11th Grade", "12th Grade", "Gap Year"]
+MAJORS = ["Computer Science", "Pre-Med", "Business", "Economics", "Mechanical Engineering", "Biology"]
+COLLEGES = ["Harvard", "Stanford", "MIT", "UC Berkeley", "NYU", "Georgia Tech", "Emory", "UCLA", "Duke"]
+AP_SUBJECTS = ["Calc BC", "Calc AB", "Chem", "Bio", "Physics C", "US History", "Lang", "Lit", "CS A", "Stats"]
+ECS = ["Debate Club President", "Research at Local Lab", "Varsity Tennis", "Robotics Team Captain",
+       "Hospital Volunteer", "Violin, All-State Orchestra", "Math Olympiad", "Founded Coding Nonprofit"]
+
+
+def status_text(rng):
+    uw = round(rng.uniform(3.2, 4.0), 2)
+    sat_rw = rng.randrange(600, 800, 10)
+    sat_m = rng.randrange(600, 800, 10)
+    aps = ", ".join(f"{s}({rng.randint(3, 5)})" for s in rng.sample(AP_SUBJECTS, rng.randint(2, 6)))
+    ecs = ", ".join(rng.sample(ECS, rng.randint(2, 5)))
+    return (f"GPA: {uw}/4.0 (UW), {round(uw + rng.uniform(0.2, 0.6), 2)} W\n"
+            f"SAT: {sat_rw + sat_m} (EBRW {sat_rw}, Math {sat_m})\n"
+            f"AP: {aps}\n"
+            f"ECs: {ecs}")
+
+
+def make_roster(n, seed=42, files_per_student=3):
+    rng = random.Random(seed)
+    data = {}
+    for i in range(n):
+        name = f"Student {i:05d}"
+        data[name] = {
+            "grade": rng.choice(GRADES),
+            "target": ", ".join(rng.sample(COLLEGES, 4)),
+            "major": rng.choice(MAJORS),
+            "status": status_text(rng),
+            "files": [f"student_docs/{name}/doc_{j}.pdf" for j in range(files_per_student)],
+            "last_updated": "2026-01-01 00:00:00",
+        }
+    return data
+
+
+def make_subscribers(n, seed=7):
+    rng = random.Random(seed)
+    domains = ["gmail.com", "yahoo.com", "outlook.com", "icloud.com", "school.edu"]
+    return [f"parent{i:06d}.{rng.randint(0, 9999)}@{rng.choice(domains)}" for i in range(n)]
+
+
+def make_docx(path, paragraphs, seed=3):
+    import docx
+    rng = random.Random(seed)
+    words = ("admissions essay transcript course rigor leadership research summer program "
+             "impact community honors award semester grade counselor").split()
+    doc = docx.Document()
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            doc.add_heading(f"Section {i // 50 + 1}", level=2)
+        doc.add_paragraph(" ".join(rng.choice(words) for _ in range(rng.randint(20, 60))))
+    doc.save(path)
+    return path
+
+
+def make_newsletter_markdown(month="January"):
+    body = f"# Elite Prep – {month} Academic Master Plan\n\n"
+    for grade in GRADES[:4]:
+        body += (f"## 📌 {grade}\n# {month} Monthly Action Plan\n\nWelcome, {grade} Students. "
+                 "This month is a pivotal milestone.\n\n**Target Focus:** Strategic summer planning\n\n"
+                 "- [ ] Review first-semester grades and adjust study plans.\n"
+                 "- [ ] Research summer programs and note deadlines.\n"
+                 "- [ ] Deepen one extracurricular with a concrete project.\n\n"
+                 "### Consultant's Tip\n**Depth beats breadth.**\n\n---\n\n")
+    body += ("\nSent by Elite Prep Master Plan & Academic Consulting\n\n"
+             "Andy Lee  | Branch Director <br>\nElite Prep Suwanee powered by Elite Open School <br>\n"
+             "1291 Old Peachtree Rd. NW #127, Suwanee, GA 30024 <br>\nTel & Text: 470.253.1004\n")
+    return body
+
+
+def make_chat_messages(turns, seed=11):
+    rng = random.Random(seed)
+    questions = ["Does NYU require SAT?", "What is my GPA?", "Critique my essay intro.",
+                 "Should I apply ED to Stanford?", "Which summer programs fit me?"]
+    messages = []
+    for _ in range(turns):
+        messages.append({"role": "user", "content": rng.choice(questions)})
+        messages.append({"role": "assistant", "content": "답변입니다. " * rng.randint(20, 80)})
+    return messages
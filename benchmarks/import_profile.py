@@ -0,0 +1,88 @@
+"""Import-time profile of the app's entry points, based on `python -X importtime`.
+
+    python benchmarks/import_profile.py                     # auto_sender, newsletter_utils, app
+    python benchmarks/import_profile.py app --top 25
+    python benchmarks/import_profile.py --json > imports.json
+
+Each module is imported in a fresh interpreter, so results reflect a real cold start.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["auto_sender", "newsletter_utils", "app"]
+
+
+def parse_importtime(stderr):
+    """Parses `-X importtime` output into [{module, self_us, cumulative_us, depth}]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append({"module": name.strip(), "self_us": self_us, "cumulative_us": cumulative_us, "depth": depth})
+    return rows
+
+
+def profile_module(module, python=sys.executable):
+    """Imports `module` in a fresh interpreter and returns its import-time profile."""
+    env = dict(os.environ, LLM_METRICS_SINK="off", PYTHONDONTWRITEBYTECODE="1")
+    t0 = time.perf_counter()
+    proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    wall_s = time.perf_counter() - t0
+    rows = parse_importtime(proc.stderr)
+    top_level = next((r for r in rows if r["module"] == module), None)
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else "",
+        "wall_s": round(wall_s, 4),
+        "import_us": top_level["cumulative_us"] if top_level else sum(r["self_us"] for r in rows),
+        "modules_loaded": len(rows),
+        "imports": rows,
+    }
+
+
+def heaviest(profile, top=15):
+    """Top-level packages (depth 0-1) sorted by cumulative import time."""
+    candidates = [r for r in profile["imports"] if r["depth"] <= 1 and r["module"] != profile["module"]]
+    return sorted(candidates, key=lambda r: r["cumulative_us"], reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time report for cold start.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    opts = parser.parse_args(argv)
+
+    report = []
+    for module in opts.modules:
+        profile = profile_module(module)
+        summary = {k: v for k, v in profile.items() if k != "imports"}
+        summary["heaviest"] = heaviest(profile, opts.top)
+        report.append(summary)
+        if opts.json:
+            continue
+        status = "ok" if profile["ok"] else f"FAILED: {profile['error']}"
+        print(f"== {module}: {profile['import_us'] / 1000:.1f} ms import, "
+              f"{profile['modules_loaded']} modules, {profile['wall_s'] * 1000:.0f} ms wall ({status})")
+        for r in summary["heaviest"]:
+            print(f"   {r['cumulative_us'] / 1000:8.1f} ms  {r['module']}")
+    if opts.json:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
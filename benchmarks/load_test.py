@@ -0,0 +1,397 @@
+"""Load test: concurrent counselor sessions on one app worker, plus a newsletter blast.
+
+    python benchmarks/load_test.py                                    # 20 sessions for 30 s, 1 s fake Gemini
+    python benchmarks/load_test.py --sessions 100 --duration 60 --latency 2 --jitter 1
+    python benchmarks/load_test.py --workers 4 --sessions 200         # 4 worker processes x 50 sessions
+    python benchmarks/load_test.py --flows newsletter --recipients 50000 --smtp-latency 0.001
+    python benchmarks/load_test.py --flows newsletter --starttls      # TLS path, as against Gmail
+    python benchmarks/load_test.py --mix profile=1,master_plan=1,chat=4 -o load.json
+
+A Streamlit worker serves every browser session from threads of one process, so each
+simulated counselor is a thread running what the app's tabs run: profile save (+ upload),
+Master Plan (request assembly, model call, save) and chatbot turns (chat_store + model call).
+Sessions pick a flow by --mix weight, then wait --think seconds, until --duration is up.
+The newsletter phase times newsletter_utils.send_email to --recipients addresses and a
+full auto_sender.main() run (drafting included).
+
+Gemini is llm_client.FakeBackend with --latency/--jitter, SMTP is the local sink, and
+everything runs inside a temporary directory. Reported per flow: throughput, p50/p95/p99
+latency and errors; per worker process: start/peak/end RSS.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("LLM_METRICS_SINK", "off")
+
+import fixtures
+from smtp_sink import SMTPSink
+
+SESSION_FLOWS = ("profile", "master_plan", "chat")
+DEFAULT_MIX = "profile=1,master_plan=1,chat=4"
+MODEL_PRO = "gemini-3-pro-preview"
+MODEL_FLASH = "gemini-3-flash-preview"
+UPLOAD_BYTES = 256 * 1024
+CHAT_QUESTIONS = ["Does NYU require the SAT?", "How many APs should I take next year?",
+                  "What should my Common App essay focus on?", "Is ED at Emory a good idea for me?"]
+
+
+# --- Measurement helpers ---
+def rss_mb():
+    """Current resident set size of this process in MB (None where it can't be read)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return None
+
+
+class MemoryMonitor:
+    """Samples RSS in the background to catch the peak."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.start_mb = self.peak_mb = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current = rss_mb()
+            if current is not None and (self.peak_mb is None or current > self.peak_mb):
+                self.peak_mb = current
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_mb = rss_mb()
+        return False
+
+    def as_dict(self):
+        def r(v):
+            return round(v, 1) if v is not None else None
+        return {"rss_start_mb": r(self.start_mb), "rss_peak_mb": r(self.peak_mb), "rss_end_mb": r(self.end_mb)}
+
+
+def percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(round((len(values) - 1) * p)))] * 1000, 1)
+    return {"p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": round(values[-1] * 1000, 1)}
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        flow, _, weight = item.partition("=")
+        if flow.strip() not in SESSION_FLOWS:
+            raise ValueError(f"Unknown flow in --mix: {flow}")
+        mix[flow.strip()] = float(weight or 1)
+    return mix
+
+
+# --- Fake Gemini ---
+def fake_responder(response_chars):
+    filler = ("Focus on course rigor and one deep extracurricular. " * (response_chars // 50 + 1))[:response_chars]
+
+    def respond(model_name, contents):
+        prompt = contents if isinstance(contents, str) else ""
+        if "Monthly Action Plan" in prompt and "Rewrite ONLY" not in prompt:
+            return (f"# Monthly Action Plan\nWelcome, Students. This month is a pivotal milestone.\n\n"
+                    f"### 1. Target Focus\n**Strategic summer planning**\n\n### 2. Checklist\n"
+                    f"- [ ] **Grades:** review them.\n- [ ] **Summer:** research programs.\n"
+                    f"- [ ] **Activities:** go deeper.\n\n### 3. Consultant's Tip\n**\"Depth beats breadth.\"**\n{filler}\n")
+        return f"## Strategy\n\n| Term | Action |\n|---|---|\n| Now | Plan |\n\n{filler}"
+    return respond
+
+
+def install_fake_gemini(opts):
+    import llm_client
+    backend = llm_client.FakeBackend(fake_responder(opts["response_chars"]), latency=opts["latency"],
+                                     jitter=opts["jitter"], record_calls=False)
+    return llm_client.set_backend(backend, max_workers=opts["llm_workers"]), backend
+
+
+# --- Session flows (what the app's tabs do per click) ---
+class Upload(io.BytesIO):
+    """Stands in for a Streamlit UploadedFile."""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+class Session:
+    def __init__(self, name, record, client):
+        self.name = name
+        self.record = record
+        self.client = client
+        self.chat_session = None
+        self.available = {}
+
+    def profile(self):
+        import student_store
+        data = student_store.load_data()
+        data[self.name] = dict(self.record, last_updated=time.strftime("%Y-%m-%d %H:%M:%S"))
+        student_store.save_data(data)
+        paths = student_store.save_uploaded_files(self.name, [Upload("transcript.pdf", os.urandom(UPLOAD_BYTES))])
+        self.available = {f"[Saved] {os.path.basename(p)}": p for p in paths}
+
+    def master_plan(self):
+        import request_builder
+        import student_store
+        r = self.record
+        parts = request_builder.build_master_plan_request(
+            self.name, r["grade"], r["target"], r["major"], r["status"], list(self.available), self.available)
+        response = self.client.generate(MODEL_PRO, parts, coalesce=False, call_site="load_master_plan")
+        student_store.save_plan(self.name, response.text)
+
+    def chat(self):
+        import chat_store
+        import request_builder
+        r = self.record
+        if self.chat_session is None:
+            self.chat_session = chat_store.new_session(self.name)
+        chat_store.append_turn(self.name, self.chat_session, "user", random.choice(CHAT_QUESTIONS))
+        contents = request_builder.build_chat_request(
+            self.name, r["grade"], r["target"], r["major"], r["status"], list(self.available), self.available,
+            chat_store.model_history(self.name, self.chat_session))
+        response = self.client.generate(MODEL_FLASH, contents, coalesce=False, call_site="load_chatbot")
+        chat_store.append_turn(self.name, self.chat_session, "assistant", response.text)
+
+
+def run_worker(opts, worker_id, workdir):
+    """One app worker process: opts["sessions"] counselor threads for opts["duration"] seconds."""
+    os.chdir(workdir)
+    client, backend = install_fake_gemini(opts)
+    roster = fixtures.make_roster(opts["sessions"], seed=1000 + worker_id)
+    flows = list(opts["mix"])
+    weights = [opts["mix"][f] for f in flows]
+    samples = {f: [] for f in SESSION_FLOWS}
+    errors = {f: {} for f in SESSION_FLOWS}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + opts["duration"]
+
+    def counselor(index, name, record):
+        rng = random.Random(worker_id * 100000 + index)
+        session = Session(f"W{worker_id} {name}", record, client)
+        flow = "profile" # Every counselor starts from a saved profile
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                getattr(session, flow)()
+                with lock:
+                    samples[flow].append(time.perf_counter() - t0)
+            except Exception as e:
+                with lock:
+                    errors[flow][type(e).__name__] = errors[flow].get(type(e).__name__, 0) + 1
+            if opts["think"]:
+                time.sleep(rng.uniform(0, 2 * opts["think"]))
+            flow = rng.choices(flows, weights)[0]
+
+    threads = [threading.Thread(target=counselor, args=(i, name, record), daemon=True)
+               for i, (name, record) in enumerate(roster.items())]
+    started = time.perf_counter()
+    with MemoryMonitor() as memory:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - started
+    client.shutdown()
+    return {"worker": worker_id, "sessions": len(threads), "elapsed_s": round(elapsed, 2),
+            "samples": samples, "errors": errors, "llm_calls": backend.call_count, **memory.as_dict()}
+
+
+def run_sessions(opts, workdir):
+    per_worker = dict(opts, sessions=max(1, opts["sessions"] // opts["workers"]))
+    if opts["workers"] == 1:
+        workers = [run_worker(per_worker, 0, workdir)]
+    else:
+        with ProcessPoolExecutor(max_workers=opts["workers"], mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(run_worker, per_worker, i, workdir) for i in range(opts["workers"])]
+            workers = [f.result() for f in futures]
+
+    results = []
+    for flow in SESSION_FLOWS:
+        if flow not in opts["mix"] and flow != "profile":
+            continue
+        latencies = [s for w in workers for s in w["samples"][flow]]
+        errors = {}
+        for w in workers:
+            for name, n in w["errors"][flow].items():
+                errors[name] = errors.get(name, 0) + n
+        elapsed = max(w["elapsed_s"] for w in workers)
+        results.append(dict({"name": flow, "ok": len(latencies), "errors": errors,
+                             "per_s": round(len(latencies) / elapsed, 2) if elapsed else None}, **percentiles(latencies)))
+    memory = []
+    for w in workers:
+        grown = (w["rss_peak_mb"] - w["rss_start_mb"]) if w["rss_peak_mb"] is not None else None
+        memory.append({"worker": w["worker"], "sessions": w["sessions"], "llm_calls": w["llm_calls"],
+                       "rss_start_mb": w["rss_start_mb"], "rss_peak_mb": w["rss_peak_mb"], "rss_end_mb": w["rss_end_mb"],
+                       "per_session_mb": round(grown / w["sessions"], 3) if grown is not None else None})
+    return {"flows": results, "workers": memory}
+
+
+# --- Newsletter phase ---
+def run_newsletter(opts):
+    import newsletter_utils
+    results = {}
+    body = fixtures.make_newsletter_markdown()
+    recipients = fixtures.make_subscribers(opts["recipients"])
+    client, backend = install_fake_gemini(opts)
+
+    with SMTPSink(latency=opts["smtp_latency"], starttls=opts["starttls"]) as sink:
+        sink.point(newsletter_utils)
+
+        with MemoryMonitor() as memory:
+            t0 = time.perf_counter()
+            success, msg, metrics = newsletter_utils.send_email("sender@example.com", "app-password", recipients,
+                                                                "[January] Monthly Academic Master Plan", body)
+            elapsed = time.perf_counter() - t0
+        results["send_email"] = dict({
+            "recipients": len(recipients), "success": success, "message": msg, "elapsed_s": round(elapsed, 2),
+            "recipients_per_s": round(len(recipients) / elapsed, 1) if elapsed else None,
+            "delivered": sink.messages, "delivered_mb": round(sink.bytes / 2 ** 20, 1),
+            "send_metrics": metrics}, **memory.as_dict())
+
+        # Full unattended run: subscribers CSV -> draft (fake Gemini) -> send
+        import auto_sender
+        subscribers = recipients[:opts["auto_recipients"]]
+        with open(newsletter_utils.SUBSCRIBERS_FILE, "w", encoding="utf-8") as f:
+            f.write("email\n" + "\n".join(subscribers) + "\n")
+        os.environ.update(GOOGLE_API_KEY="fake", SENDER_EMAIL="sender@example.com", SENDER_PASSWORD="app-password")
+        delivered_before = sink.messages
+        calls_before = backend.call_count
+        with MemoryMonitor() as memory, contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            auto_metrics = auto_sender.main("January")
+            elapsed = time.perf_counter() - t0
+        results["auto_sender"] = dict({
+            "recipients": len(subscribers), "elapsed_s": round(elapsed, 2),
+            "delivered": sink.messages - delivered_before, "llm_calls": backend.call_count - calls_before,
+            "send_metrics": auto_metrics}, **memory.as_dict())
+    client.shutdown()
+    return results
+
+
+# --- Runner ---
+def print_summary(report):
+    out = sys.stderr
+    if "sessions" in report:
+        print(f"\nSessions: {report['meta']['sessions']} over {report['meta']['workers']} worker(s), "
+              f"{report['meta']['duration_s']} s, Gemini {report['meta']['latency_s']}±{report['meta']['jitter_s']} s", file=out)
+        print(f"{'flow':<12}{'ok':>7}{'err':>6}{'per s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}", file=out)
+        for r in report["sessions"]["flows"]:
+            print(f"{r['name']:<12}{r['ok']:>7}{sum(r['errors'].values()):>6}{r['per_s'] or 0:>8}"
+                  f"{r['p50_ms'] or 0:>10}{r['p95_ms'] or 0:>10}{r['p99_ms'] or 0:>10}{r['max_ms'] or 0:>10}", file=out)
+        for w in report["sessions"]["workers"]:
+            print(f"worker {w['worker']}: RSS {w['rss_start_mb']} -> peak {w['rss_peak_mb']} MB "
+                  f"({w['per_session_mb']} MB/session), {w['llm_calls']} model calls", file=out)
+    if "newsletter" in report:
+        s = report["newsletter"]["send_email"]
+        a = report["newsletter"]["auto_sender"]
+        print(f"\nsend_email: {s['delivered']}/{s['recipients']} in {s['elapsed_s']} s "
+              f"({s['recipients_per_s']}/s), RSS peak {s['rss_peak_mb']} MB", file=out)
+        print(f"auto_sender: {a['delivered']}/{a['recipients']} in {a['elapsed_s']} s, "
+              f"{a['llm_calls']} model calls, RSS peak {a['rss_peak_mb']} MB", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the app's session flows and newsletter delivery.")
+    parser.add_argument("--flows", default="sessions,newsletter", help="Phases to run: sessions, newsletter")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent counselor sessions (total)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes the sessions are split over")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each session keeps clicking")
+    parser.add_argument("--think", type=float, default=0.5, help="Mean pause between a session's actions (s)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Flow weights (default {DEFAULT_MIX})")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake Gemini latency per call (s)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Extra random latency, 0..jitter (s)")
+    parser.add_argument("--response-chars", type=int, default=4000, help="Size of fake model responses")
+    parser.add_argument("--llm-workers", type=int, default=4, help="llm_client threads per model")
+    parser.add_argument("--recipients", type=int, default=5000, help="send_email recipients (e.g. 50000)")
+    parser.add_argument("--auto-recipients", type=int, default=1000, help="Subscribers for the auto_sender run")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="Sink delay per message (s)")
+    parser.add_argument("--starttls", action="store_true", help="Send over STARTTLS like smtp.gmail.com (needs openssl)")
+    parser.add_argument("-o", "--output", help="Write JSON here instead of stdout")
+    opts = parser.parse_args(argv)
+    opts.flows = opts.flows.split(",")
+    unknown = [f for f in opts.flows if f not in ("sessions", "newsletter")]
+    if unknown:
+        parser.error(f"Unknown phase(s): {', '.join(unknown)}")
+    opts.mix = parse_mix(opts.mix)
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    settings = {k: v for k, v in vars(opts).items() if k not in ("flows", "output")}
+    output_path = os.path.abspath(opts.output) if opts.output else None
+    report = {"meta": {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "sessions": opts.sessions,
+        "workers": opts.workers,
+        "duration_s": opts.duration,
+        "latency_s": opts.latency,
+        "jitter_s": opts.jitter,
+        "mix": opts.mix,
+    }}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="elite_load_") as workdir:
+        # logo.png is read from the working directory by newsletter_utils
+        if os.path.exists(os.path.join(ROOT, "logo.png")):
+            import shutil
+            shutil.copy(os.path.join(ROOT, "logo.png"), workdir)
+        os.chdir(workdir)
+        try:
+            if "sessions" in opts.flows:
+                print(f"[sessions] {opts.sessions} sessions x {opts.duration}s ...", file=sys.stderr)
+                report["sessions"] = run_sessions(settings, workdir)
+            if "newsletter" in opts.flows:
+                print(f"[newsletter] {opts.recipients} recipients ...", file=sys.stderr)
+                report["newsletter"] = run_newsletter(settings)
+        finally:
+            os.chdir(cwd)
+
+    print_summary(report)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
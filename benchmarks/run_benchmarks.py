@@ -0,0 +1,353 @@
+"""Offline benchmark suite for the app's hot paths.
+
+    python benchmarks/run_benchmarks.py                    # default sizes, JSON to stdout
+    python benchmarks/run_benchmarks.py --quick            # smallest sizes only
+    python benchmarks/run_benchmarks.py --full             # also the 50k-recipient send
+    python benchmarks/run_benchmarks.py --only roster,email -o bench.json
+    python benchmarks/run_benchmarks.py --compare bench_prev.json
+    python benchmarks/run_benchmarks.py --only cold_start  # see also import_profile.py
+    python benchmarks/load_test.py                         # concurrent sessions + newsletter blast
+
+Gemini is replaced by llm_client.FakeBackend and SMTP by a local sink, so no
+network or credentials are needed. Everything runs inside a temporary directory.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("LLM_METRICS_SINK", "off")
+
+import fixtures
+from smtp_sink import SMTPSink
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def measure(name, fn, params=None, repeat=5, setup=None, items=None):
+    """Runs fn `repeat` times (setup before each, untimed) and returns a result dict."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    result = {
+        "name": name,
+        "params": params or {},
+        "repeat": repeat,
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "mean_s": round(statistics.mean(times), 6),
+        "max_s": round(max(times), 6),
+    }
+    if items:
+        result["items_per_s"] = round(items / statistics.median(times), 1) if statistics.median(times) else None
+    print(f"  {name} {params or ''}: median {result['median_s'] * 1000:.2f} ms", file=sys.stderr)
+    return result
+
+
+# --- Benchmarks ---
+@benchmark("roster")
+def bench_roster(opts):
+    import student_store
+    results = []
+    for n in opts.roster_sizes:
+        data = fixtures.make_roster(n)
+        student_store.save_data(data)
+        results.append(measure("save_data", lambda: student_store.save_data(data), {"students": n}, opts.repeat))
+        results.append(measure("load_data", student_store.load_data, {"students": n}, opts.repeat))
+    return results
+
+
+@benchmark("subscribers")
+def bench_subscribers(opts):
+    import newsletter_utils
+    results = []
+    batch = 100
+    for n in opts.subscriber_sizes:
+        base = fixtures.make_subscribers(n)
+        new = [f"new{i}@example.com" for i in range(batch)]
+        remove = base[::max(1, n // batch)][:batch]
+
+        def reset():
+            with open(newsletter_utils.SUBSCRIBERS_FILE, "w", encoding="utf-8") as f:
+                f.write("email\n" + "\n".join(base) + "\n")
+
+        results.append(measure("load_subscribers", newsletter_utils.load_subscribers, {"subscribers": n}, opts.repeat, reset))
+        results.append(measure("save_subscribers", lambda: newsletter_utils.save_subscribers(new),
+                               {"subscribers": n, "added": batch}, opts.repeat, reset))
+        results.append(measure("remove_subscribers", lambda: newsletter_utils.remove_subscribers(remove),
+                               {"subscribers": n, "removed": batch}, opts.repeat, reset))
+    return results
+
+
+@benchmark("docx")
+def bench_docx(opts):
+    import request_builder
+    results = []
+    for paragraphs in opts.docx_sizes:
+        path = fixtures.make_docx(f"bench_{paragraphs}.docx", paragraphs)
+
+        def run():
+            with open(path, "rb") as f:
+                request_builder.extract_text_from_docx(f)
+
+        params = {"paragraphs": paragraphs, "bytes": os.path.getsize(path)}
+        results.append(measure("extract_text_from_docx", run, params, opts.repeat))
+    return results
+
+
+@benchmark("email")
+def bench_email(opts):
+    import newsletter_utils
+    results = []
+    body = fixtures.make_newsletter_markdown()
+    subject = "[January] Monthly Academic Master Plan"
+
+    img_data = newsletter_utils.prepare_logo()
+    results.append(measure("render_email_html", lambda: newsletter_utils.render_email_html(body, bool(img_data)),
+                           {}, opts.repeat))
+
+    def render_uncached():
+        newsletter_utils._render_cache.clear()
+        return newsletter_utils.render_newsletter(subject, body)
+
+    result = measure("render_newsletter", render_uncached, {}, opts.repeat)
+    rendered = newsletter_utils.render_newsletter(subject, body)
+    result["message_bytes"] = len(rendered.message("sender@example.com", "parent@example.com"))
+    results.append(result)
+
+    n_build = 1000
+    recipients = fixtures.make_subscribers(n_build)
+
+    def build_all():
+        for r in recipients:
+            rendered.head("sender@example.com", r)
+
+    results.append(measure("message_head", build_all, {"messages": n_build}, opts.repeat, items=n_build))
+
+    with SMTPSink() as sink:
+        sink.point(newsletter_utils)
+        for n in opts.send_sizes:
+            recipients = fixtures.make_subscribers(n)
+            sent = []
+            result = measure("send_email", lambda: sent.append(newsletter_utils.send_email(
+                "sender@example.com", "app-password", recipients, subject, body)), {"recipients": n}, 1, items=n)
+            result["send_metrics"] = sent[-1][2]
+            results.append(result)
+
+    # Production path (smtp.gmail.com): STARTTLS, then every message over the TLS socket.
+    # Also a check: the run fails unless each recipient was delivered over TLS.
+    import shutil
+    if not shutil.which("openssl"):
+        print("  send_email_starttls: skipped (needs the openssl command)", file=sys.stderr)
+        return results
+    n = opts.send_sizes[0]
+    recipients = fixtures.make_subscribers(n)
+    with SMTPSink(starttls=True) as sink:
+        sink.point(newsletter_utils)
+        sent = []
+        result = measure("send_email_starttls", lambda: sent.append(newsletter_utils.send_email(
+            "sender@example.com", "app-password", recipients, subject, body)), {"recipients": n}, 1, items=n)
+        success, msg, metrics = sent[-1]
+        if not success or sink.tls_sessions < 1 or sink.messages != n or metrics["sent"] != n:
+            raise AssertionError(f"STARTTLS send delivered {sink.messages}/{n} ({sink.tls_sessions} TLS sessions): {msg}")
+        result["send_metrics"] = metrics
+        results.append(result)
+    return results
+
+
+@benchmark("chat")
+def bench_chat(opts):
+    import request_builder
+    results = []
+    roster = fixtures.make_roster(1)
+    name, record = next(iter(roster.items()))
+
+    os.makedirs("docs", exist_ok=True)
+    available = {}
+    for i in range(2):
+        path = os.path.join("docs", f"transcript_{i}.pdf")
+        with open(path, "wb") as f:
+            f.write(os.urandom(512 * 1024))
+        available[f"[Saved] {os.path.basename(path)}"] = path
+    docx_path = fixtures.make_docx(os.path.join("docs", "essay.docx"), 200)
+    available["[Saved] essay.docx"] = docx_path
+    selected = list(available)
+
+    args = (name, record["grade"], record["target"], record["major"], record["status"])
+    results.append(measure("build_master_plan_request", lambda: request_builder.build_master_plan_request(
+        *args, selected, available), {"files": len(selected)}, opts.repeat))
+    for turns in opts.chat_turns:
+        messages = fixtures.make_chat_messages(turns)
+        results.append(measure("build_chat_request", lambda: request_builder.build_chat_request(
+            *args, selected, available, messages), {"files": len(selected), "turns": turns}, opts.repeat))
+
+    # Full turn: request assembly + fake model call through the shared client
+    import llm_client
+    client = llm_client.get_client("fake")
+    messages = fixtures.make_chat_messages(opts.chat_turns[0])
+    results.append(measure("chatbot_turn", lambda: client.generate(
+        "gemini-3-flash-preview", request_builder.build_chat_request(*args, selected, available, messages),
+        coalesce=False, call_site="benchmark"), {"turns": opts.chat_turns[0]}, opts.repeat))
+    return results
+
+
+@benchmark("profile_parse")
+def bench_profile_parse(opts):
+    import profile_parser
+    results = []
+    for n in opts.roster_sizes:
+        data = fixtures.make_roster(n)
+        results.append(measure("parse_profile_rules", lambda: [profile_parser.parse_profile_rules(r["status"]) for r in data.values()],
+                               {"students": n}, opts.repeat, items=n))
+        results.append(measure("RosterIndex", lambda: profile_parser.RosterIndex(data), {"students": n}, opts.repeat))
+    return results
+
+
+@benchmark("cold_start")
+def bench_cold_start(opts):
+    import import_profile
+    results = []
+    for module in import_profile.DEFAULT_MODULES:
+        runs = [import_profile.profile_module(module) for _ in range(opts.repeat)]
+        import_times = [r["import_us"] / 1e6 for r in runs]
+        result = {
+            "name": "import",
+            "params": {"module": module},
+            "repeat": len(runs),
+            "min_s": round(min(import_times), 6),
+            "median_s": round(statistics.median(import_times), 6),
+            "mean_s": round(statistics.mean(import_times), 6),
+            "max_s": round(max(import_times), 6),
+            "ok": all(r["ok"] for r in runs),
+            "modules_loaded": runs[-1]["modules_loaded"],
+            "heaviest": [{"module": r["module"], "cumulative_ms": round(r["cumulative_us"] / 1000, 2)}
+                         for r in import_profile.heaviest(runs[-1], 10)],
+        }
+        print(f"  import {module}: median {result['median_s'] * 1000:.2f} ms", file=sys.stderr)
+        results.append(result)
+    return results
+
+
+# --- Runner ---
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return ""
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if not old or not old["median_s"]:
+            continue
+        ratio = r["median_s"] / old["median_s"]
+        r["baseline_median_s"] = old["median_s"]
+        r["ratio"] = round(ratio, 3)
+        if ratio > threshold:
+            regressions.append(r)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Elite Master Plan hot paths.")
+    parser.add_argument("--only", help="Comma-separated benchmark groups: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="Smallest sizes only")
+    parser.add_argument("--full", action="store_true", help="Include the 50k-recipient send")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON to compare medians against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Regression ratio (default 1.2 = +20%%)")
+    opts = parser.parse_args(argv)
+
+    opts.roster_sizes = [100] if opts.quick else [100, 1000, 10000]
+    opts.subscriber_sizes = [1000] if opts.quick else [1000, 50000]
+    opts.docx_sizes = [1000] if opts.quick else [1000, 10000]
+    opts.send_sizes = [100] if opts.quick else ([1000, 50000] if opts.full else [1000])
+    opts.chat_turns = [10] if opts.quick else [10, 100]
+    if opts.quick:
+        opts.repeat = min(opts.repeat, 3)
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    groups = opts.only.split(",") if opts.only else list(BENCHMARKS)
+    unknown = [g for g in groups if g not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark group(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    output_path = os.path.abspath(opts.output) if opts.output else None
+    compare_path = os.path.abspath(opts.compare) if opts.compare else None
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="elite_bench_") as workdir:
+        # logo.png is read from the working directory by newsletter_utils
+        if os.path.exists(os.path.join(ROOT, "logo.png")):
+            import shutil
+            shutil.copy(os.path.join(ROOT, "logo.png"), workdir)
+        os.chdir(workdir)
+        try:
+            for group in groups:
+                print(f"[{group}]", file=sys.stderr)
+                results.extend(BENCHMARKS[group](opts))
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "quick": opts.quick,
+            "groups": groups,
+        },
+        "results": results,
+    }
+    exit_code = 0
+    if compare_path:
+        regressions = compare(results, compare_path, opts.threshold)
+        report["regressions"] = [{"name": r["name"], "params": r["params"], "ratio": r["ratio"]} for r in regressions]
+        for r in regressions:
+            print(f"REGRESSION {r['name']} {r['params']}: {r['ratio']}x baseline", file=sys.stderr)
+        exit_code = 1 if regressions else 0
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
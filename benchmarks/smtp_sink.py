@@ -0,0 +1,154 @@
+import os
+import ssl
+import time
+import shutil
+import tempfile
+import ipaddress
+import threading
+import subprocess
+import socketserver
+
+# Minimal local SMTP server that accepts and discards mail.
+# Stands in for smtp.gmail.com in benchmarks and load tests (AUTH always succeeds).
+# With starttls=True it offers STARTTLS with a throwaway self-signed certificate (made with
+# the openssl CLI), so sends take the same TLS path as against Gmail.
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        self.tls = False
+        self._reply("220 localhost ESMTP sink")
+        in_data = False
+        size = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    sink._delivered(size)
+                    size = 0
+                    if sink.latency:
+                        time.sleep(sink.latency)
+                    self._reply("250 OK queued")
+                else:
+                    size += len(line)
+                continue
+
+            cmd = line.decode("ascii", "replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                starttls = b"250-STARTTLS\r\n" if sink.tls_context and not self.tls else b""
+                self.wfile.write(b"250-localhost\r\n" + starttls +
+                                 b"250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SIZE 52428800\r\n")
+            elif verb == "STARTTLS" and sink.tls_context and not self.tls:
+                self._reply("220 Ready to start TLS")
+                self.request = sink.tls_context.wrap_socket(self.request, server_side=True)
+                self.rfile = self.request.makefile("rb")
+                self.wfile = self.request.makefile("wb", buffering=0)
+                self.tls = True
+                sink._tls_session()
+            elif verb == "HELO":
+                self._reply("250 localhost")
+            elif verb == "AUTH":
+                parts = cmd.split()
+                if len(parts) == 2 and parts[1].upper() == "LOGIN":
+                    # Username + password challenges
+                    self._reply("334 VXNlcm5hbWU6")
+                    self.rfile.readline()
+                    self._reply("334 UGFzc3dvcmQ6")
+                    self.rfile.readline()
+                elif len(parts) == 2:
+                    self._reply("334 ")
+                    self.rfile.readline()
+                self._reply("235 Authentication successful")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "DATA":
+                in_data = True
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Starts on 127.0.0.1 with a free port. `latency` adds a delay per accepted message."""
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0, starttls=False):
+        self.latency = latency
+        self.messages = 0
+        self.bytes = 0
+        self.tls_sessions = 0
+        self._lock = threading.Lock()
+        self.tls_context = None
+        self.ca_file = None
+        self._cert_dir = None
+        if starttls:
+            self._make_certificate(host)
+        self._server = _Server((host, port), _Handler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address
+
+    def _make_certificate(self, host):
+        if not shutil.which("openssl"):
+            raise RuntimeError("SMTPSink(starttls=True) needs the openssl command line tool")
+        self._cert_dir = tempfile.mkdtemp(prefix="smtp_sink_")
+        cert = os.path.join(self._cert_dir, "cert.pem")
+        key = os.path.join(self._cert_dir, "key.pem")
+        try:
+            san = f"IP:{ipaddress.ip_address(host)}"
+        except ValueError:
+            san = f"DNS:{host}"
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-keyout", key, "-out", cert, "-subj", f"/CN={host}", "-addext", f"subjectAltName={san}"],
+                       check=True, capture_output=True)
+        self.tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.tls_context.load_cert_chain(cert, key)
+        self.ca_file = cert # Self-signed: the certificate is its own CA
+
+    def _tls_session(self):
+        with self._lock:
+            self.tls_sessions += 1
+
+    def _delivered(self, size):
+        with self._lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._cert_dir:
+            shutil.rmtree(self._cert_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def point(self, newsletter_utils):
+        """Points newsletter_utils.send_email at this sink (over STARTTLS if the sink offers it)."""
+        newsletter_utils.SMTP_HOST = self.host
+        newsletter_utils.SMTP_PORT = self.port
+        newsletter_utils.SMTP_STARTTLS = self.tls_context is not None
+        newsletter_utils.SMTP_CA_FILE = self.ca_file
+
@@ -0,0 +1,190 @@
+import os
+import re
+import csv
+import io
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import tenants
+import student_store
+import profile_parser
+
+# Term-end export: roster + each student's latest Master Plan as DOCX / Markdown / HTML in one zip.
+#
+#   python bulk_export.py -o export.zip                  # all formats, default branch
+#   python bulk_export.py -o export.zip --tenant duluth --formats docx,md --workers 8
+#
+# Students are rendered in a process pool; each finished file is streamed into the zip and
+# deleted, so memory stays flat no matter how large the roster is.
+
+FORMATS = ("docx", "md", "html")
+MAX_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+NO_PLAN_TEXT = "_No Master Plan has been generated for this student yet._"
+
+
+def safe_name(name):
+    return re.sub(r"[^\w.-]+", "_", name, flags=re.UNICODE).strip("_") or "student"
+
+
+def archive_names(names):
+    """Unique file base per student: "Kim, Alex" and "Kim Alex" both sanitize to Kim_Alex,
+    so later ones get _2, _3, ... (compared case-insensitively, like most unzip targets)."""
+    bases = {}
+    taken = set()
+    for name in names:
+        base = candidate = safe_name(name)
+        n = 1
+        while candidate.lower() in taken:
+            n += 1
+            candidate = f"{base}_{n}"
+        taken.add(candidate.lower())
+        bases[name] = candidate
+    return bases
+
+
+def student_markdown(name, record, plan):
+    """Cover block (profile, targets, parsed fields) followed by the plan text."""
+    fields = profile_parser.format_profile_compact(profile_parser.get_profile_fields(record))
+    lines = [
+        f"# {name} – US College Admissions Master Plan",
+        "",
+        f"- **Grade**: {record.get('grade', '')}",
+        f"- **Target Colleges**: {record.get('target', '')}",
+        f"- **Intended Major**: {record.get('major', '')}",
+        f"- **Profile**: {fields or record.get('status', '')}",
+        f"- **Profile updated**: {record.get('last_updated', '')[:16]}",
+        f"- **Plan generated**: {plan['created'] if plan else '-'}",
+        "",
+        "---",
+        "",
+        plan["text"] if plan else NO_PLAN_TEXT,
+    ]
+    return "\n".join(lines)
+
+
+def render_student(name, record, tenant_id, formats, out_dir, base=None):
+    """Runs in a worker process: writes one student's files and returns their paths for the zip."""
+    import doc_render
+
+    plan = student_store.latest_plan(name, tenant_id)
+    text = student_markdown(name, record, plan)
+    base = base or safe_name(name)
+    written = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{base}.{fmt}")
+        if fmt == "md":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        elif fmt == "html":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(doc_render.markdown_to_html(text, title=name))
+        elif fmt == "docx":
+            doc_render.save_docx(text, path)
+        written.append((f"{fmt}/{base}.{fmt}", path))
+    return {"student": name, "files": written, "dir": out_dir, "plan_created": plan["created"] if plan else None}
+
+
+def roster_csv(data):
+    buffer = io.StringIO()
+    rows = [dict(profile_parser.roster_row(name, record),
+                 target=record.get("target", ""), major=record.get("major", ""),
+                 files=len(record.get("files", [])), last_updated=record.get("last_updated", ""))
+            for name, record in sorted(data.items())]
+    if rows:
+        writer = csv.DictWriter(buffer, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def export_bundle(out_path, tenant=None, formats=FORMATS, workers=MAX_WORKERS, students=None, on_progress=None):
+    """Writes the export zip to out_path and returns a summary dict."""
+    tenant = tenants.get_tenant(tenant)
+    data = student_store.load_data(tenant.id)
+    names = [n for n in (students or sorted(data)) if n in data]
+    bases = archive_names(names)
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise ValueError(f"Unknown export format(s): {', '.join(unknown)}")
+
+    started = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="export_")
+    tmp_zip = out_path + ".part"
+    manifest = []
+    try:
+        with zipfile.ZipFile(tmp_zip, "w", compression=zipfile.ZIP_DEFLATED) as zf, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            zf.writestr("roster.csv", roster_csv({n: data[n] for n in names}))
+
+            # Keep only a bounded number of students in flight
+            pending = set()
+            queue = iter(names)
+            window = workers * 4
+            submitted = done_count = 0
+            while True:
+                while len(pending) < window:
+                    name = next(queue, None)
+                    if name is None:
+                        break
+                    submitted += 1
+                    student_dir = os.path.join(work_dir, str(submitted))
+                    os.makedirs(student_dir)
+                    pending.add(pool.submit(render_student, name, data[name], tenant.id, tuple(formats), student_dir,
+                                            bases[name]))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    for arcname, path in result["files"]:
+                        zf.write(path, arcname)
+                    shutil.rmtree(result["dir"], ignore_errors=True)
+                    manifest.append({"student": result["student"], "plan_created": result["plan_created"],
+                                     "files": [arcname for arcname, _ in result["files"]]})
+                    done_count += 1
+                    if on_progress:
+                        on_progress(done_count, len(names), result["student"])
+
+            summary = {
+                "exported_at": datetime.now().isoformat(timespec="seconds"),
+                "tenant": tenant.id,
+                "branch": tenant.name,
+                "students": len(names),
+                "with_plan": sum(1 for m in manifest if m["plan_created"]),
+                "formats": list(formats),
+                "elapsed_s": round(time.perf_counter() - started, 2),
+            }
+            zf.writestr("manifest.json", json.dumps(dict(summary, entries=manifest), indent=2, ensure_ascii=False))
+        os.replace(tmp_zip, out_path)
+        return summary
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if os.path.exists(tmp_zip):
+            os.remove(tmp_zip)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk export of roster and Master Plans.")
+    parser.add_argument("-o", "--output", default=f"export_{datetime.now().strftime('%Y%m%d')}.zip")
+    parser.add_argument("--tenant", help="Branch id (default: the original branch)")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated: docx,md,html")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--student", action="append", help="Only these students (repeatable)")
+    args = parser.parse_args(argv)
+
+    summary = export_bundle(args.output, args.tenant, args.formats.split(","), args.workers, args.student,
+                            on_progress=lambda done, total, name: print(f"   > {done}/{total} {name}"))
+    print(f"✅ Exported {summary['students']} students ({summary['with_plan']} with plans) "
+          f"to {args.output} in {summary['elapsed_s']}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
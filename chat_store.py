@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import struct
+import threading
+from datetime import datetime
+import tenants
+
+# Chatbot conversations, per student and session:
+#
+#   student_chats/<name>/sessions.json      {session id: {"title", "created", "updated", "turns"}}
+#   student_chats/<name>/<session>.jsonl    one turn per line, append-only
+#   student_chats/<name>/<session>.idx      end offset of each line (8 bytes per turn)
+#
+# The .idx file lets any page of turns be read with one seek, so reopening a long
+# conversation (or paging back through it) never reads the whole log.
+
+CHATS_DIR = "student_chats"
+INDEX_FILE = "sessions.json"
+PAGE_SIZE = 20 # Turns shown when a conversation is opened / per "load older" click
+HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "20")) # Most recent turns sent to the model
+HISTORY_CHARS = int(os.getenv("CHAT_HISTORY_CHARS", "40000")) # ... and at most this much text
+
+_OFFSET = struct.Struct("<Q")
+_lock = threading.RLock()
+
+
+def chats_dir(tenant=None):
+    return tenants.get_tenant(tenant).path(CHATS_DIR) if tenant else CHATS_DIR
+
+
+def _student_dir(student_name, tenant=None):
+    return os.path.join(chats_dir(tenant), student_name)
+
+
+def _paths(student_name, session_id, tenant=None):
+    base = os.path.join(_student_dir(student_name, tenant), session_id)
+    return base + ".jsonl", base + ".idx"
+
+
+# --- Session index ---
+def list_sessions(student_name, tenant=None):
+    """Sessions of one student, most recently used first: [{"id", "title", "created", "updated", "turns"}]."""
+    path = os.path.join(_student_dir(student_name, tenant), INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except Exception as e:
+        print(f"Error loading chat index: {e}")
+        return []
+    return sorted((dict(v, id=k) for k, v in index.items()), key=lambda s: s["updated"], reverse=True)
+
+
+def _update_index(student_name, session_id, tenant=None, **fields):
+    student_dir = _student_dir(student_name, tenant)
+    path = os.path.join(student_dir, INDEX_FILE)
+    index = {s.pop("id"): s for s in list_sessions(student_name, tenant)}
+    index.setdefault(session_id, {"title": "", "created": time.time(), "updated": time.time(), "turns": 0})
+    index[session_id].update(fields)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def new_session(student_name, tenant=None, title=""):
+    session_id = datetime.now().strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    with _lock:
+        os.makedirs(_student_dir(student_name, tenant), exist_ok=True)
+        _update_index(student_name, session_id, tenant, title=title)
+    return session_id
+
+
+def session_label(session):
+    when = datetime.fromtimestamp(session["updated"]).strftime("%Y-%m-%d %H:%M")
+    return f"{when} · {session['title'] or '(empty)'} ({session['turns']} msgs)"
+
+
+# --- Turns ---
+def _read_offsets(idx_path, start, stop):
+    """End offsets of turns start-1 .. stop-1 (the first is 0 for turn 0)."""
+    with open(idx_path, "rb") as f:
+        first = 0
+        if start > 0:
+            f.seek((start - 1) * _OFFSET.size)
+            first = _OFFSET.unpack(f.read(_OFFSET.size))[0]
+        f.seek(max(0, stop - 1) * _OFFSET.size)
+        last = _OFFSET.unpack(f.read(_OFFSET.size))[0] if stop > 0 else 0
+    return first, last
+
+
+def _rebuild_index(log_path, idx_path):
+    """Recreates the offset index from the log (after a crash between the two writes)."""
+    offsets = []
+    pos = 0
+    with open(log_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break # Torn last write: ignore the partial line
+            pos += len(line)
+            offsets.append(pos)
+    with open(log_path, "ab") as f:
+        f.truncate(pos)
+    with open(idx_path, "wb") as f:
+        f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+    return len(offsets)
+
+
+def turn_count(student_name, session_id, tenant=None):
+    log_path, idx_path = _paths(student_name, session_id, tenant)
+    if not os.path.exists(log_path):
+        return 0
+    count = os.path.getsize(idx_path) // _OFFSET.size if os.path.exists(idx_path) else 0
+    end = _read_offsets(idx_path, count, count)[1] if count else 0
+    if end != os.path.getsize(log_path):
+        with _lock:
+            count = _rebuild_index(log_path, idx_path)
+    return count
+
+
+def append_turn(student_name, session_id, role, content, tenant=None):
+    """Appends one turn ("user" / "assistant") and returns its sequence number."""
+    log_path, idx_path = _paths(student_name, session_id, tenant)
+    with _lock:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        seq = turn_count(student_name, session_id, tenant)
+        line = json.dumps({"seq": seq, "role": role, "content": content, "ts": time.time()}, ensure_ascii=False) + "\n"
+        with open(log_path, "ab") as f:
+            f.write(line.encode("utf-8"))
+            end = f.tell()
+        with open(idx_path, "ab") as f:
+            f.write(_OFFSET.pack(end))
+        fields = {"updated": time.time(), "turns": seq + 1}
+        if seq == 0 and role == "user":
+            fields["title"] = " ".join(content.split())[:60]
+        _update_index(student_name, session_id, tenant, **fields)
+    return seq
+
+
+def load_turns(student_name, session_id, start=0, stop=None, tenant=None):
+    """Turns [start, stop) of a session, read with a single seek."""
+    log_path, idx_path = _paths(student_name, session_id, tenant)
+    count = turn_count(student_name, session_id, tenant)
+    stop = count if stop is None else min(stop, count)
+    start = max(0, start)
+    if start >= stop:
+        return []
+    first, last = _read_offsets(idx_path, start, stop)
+    with open(log_path, "rb") as f:
+        f.seek(first)
+        chunk = f.read(last - first)
+    return [json.loads(line) for line in chunk.decode("utf-8").splitlines() if line]
+
+
+def load_page(student_name, session_id, before=None, limit=PAGE_SIZE, tenant=None):
+    """The `limit` turns before seq `before` (default: the newest). Returns (turns, first seq)."""
+    if before is None:
+        before = turn_count(student_name, session_id, tenant)
+    start = max(0, before - limit)
+    return load_turns(student_name, session_id, start, before, tenant), start
+
+
+def history_window(turns, max_turns=HISTORY_TURNS, max_chars=HISTORY_CHARS):
+    """Most recent turns that fit the budget, starting on a user turn (what the model sees)."""
+    window = []
+    size = 0
+    for turn in reversed(turns[-max_turns:] if max_turns else turns):
+        size += len(turn["content"])
+        if window and size > max_chars:
+            break
+        window.append(turn)
+    window.reverse()
+    while window and window[0]["role"] != "user":
+        window.pop(0)
+    return [{"role": t["role"], "content": t["content"]} for t in window]
+
+
+def model_history(student_name, session_id, tenant=None, max_turns=HISTORY_TURNS):
+    """Bounded history of a session for the next model call; only the tail of the log is read."""
+    count = turn_count(student_name, session_id, tenant)
+    return history_window(load_turns(student_name, session_id, count - max_turns, count, tenant), max_turns)
+
+
+def delete_student(student_name, tenant=None):
+    student_dir = _student_dir(student_name, tenant)
+    if os.path.isdir(student_dir):
+        shutil.rmtree(student_dir, ignore_errors=True)
@@ -0,0 +1,128 @@
+import os
+import re
+
+# Renders generated Markdown (Master Plans, newsletters) to DOCX and standalone HTML.
+# python-docx and markdown are imported on first use.
+
+TEMPLATE_DOCX = "Elite Prep- Master Plan Guide format.docx" # Styles/header/footer source, body is replaced
+
+_BOLD = re.compile(r"\*\*(.+?)\*\*")
+_TABLE_RULE = re.compile(r"^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?$")
+_HTML_BREAK = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+
+def _new_document(template_path):
+    import docx
+    if template_path and os.path.exists(template_path):
+        doc = docx.Document(template_path)
+        body = doc.element.body
+        for child in list(body):
+            if not child.tag.endswith("}sectPr"): # Keep page setup, drop the sample content
+                body.remove(child)
+        return doc
+    return docx.Document()
+
+
+def _add_runs(paragraph, text):
+    text = _HTML_BREAK.sub("\n", text)
+    pos = 0
+    for m in _BOLD.finditer(text):
+        if m.start() > pos:
+            paragraph.add_run(text[pos:m.start()])
+        paragraph.add_run(m.group(1)).bold = True
+        pos = m.end()
+    if pos < len(text):
+        paragraph.add_run(text[pos:])
+
+
+def _style(doc, name, fallback=None):
+    try:
+        doc.styles[name]
+        return name
+    except KeyError:
+        return fallback
+
+
+def _table_cells(line):
+    return [c.strip() for c in line.strip().strip("|").split("|")]
+
+
+def markdown_to_docx(markdown_text, template_path=TEMPLATE_DOCX, title=None):
+    """Builds a python-docx Document from Markdown (headings, bullets, checkboxes, tables, bold)."""
+    doc = _new_document(template_path)
+    bullet = _style(doc, "List Bullet")
+    if title:
+        doc.add_heading(title, level=0)
+
+    lines = markdown_text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        stripped = line.strip()
+        if not stripped or stripped == "---":
+            i += 1
+            continue
+        if stripped.startswith("|") and i + 1 < len(lines) and _TABLE_RULE.match(lines[i + 1].strip()):
+            header = _table_cells(stripped)
+            rows = []
+            i += 2
+            while i < len(lines) and lines[i].strip().startswith("|"):
+                rows.append(_table_cells(lines[i]))
+                i += 1
+            table = doc.add_table(rows=1 + len(rows), cols=len(header))
+            table.style = _style(doc, "Table Grid")
+            for c, text in enumerate(header):
+                _add_runs(table.rows[0].cells[c].paragraphs[0], text)
+                for run in table.rows[0].cells[c].paragraphs[0].runs:
+                    run.bold = True
+            for r, row in enumerate(rows, start=1):
+                for c, text in enumerate(row[:len(header)]):
+                    _add_runs(table.rows[r].cells[c].paragraphs[0], text)
+            continue
+        heading = re.match(r"^(#{1,6})\s+(.*)$", stripped)
+        checkbox = re.match(r"^[-*+]\s+\[([ xX])\]\s+(.*)$", stripped)
+        item = re.match(r"^[-*+]\s+(.*)$", stripped)
+        if heading:
+            doc.add_heading(heading.group(2).replace("**", ""), level=min(len(heading.group(1)), 4))
+        elif checkbox:
+            _add_runs(doc.add_paragraph(style=bullet), ("☐ " if checkbox.group(1) == " " else "☑ ") + checkbox.group(2))
+        elif item:
+            _add_runs(doc.add_paragraph(style=bullet), item.group(1))
+        else:
+            _add_runs(doc.add_paragraph(), stripped)
+        i += 1
+    return doc
+
+
+def save_docx(markdown_text, path, template_path=TEMPLATE_DOCX, title=None):
+    markdown_to_docx(markdown_text, template_path, title).save(path)
+    return path
+
+
+def docx_bytes(markdown_text, template_path=TEMPLATE_DOCX, title=None):
+    import io
+    buffer = io.BytesIO()
+    markdown_to_docx(markdown_text, template_path, title).save(buffer)
+    return buffer.getvalue()
+
+
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="ko"><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: 'Helvetica Neue', Arial, sans-serif; max-width: 860px; margin: 2rem auto; color: #31333F; line-height: 1.6; }}
+h1, h2, h3 {{ color: #005bea; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th, td {{ border: 1px solid #e0e0e0; padding: 6px 10px; text-align: left; }}
+th {{ background: #f8f9fa; }}
+</style></head>
+<body>
+{body}
+</body></html>
+"""
+
+
+def markdown_to_html(markdown_text, title=""):
+    import html
+    import markdown
+    body = markdown.markdown(markdown_text, extensions=["tables"])
+    return HTML_PAGE.format(title=html.escape(title), body=body)
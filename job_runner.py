@@ -0,0 +1,539 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import student_store
+
+# Local background jobs for long tasks (Master Plan, newsletter drafting/sending).
+# Jobs are rows in a SQLite table, so status survives Streamlit reruns and browser
+# refreshes; work runs in a process pool so several students can be processed at once.
+#
+#   python job_runner.py worker        # standalone worker (e.g. for auto_sender --enqueue)
+#   python job_runner.py list          # recent jobs
+
+JOBS_DB = "jobs.db"
+JOB_FILES_DIR = "job_files" # Uploaded files copied here so a job can read them after the rerun
+EXPORTS_DIR = "exports" # Per branch; bulk export zips
+MAX_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+POLL_INTERVAL = 0.5
+MAX_ATTEMPTS = 2 # A job interrupted by a crashed worker is retried once (sends resume via the delivery log)
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+SECRETS_LOST = ("The API key / SMTP password entered in the app are kept in memory only and are gone "
+                "(app restarted or job picked up by another process); submit it again from the app")
+
+_schema_ready = set()
+
+
+def _connect(db_path=None):
+    db_path = db_path or JOBS_DB
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    if db_path not in _schema_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                student TEXT,
+                tenant TEXT,
+                payload TEXT,
+                result TEXT,
+                error TEXT,
+                progress REAL DEFAULT 0,
+                message TEXT,
+                attempts INTEGER DEFAULT 0,
+                worker_pid INTEGER,
+                secrets_pid INTEGER,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL
+            )""")
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        if "tenant" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT") # jobs.db from before branches
+        if "secrets_pid" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN secrets_pid INTEGER")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_student ON jobs (student, kind, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_tenant ON jobs (tenant, kind, created_at)")
+        _schema_ready.add(db_path)
+    return conn
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+# --- Queue API (used by app.py / auto_sender.py) ---
+def enqueue(kind, payload=None, student=None, tenant=None, secrets_pid=None):
+    """Adds a job. `secrets_pid` is the process holding the job's in-memory secrets (JobRunner.submit);
+    only that process may claim it, so it never runs with the .env credentials instead."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job_id = uuid.uuid4().hex[:12]
+    payload = dict(payload or {})
+    if tenant:
+        payload["tenant"] = tenant # Workers resolve the branch's files, footer and sender from this
+    conn = _connect()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, student, tenant, payload, secrets_pid, created_at, message) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, kind, STATUS_QUEUED, student, tenant, json.dumps(payload, ensure_ascii=False), secrets_pid,
+         time.time(), "Queued"),
+    )
+    conn.close()
+    return job_id
+
+
+def get_job(job_id):
+    conn = _connect()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return _row_to_job(row)
+
+
+def list_jobs(kind=None, student=None, statuses=None, limit=20, tenant=None):
+    query, args = "SELECT * FROM jobs WHERE 1=1", []
+    if tenant:
+        query += " AND tenant = ?"
+        args.append(tenant)
+    if kind:
+        query += " AND kind = ?"
+        args.append(kind)
+    if student is not None:
+        query += " AND student = ?"
+        args.append(student)
+    if statuses:
+        query += f" AND status IN ({', '.join('?' * len(statuses))})"
+        args.extend(statuses)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    args.append(limit)
+    conn = _connect()
+    rows = conn.execute(query, args).fetchall()
+    conn.close()
+    return [_row_to_job(r) for r in rows]
+
+
+def cancel(job_id):
+    """Cancels a job that hasn't started yet. Returns True if it was cancelled."""
+    conn = _connect()
+    cur = conn.execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, message = 'Cancelled' WHERE id = ? AND status = ?",
+        (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED),
+    )
+    conn.close()
+    return cur.rowcount > 0
+
+
+def update_progress(job_id, progress, message=None):
+    conn = _connect()
+    conn.execute("UPDATE jobs SET progress = ?, message = COALESCE(?, message) WHERE id = ?",
+                 (max(0.0, min(1.0, progress)), message, job_id))
+    conn.close()
+
+
+def update_payload(job_id, **fields):
+    """Stores intermediate results in the payload, so a requeued job resumes instead of redoing them."""
+    conn = _connect()
+    row = conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is not None:
+        payload = dict(json.loads(row["payload"]) if row["payload"] else {}, **fields)
+        conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload, ensure_ascii=False), job_id))
+    conn.close()
+
+
+def _claim_next(conn, worker_pid):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs whose secrets live in another process are left for that process
+        row = conn.execute("SELECT id FROM jobs WHERE status = ? AND (secrets_pid IS NULL OR secrets_pid = ?) "
+                           "ORDER BY created_at LIMIT 1", (STATUS_QUEUED, worker_pid)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ?, attempts = attempts + 1, message = 'Starting' "
+            "WHERE id = ?",
+            (STATUS_RUNNING, time.time(), worker_pid, row["id"]),
+        )
+        conn.execute("COMMIT")
+        return row["id"]
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _release(conn, job_id, message):
+    """Puts a claimed job that never reached a worker back in the queue; the attempt doesn't count."""
+    conn.execute("UPDATE jobs SET status = ?, worker_pid = NULL, attempts = attempts - 1, message = ? "
+                 "WHERE id = ? AND status = ?", (STATUS_QUEUED, message, job_id, STATUS_RUNNING))
+
+
+def _finish(job_id, status, result=None, error=None):
+    conn = _connect()
+    conn.execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END, "
+        "message = ? WHERE id = ?",
+        (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(),
+         status, "Done" if status == STATUS_DONE else (error or status), job_id),
+    )
+    conn.close()
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def recover_interrupted():
+    """Requeues (or fails) jobs left 'running' by a worker process that no longer exists, and fails
+    jobs whose in-memory secrets died with the process that submitted them."""
+    conn = _connect()
+    rows = conn.execute("SELECT id, status, worker_pid, secrets_pid, attempts FROM jobs WHERE status IN (?, ?)",
+                        ACTIVE_STATUSES).fetchall()
+    for row in rows:
+        if row["status"] == STATUS_QUEUED:
+            if row["secrets_pid"] and not _pid_alive(row["secrets_pid"]):
+                conn.execute("UPDATE jobs SET status = ?, error = ?, message = ?, finished_at = ? WHERE id = ?",
+                             (STATUS_FAILED, SECRETS_LOST, SECRETS_LOST, time.time(), row["id"]))
+            continue
+        if _pid_alive(row["worker_pid"]):
+            continue
+        if row["secrets_pid"]:
+            # Secrets are popped when a job is claimed, so a requeued copy could only run with .env credentials
+            conn.execute("UPDATE jobs SET status = ?, error = ?, message = ?, finished_at = ? WHERE id = ?",
+                         (STATUS_FAILED, f"Interrupted. {SECRETS_LOST}", SECRETS_LOST, time.time(), row["id"]))
+        elif row["attempts"] < MAX_ATTEMPTS:
+            conn.execute("UPDATE jobs SET status = ?, message = 'Requeued after interruption' WHERE id = ?",
+                         (STATUS_QUEUED, row["id"]))
+        else:
+            conn.execute("UPDATE jobs SET status = ?, error = 'Interrupted', finished_at = ? WHERE id = ?",
+                         (STATUS_FAILED, time.time(), row["id"]))
+    conn.close()
+
+
+def stage_files(selected_filenames, available_files):
+    """Maps selected labels to paths a worker process can open; new uploads are copied to JOB_FILES_DIR."""
+    staged = {}
+    staging_dir = None
+    for label in selected_filenames or []:
+        source = available_files[label]
+        if isinstance(source, str):
+            staged[label] = source
+            continue
+        if staging_dir is None:
+            staging_dir = os.path.join(JOB_FILES_DIR, uuid.uuid4().hex[:12])
+            os.makedirs(staging_dir, exist_ok=True)
+        staged[label], _, _ = student_store.spool_upload(source, staging_dir)
+    return staged
+
+
+# --- Execution (runs inside pool worker processes) ---
+def _execute(job_id, db_path, secrets):
+    global JOBS_DB
+    JOBS_DB = db_path
+    job = get_job(job_id)
+    if job is None:
+        return
+    conn = _connect()
+    conn.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (os.getpid(), job_id))
+    conn.close()
+    if job["secrets_pid"] and not secrets:
+        _finish(job_id, STATUS_FAILED, error=SECRETS_LOST)
+        return
+    try:
+        result = JOB_KINDS[job["kind"]](job_id, job["payload"], secrets or {})
+        _finish(job_id, STATUS_DONE, result=result)
+    except Exception as e:
+        _finish(job_id, STATUS_FAILED, error=f"{type(e).__name__}: {e}")
+    _remove_staged(job["payload"].get("files"))
+
+
+def _remove_staged(files):
+    """Deletes the staging folders of a finished job (saved student docs are left alone)."""
+    staging_root = os.path.abspath(JOB_FILES_DIR)
+    for path in set(os.path.dirname(os.path.abspath(p)) for p in (files or {}).values()):
+        if os.path.dirname(path) == staging_root:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _secret(secrets, name, tenant=None):
+    if secrets.get(name):
+        return secrets[name]
+    if tenant and name in ("SENDER_EMAIL", "SENDER_PASSWORD"):
+        import tenants
+        sender_email, sender_password = tenants.get_tenant(tenant).sender_credentials()
+        return sender_email if name == "SENDER_EMAIL" else sender_password
+    return os.getenv(name)
+
+
+def run_master_plan_job(job_id, payload, secrets):
+    import llm_client
+    import request_builder
+
+    update_progress(job_id, 0.1, "Preparing documents")
+    available_files = payload.get("files", {})
+    content_parts = request_builder.build_master_plan_request(
+        payload["student_name"], payload["student_grade"], payload.get("target_university", ""),
+        payload.get("intended_major", ""), payload.get("current_status", ""),
+        list(available_files), available_files)
+
+    update_progress(job_id, 0.3, "Generating Master Plan (Gemini 3 Pro)")
+    response = llm_client.get_client(_secret(secrets, "GOOGLE_API_KEY")).generate(
+        payload.get("model", "gemini-3-pro-preview"), content_parts, timeout=300,
+        call_site="master_plan", tags={"student": payload["student_name"], "grade": payload["student_grade"]})
+    # Replacing <br-> just in case it's a model artifact
+    text = response.text.replace("<br->", "<br>- ")
+    # Saved per student so it can be reopened and exported (bulk_export.py)
+    plan_path = student_store.save_plan(payload["student_name"], text, payload.get("tenant"))
+    return {"text": text, "plan_path": plan_path}
+
+
+def run_newsletter_draft_job(job_id, payload, secrets):
+    """New draft, or regenerate payload["grades"] (default: every section not ok) of payload["draft"]."""
+    import newsletter_utils
+
+    month = payload["month"]
+    draft = payload.get("draft") or newsletter_utils.new_draft(month, payload.get("grades"), payload.get("tenant"))
+    grades = payload.get("grades") if payload.get("draft") else None
+    update_progress(job_id, 0.05, f"Generating {month} content")
+    newsletter_utils.fill_draft(
+        _secret(secrets, "GOOGLE_API_KEY"), draft, grades,
+        on_progress=lambda done, total, section: update_progress(
+            job_id, done / total, f"{section['grade']}: {section['status']}"))
+    ready = newsletter_utils.draft_ready(draft)
+    return {"month": month, "draft": draft, "ready": ready, "body": newsletter_utils.draft_body(draft) if ready else None}
+
+
+def run_newsletter_send_job(job_id, payload, secrets):
+    import newsletter_utils
+
+    tenant = payload.get("tenant")
+    recipients = payload.get("recipients") or newsletter_utils.load_subscribers(tenant)
+    update_progress(job_id, 0.1, f"Sending to {len(recipients)} recipients")
+    # Delivered addresses are logged as they go, so a requeued (interrupted) job only sends the rest
+    success, msg, metrics = newsletter_utils.send_email(
+        _secret(secrets, "SENDER_EMAIL", tenant), _secret(secrets, "SENDER_PASSWORD", tenant),
+        recipients, payload["subject"], payload["body"],
+        delivery_log=newsletter_utils.delivery_log_path(payload["subject"], payload["body"], tenant), tenant=tenant)
+    result = {"success": success, "message": msg, "metrics": metrics}
+    if not success:
+        raise RuntimeError(msg)
+    return result
+
+
+def run_monthly_newsletter_job(job_id, payload, secrets):
+    """Draft + send in one job (what auto_sender.py does inline). Nothing is sent unless every grade succeeded."""
+    import newsletter_utils
+
+    month = payload["month"]
+    body = payload.get("body") # Set once drafted: a requeued job resends the same text, not a new draft
+    if body is None:
+        draft = newsletter_utils.new_draft(month, payload.get("grades"), payload.get("tenant"))
+        update_progress(job_id, 0.05, f"Generating {month} content")
+        newsletter_utils.complete_draft(
+            _secret(secrets, "GOOGLE_API_KEY"), draft,
+            on_progress=lambda done, total, section: update_progress(
+                job_id, 0.5 * done / total, f"{section['grade']}: {section['status']}"))
+        if not newsletter_utils.draft_ready(draft):
+            raise RuntimeError(f"Draft incomplete, not sending ({newsletter_utils.draft_summary(draft)})")
+        body = newsletter_utils.draft_body(draft)
+        update_payload(job_id, body=body)
+    return run_newsletter_send_job(job_id, {
+        "subject": newsletter_utils.newsletter_subject(month),
+        "body": body,
+        "recipients": payload.get("recipients"),
+        "tenant": payload.get("tenant"),
+    }, secrets)
+
+
+def run_bulk_export_job(job_id, payload, secrets):
+    import tenants
+    import bulk_export
+
+    tenant = tenants.get_tenant(payload.get("tenant"))
+    export_dir = tenant.path(EXPORTS_DIR)
+    os.makedirs(export_dir, exist_ok=True)
+    out_path = os.path.join(export_dir, f"export_{time.strftime('%Y%m%d-%H%M%S')}.zip")
+    summary = bulk_export.export_bundle(
+        out_path, tenant.id, payload.get("formats") or bulk_export.FORMATS,
+        on_progress=lambda done, total, name: update_progress(job_id, done / total, f"Exported {done}/{total}"))
+    return dict(summary, path=out_path)
+
+
+JOB_KINDS = {
+    "master_plan": run_master_plan_job,
+    "newsletter_draft": run_newsletter_draft_job,
+    "newsletter_send": run_newsletter_send_job,
+    "monthly_newsletter": run_monthly_newsletter_job,
+    "bulk_export": run_bulk_export_job,
+}
+
+
+# --- Runner (dispatcher thread + process pool) ---
+class JobRunner:
+    def __init__(self, max_workers=MAX_WORKERS, db_path=None):
+        self.max_workers = max_workers
+        self.db_path = os.path.abspath(db_path or JOBS_DB)
+        self._pool = self._new_pool()
+        self._pool_broken = threading.Event()
+        self._secrets = {}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _new_pool(self):
+        # "spawn" keeps workers independent of the Streamlit server's threads
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _restart_pool(self):
+        """A worker that dies (OOM, segfault in a native lib) breaks the whole executor for good,
+        so every later submit would fail; swap in a fresh pool."""
+        print("--- ⚙️ Job worker pool broken; starting new worker processes ---")
+        with self._lock:
+            old, self._pool = self._pool, self._new_pool()
+            self._pool_broken.clear()
+        old.shutdown(wait=False)
+
+    def start(self):
+        if self._thread is None:
+            recover_interrupted()
+            self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, kind, payload=None, student=None, secrets=None, tenant=None):
+        """Enqueues a job. Secrets (API key, SMTP password) stay in memory and are never stored;
+        such a job is only claimed by this process, and fails (rather than falling back to .env) if they are lost."""
+        if not secrets:
+            return enqueue(kind, payload, student, tenant)
+        with self._lock: # Held until the secrets are stored, so the dispatcher can't claim the job first
+            job_id = enqueue(kind, payload, student, tenant, secrets_pid=os.getpid())
+            self._secrets[job_id] = secrets
+        return job_id
+
+    def _dispatch_loop(self):
+        conn = _connect(self.db_path)
+        while not self._stop.is_set():
+            try:
+                if self._pool_broken.is_set():
+                    self._restart_pool()
+                with self._lock:
+                    free = self.max_workers - len(self._running)
+                claimed = False
+                if free > 0:
+                    job_id = _claim_next(conn, os.getpid())
+                    if job_id:
+                        claimed = True
+                        with self._lock:
+                            secrets = self._secrets.pop(job_id, None)
+                            pool = self._pool
+                        try:
+                            future = pool.submit(_execute, job_id, self.db_path, secrets)
+                        except BrokenProcessPool:
+                            # Broke before the done callback flagged it: hand the job (and its secrets) back
+                            with self._lock:
+                                if secrets:
+                                    self._secrets[job_id] = secrets
+                            _release(conn, job_id, "Requeued (worker pool restarted)")
+                            self._restart_pool()
+                            continue
+                        with self._lock:
+                            self._running[job_id] = future
+                        future.add_done_callback(lambda f, j=job_id, p=pool: self._done(j, f, p))
+                if not claimed:
+                    self._stop.wait(POLL_INTERVAL)
+            except Exception as e:
+                print(f"Job dispatcher error: {e}")
+                self._stop.wait(POLL_INTERVAL)
+        conn.close()
+
+    def _done(self, job_id, future, pool):
+        with self._lock:
+            self._running.pop(job_id, None)
+        error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                if pool is self._pool:
+                    self._pool_broken.set() # The dispatcher replaces it before claiming the next job
+        if error is not None:
+            # The worker process died (e.g. killed) before recording an outcome
+            job = get_job(job_id)
+            if job and job["status"] == STATUS_RUNNING:
+                _finish(job_id, STATUS_FAILED, error=f"Worker crashed: {error}")
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._pool.shutdown(wait=wait)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Process-wide runner, started on first use."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner().start()
+        return _runner
+
+
+def wait_for(job_id, timeout=None, poll=POLL_INTERVAL):
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        job = get_job(job_id)
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return job
+        if deadline and time.monotonic() > deadline:
+            return job
+        time.sleep(poll)
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'), override=True)
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "worker"
+    if command == "worker":
+        print(f"--- ⚙️ Job worker started ({MAX_WORKERS} processes, db={JOBS_DB}) ---")
+        runner = JobRunner().start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            runner.stop()
+    elif command == "list":
+        for job in list_jobs(limit=50):
+            print(f"{job['id']}  {job['kind']:<18} {job['status']:<9} {job['progress']:.0%}  "
+                  f"{job['tenant'] or '-':<10} {job['student'] or '-':<20} {job['message'] or ''}")
+    else:
+        print("Usage: python job_runner.py [worker|list]")
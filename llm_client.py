@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import llm_metrics
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+
+# Shared Gemini client used by app.py, newsletter_utils.py and auto_sender.py.
+# - genai.configure() runs once per API key (not per call)
+# - each model gets its own thread pool so a slow Pro call doesn't starve Flash
+# - every call has a deadline and retries transient errors with backoff
+# - identical in-flight requests are coalesced into one API call
+# Set LLM_BACKEND=fake to run everything offline with canned responses.
+
+DEFAULT_TIMEOUT = 120       # seconds, whole call including retries
+DEFAULT_RETRIES = 2         # extra attempts after the first one
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 10.0
+MAX_WORKERS_PER_MODEL = 4
+UPLOAD_TTL = 40 * 3600      # File API deletes uploads after 48h; re-upload well before that
+UPLOAD_EXPIRY_MARGIN = 3600 # ...or this long before the expiration_time the API reports
+
+# Matched by class name so we don't have to import google.api_core up front
+RETRYABLE_ERRORS = (
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "RetryError",
+    "TimeoutError", "ConnectionError", "ConnectionResetError", "RemoteDisconnected",
+)
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMTimeout(LLMError):
+    pass
+
+
+def is_retryable(error):
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def _normalize(part):
+    if isinstance(part, (bytes, bytearray, memoryview)):
+        return {"sha256": hashlib.sha256(part).hexdigest(), "size": len(part)}
+    if isinstance(part, dict):
+        return {k: _normalize(v) for k, v in sorted(part.items())}
+    if isinstance(part, (list, tuple)):
+        return [_normalize(p) for p in part]
+    if isinstance(part, (str, int, float, bool)) or part is None:
+        return part
+    return repr(part)
+
+
+def is_missing_file(error):
+    """An uploaded file the request referenced is gone (deleted or expired on the server)."""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    return "NotFound" in names or ("PermissionDenied" in names and "file" in str(error).lower())
+
+
+def request_key(model_name, contents):
+    """Stable hash of a request; attachment bytes are hashed, not serialized."""
+    payload = json.dumps([model_name, _normalize(contents)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --- Backends ---
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._models = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model_name):
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = self._genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def _upload(self, part, cached_keys):
+        # One File API upload per file version (until it nears expiry); the SDK streams it from disk
+        key = (part["path"], part.get("size"), part.get("sha256") or os.path.getmtime(part["path"]))
+        with self._lock:
+            uploaded, expires_at = self._uploads.get(key, (None, 0))
+        if uploaded is not None and time.time() < expires_at:
+            cached_keys.append(key)
+            return uploaded
+        uploaded = self._genai.upload_file(part["path"], mime_type=part["mime_type"])
+        expiration = getattr(uploaded, "expiration_time", None)
+        expires_at = time.time() + UPLOAD_TTL
+        if hasattr(expiration, "timestamp"):
+            expires_at = min(expires_at, expiration.timestamp() - UPLOAD_EXPIRY_MARGIN)
+        with self._lock:
+            self._uploads[key] = (uploaded, expires_at)
+        return uploaded
+
+    def _resolve_files(self, contents, cached_keys):
+        """Replaces {"path": ...} attachment references with uploaded File API handles;
+        keys of handles reused from the cache are appended to cached_keys."""
+        if isinstance(contents, dict):
+            if "path" in contents and "data" not in contents:
+                return self._upload(contents, cached_keys)
+            if "parts" in contents:
+                return dict(contents, parts=self._resolve_files(contents["parts"], cached_keys))
+            return contents
+        if isinstance(contents, (list, tuple)):
+            return [self._resolve_files(p, cached_keys) for p in contents]
+        return contents
+
+    def generate(self, model_name, contents, timeout):
+        cached_keys = []
+        try:
+            return self._model(model_name).generate_content(self._resolve_files(contents, cached_keys),
+                                                            request_options={"timeout": timeout})
+        except Exception as e:
+            if not cached_keys or not is_missing_file(e):
+                raise
+            # A cached handle was deleted server-side: drop it and upload again, once
+            with self._lock:
+                for key in cached_keys:
+                    self._uploads.pop(key, None)
+            return self._model(model_name).generate_content(self._resolve_files(contents, []),
+                                                            request_options={"timeout": timeout})
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens=0):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt_tokens, max(1, len(text) // 4))
+
+
+def _text_length(contents):
+    if isinstance(contents, str):
+        return len(contents)
+    if isinstance(contents, dict):
+        if "parts" in contents:
+            return _text_length(contents["parts"])
+        return 0
+    if isinstance(contents, (list, tuple)):
+        return sum(_text_length(c) for c in contents)
+    return 0
+
+
+class FakeBackend:
+    """Offline stand-in for Gemini. `responder(model_name, contents)` returns the reply text.
+    record_calls=False only counts calls (load tests), instead of keeping every request."""
+    name = "fake"
+
+    def __init__(self, responder=None, latency=0.0, jitter=0.0, fail_first=0, error=None, record_calls=True):
+        self.responder = responder
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_first = fail_first
+        self.error = error or ConnectionError
+        self.record_calls = record_calls
+        self.calls = []
+        self.call_count = 0
+        self._lock = threading.Lock()
+
+    def generate(self, model_name, contents, timeout):
+        with self._lock:
+            if self.record_calls:
+                self.calls.append((model_name, contents))
+            self.call_count += 1
+            attempt = self.call_count
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake backend exceeded {timeout:.1f}s")
+        if delay:
+            time.sleep(delay)
+        if attempt <= self.fail_first:
+            raise self.error("fake backend failure")
+        if self.responder:
+            text = self.responder(model_name, contents)
+        else:
+            text = f"# Fake response from {model_name}\n\n- [ ] Item one\n\n### Consultant's Tip\n**Stay consistent.**"
+        return FakeResponse(text, prompt_tokens=_text_length(contents) // 4)
+
+
+# --- Client ---
+class LLMClient:
+    def __init__(self, backend, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, max_workers=MAX_WORKERS_PER_MODEL):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.max_workers = max_workers
+        self._executors = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _executor(self, model_name):
+        with self._lock:
+            if model_name not in self._executors:
+                self._executors[model_name] = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=f"llm-{model_name}"
+                )
+            return self._executors[model_name]
+
+    def _call_with_retries(self, model_name, contents, timeout, retries, stats):
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            stats["attempts"] = attempt + 1
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeout(f"{model_name}: deadline of {timeout}s exceeded")
+            try:
+                return self.backend.generate(model_name, contents, remaining)
+            except Exception as e:
+                if attempt >= retries or not is_retryable(e):
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                print(f"LLM call to {model_name} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def submit(self, model_name, contents, timeout=None, retries=None, coalesce=True, call_site=None, tags=None):
+        """Schedules a call and returns a Future; identical in-flight requests share one Future.
+
+        `call_site` and `tags` (student/grade) are recorded with the call's usage metrics.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        key = request_key(model_name, contents) if coalesce else None
+
+        if key:
+            with self._lock:
+                existing = self._inflight.get(key)
+                if existing is not None:
+                    return existing
+                future = Future()
+                self._inflight[key] = future
+        else:
+            future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            stats = {"attempts": 0}
+            started = time.perf_counter()
+            try:
+                response = self._call_with_retries(model_name, contents, timeout, retries, stats)
+            except BaseException as e:
+                llm_metrics.record(call_site, model_name, contents, error=e,
+                                   wall_s=time.perf_counter() - started, attempts=stats["attempts"], tags=tags)
+                future.set_exception(e)
+            else:
+                llm_metrics.record(call_site, model_name, contents, response=response,
+                                   wall_s=time.perf_counter() - started, attempts=stats["attempts"], tags=tags)
+                future.set_result(response)
+            finally:
+                if key:
+                    with self._lock:
+                        if self._inflight.get(key) is future:
+                            del self._inflight[key]
+
+        try:
+            self._executor(model_name).submit(run)
+        except Exception:
+            if key:
+                with self._lock:
+                    self._inflight.pop(key, None)
+            raise
+        return future
+
+    def generate(self, model_name, contents, timeout=None, retries=None, coalesce=True, call_site=None, tags=None):
+        """Blocking call. Raises LLMTimeout if the deadline passes."""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(model_name, contents, timeout=timeout, retries=retries, coalesce=coalesce,
+                             call_site=call_site, tags=tags)
+        try:
+            return future.result(timeout=timeout + 1)
+        except FutureTimeout:
+            raise LLMTimeout(f"{model_name}: no response within {timeout}s")
+
+    async def agenerate(self, model_name, contents, timeout=None, retries=None, coalesce=True, call_site=None, tags=None):
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(model_name, contents, timeout=timeout, retries=retries, coalesce=coalesce,
+                             call_site=call_site, tags=tags)
+        import asyncio # Only async callers pay for the import
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout + 1)
+        except asyncio.TimeoutError:
+            raise LLMTimeout(f"{model_name}: no response within {timeout}s")
+
+    def generate_text(self, model_name, contents, **kwargs):
+        return self.generate(model_name, contents, **kwargs).text
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+
+# --- Singleton ---
+_client = None
+_client_key = None
+_client_pinned = False
+_client_lock = threading.Lock()
+
+
+def get_client(api_key=None):
+    """Returns the process-wide client, (re)configuring it only when the API key changes."""
+    global _client, _client_key
+    use_fake = os.getenv("LLM_BACKEND", "").lower() == "fake"
+    key = "fake" if use_fake else api_key
+    with _client_lock:
+        if _client is not None and (_client_pinned or _client_key == key or (api_key is None and not use_fake)):
+            return _client
+        if use_fake:
+            backend = FakeBackend()
+        elif api_key:
+            backend = GeminiBackend(api_key)
+        else:
+            raise LLMError("API Key Missing")
+        if _client is not None:
+            _client.shutdown()
+        _client = LLMClient(backend)
+        _client_key = key
+        return _client
+
+
+def set_backend(backend, **client_kwargs):
+    """Pins a specific backend (e.g. FakeBackend) as the shared client until reset_client()."""
+    global _client, _client_key, _client_pinned
+    with _client_lock:
+        if _client is not None:
+            _client.shutdown()
+        _client = LLMClient(backend, **client_kwargs)
+        _client_key = getattr(backend, "name", "custom")
+        _client_pinned = True
+        return _client
+
+
+def reset_client():
+    global _client, _client_key, _client_pinned
+    with _client_lock:
+        if _client is not None:
+            _client.shutdown()
+        _client = None
+        _client_key = None
+        _client_pinned = False
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import threading
+
+# Per-call usage & latency metrics for every model call made through llm_client.
+# Sink is chosen by LLM_METRICS_SINK:
+#   "sqlite:<path>" (default sqlite:usage_metrics.db), "jsonl:<path>", or "off"
+# Set LLM_METRICS_PROM_PORT to also serve a Prometheus text endpoint.
+
+DEFAULT_SINK = "sqlite:usage_metrics.db"
+
+FIELDS = [
+    "ts", "call_site", "model", "student", "grade", "status", "error",
+    "wall_ms", "attempts", "prompt_tokens", "output_tokens", "total_tokens",
+    "prompt_chars", "attachment_bytes", "attachments",
+]
+
+_lock = threading.Lock()
+_initialized = set()
+
+
+def _sink():
+    spec = os.getenv("LLM_METRICS_SINK", DEFAULT_SINK)
+    if spec == "off":
+        return None, None
+    kind, _, path = spec.partition(":")
+    if kind not in ("sqlite", "jsonl") or not path:
+        kind, path = "sqlite", spec
+    return kind, path
+
+
+def _connect(path):
+    import sqlite3
+    conn = sqlite3.connect(path, timeout=5)
+    if path not in _initialized:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL, call_site TEXT, model TEXT, student TEXT, grade TEXT,
+                status TEXT, error TEXT, wall_ms REAL, attempts INTEGER,
+                prompt_tokens INTEGER, output_tokens INTEGER, total_tokens INTEGER,
+                prompt_chars INTEGER, attachment_bytes INTEGER, attachments INTEGER
+            )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_ts ON llm_calls (ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_site ON llm_calls (call_site, model)")
+        _initialized.add(path)
+    return conn
+
+
+def measure_contents(contents):
+    """Returns (prompt_chars, attachment_bytes, attachment_count) for a generate_content payload."""
+    chars = nbytes = count = 0
+    stack = [contents]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            chars += len(item)
+        elif isinstance(item, dict):
+            if "parts" in item:
+                stack.append(item["parts"])
+            elif "data" in item:
+                nbytes += len(item["data"])
+                count += 1
+            elif "size" in item:
+                nbytes += item["size"] or 0
+                count += 1
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif hasattr(item, "size_bytes"):
+            nbytes += item.size_bytes or 0
+            count += 1
+    return chars, nbytes, count
+
+
+def usage_from_response(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None, None
+    prompt = getattr(usage, "prompt_token_count", None)
+    output = getattr(usage, "candidates_token_count", None)
+    total = getattr(usage, "total_token_count", None)
+    if total is None and prompt is not None and output is not None:
+        total = prompt + output
+    return prompt, output, total
+
+
+def record(call_site, model, contents, response=None, error=None, wall_s=0.0, attempts=1, tags=None):
+    tags = tags or {}
+    prompt_chars, attachment_bytes, attachments = measure_contents(contents)
+    prompt_tokens, output_tokens, total_tokens = usage_from_response(response)
+    row = {
+        "ts": time.time(),
+        "call_site": call_site or "unknown",
+        "model": model,
+        "student": tags.get("student") or "",
+        "grade": tags.get("grade") or "",
+        "status": "error" if error is not None else "ok",
+        "error": type(error).__name__ if error is not None else "",
+        "wall_ms": round(wall_s * 1000, 1),
+        "attempts": attempts,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+        "prompt_chars": prompt_chars,
+        "attachment_bytes": attachment_bytes,
+        "attachments": attachments,
+    }
+    write(row)
+    return row
+
+
+def write(row):
+    kind, path = _sink()
+    if kind is None:
+        return
+    try:
+        with _lock:
+            if kind == "jsonl":
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            else:
+                conn = _connect(path)
+                with conn:
+                    conn.execute(
+                        f"INSERT INTO llm_calls ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})",
+                        [row[k] for k in FIELDS],
+                    )
+                conn.close()
+    except Exception as e:
+        print(f"Error writing LLM metrics: {e}")
+
+
+def dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+def load_records(since=None):
+    kind, path = _sink()
+    if kind is None or not os.path.exists(path):
+        return []
+    since = since or 0
+    try:
+        if kind == "jsonl":
+            rows = []
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        if row.get("ts", 0) >= since:
+                            rows.append(row)
+            return rows
+        with _lock:
+            conn = _connect(path)
+            conn.row_factory = dict_row
+            rows = list(conn.execute("SELECT * FROM llm_calls WHERE ts >= ? ORDER BY ts", (since,)))
+            conn.close()
+        return rows
+    except Exception as e:
+        print(f"Error reading LLM metrics: {e}")
+        return []
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(since=None, group_by=("call_site", "model")):
+    """Aggregates records per group: calls, errors, p50/p95 latency and token spend."""
+    groups = {}
+    for row in load_records(since):
+        key = tuple(row.get(g) or "" for g in group_by)
+        groups.setdefault(key, []).append(row)
+
+    summary = []
+    for key, rows in sorted(groups.items()):
+        latencies = [r["wall_ms"] for r in rows if r.get("wall_ms") is not None]
+        item = dict(zip(group_by, key))
+        item.update({
+            "calls": len(rows),
+            "errors": sum(1 for r in rows if r.get("status") == "error"),
+            "p50_ms": round(percentile(latencies, 50) or 0, 1),
+            "p95_ms": round(percentile(latencies, 95) or 0, 1),
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in rows),
+            "output_tokens": sum(r.get("output_tokens") or 0 for r in rows),
+            "attachment_mb": round(sum(r.get("attachment_bytes") or 0 for r in rows) / 1e6, 2),
+        })
+        summary.append(item)
+    return summary
+
+
+# --- Prometheus text exporter ---
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in labels.items()) + "}"
+
+
+def export_prometheus(since=None):
+    lines = [
+        "# HELP llm_calls_total Model calls by call site, model and status.",
+        "# TYPE llm_calls_total counter",
+    ]
+    rows = load_records(since)
+    counts, tokens, latencies = {}, {}, {}
+    for r in rows:
+        site, model = r.get("call_site") or "unknown", r.get("model") or ""
+        counts[(site, model, r.get("status"))] = counts.get((site, model, r.get("status")), 0) + 1
+        t = tokens.setdefault((site, model), [0, 0, 0])
+        t[0] += r.get("prompt_tokens") or 0
+        t[1] += r.get("output_tokens") or 0
+        t[2] += r.get("attachment_bytes") or 0
+        latencies.setdefault((site, model), []).append((r.get("wall_ms") or 0) / 1000.0)
+
+    for (site, model, status), n in sorted(counts.items()):
+        lines.append(f"llm_calls_total{_labels(call_site=site, model=model, status=status)} {n}")
+    for metric, idx, help_text in (
+        ("llm_prompt_tokens_total", 0, "Prompt tokens sent."),
+        ("llm_output_tokens_total", 1, "Output tokens received."),
+        ("llm_attachment_bytes_total", 2, "Inline attachment bytes sent."),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for (site, model), t in sorted(tokens.items()):
+            lines.append(f"{metric}{_labels(call_site=site, model=model)} {t[idx]}")
+    lines += ["# HELP llm_latency_seconds Wall time per model call.", "# TYPE llm_latency_seconds summary"]
+    for (site, model), values in sorted(latencies.items()):
+        for q in (0.5, 0.95, 0.99):
+            lines.append(f"llm_latency_seconds{_labels(call_site=site, model=model, quantile=q)} {percentile(values, q * 100):.4f}")
+        lines.append(f"llm_latency_seconds_sum{_labels(call_site=site, model=model)} {sum(values):.4f}")
+        lines.append(f"llm_latency_seconds_count{_labels(call_site=site, model=model)} {len(values)}")
+    return "\n".join(lines) + "\n"
+
+
+_prom_server = None
+
+
+def serve_prometheus(port=None):
+    """Starts a background /metrics endpoint once per process. Returns the port or None."""
+    global _prom_server
+    port = port or os.getenv("LLM_METRICS_PROM_PORT")
+    if not port or _prom_server is not None:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = export_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        _prom_server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+    except OSError as e:
+        print(f"Prometheus exporter not started: {e}")
+        return None
+    threading.Thread(target=_prom_server.serve_forever, daemon=True).start()
+    return int(port)
+
+
+if __name__ == "__main__":
+    import sys
+    if "--prometheus" in sys.argv:
+        print(export_prometheus(), end="")
+    else:
+        for item in summarize():
+            print(item)
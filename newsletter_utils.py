@@ -1,65 +1,100 @@
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import google.generativeai as genai
-import pandas as pd
+import re
+import csv
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import llm_client
+import tenants
+import plan_template
 from datetime import datetime
-import markdown
-import base64
+# smtplib, markdown, PIL and email are imported inside the send path so that
+# auto_sender / the app's email tab don't pay for them just to load the subscriber CSV.
 
 SUBSCRIBERS_FILE = "newsletter_subscribers.csv"
+MAX_REPAIR_ROUNDS = 2 # Section-level re-requests per plan before it is accepted as is
+MAX_PLAN_GENERATIONS = 2 # Whole-plan generations when a section can't be located for repair
+MAX_SECTION_ATTEMPTS = 3 # Whole-grade generations per draft section in unattended runs
+DRAFT_WORKERS = 4 # Grades generated concurrently
 
-def load_subscribers():
-    if not os.path.exists(SUBSCRIBERS_FILE):
+def subscribers_file(tenant=None):
+    # None keeps the original single-branch file
+    return tenants.get_tenant(tenant).subscribers_file if tenant else SUBSCRIBERS_FILE
+
+def load_subscribers(tenant=None):
+    path = subscribers_file(tenant)
+    if not os.path.exists(path):
         return []
     try:
-        df = pd.read_csv(SUBSCRIBERS_FILE)
-        # Ensure all are strings and strip whitespace
-        return [str(e).strip() for e in df['email'].tolist() if pd.notna(e)]
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if "email" not in (reader.fieldnames or []):
+                return []
+            # Ensure all are strings and strip whitespace
+            return [e.strip() for e in (row.get("email") or "" for row in reader) if e.strip()]
     except Exception:
         return []
 
-def save_subscriber(email):
-    return save_subscribers([email]) > 0
+def _write_subscribers(emails, tenant=None):
+    if tenant:
+        tenants.get_tenant(tenant).ensure_dirs()
+    with open(subscribers_file(tenant), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["email"])
+        writer.writerows([e] for e in emails)
+
+def save_subscriber(email, tenant=None):
+    return save_subscribers([email], tenant) > 0
 
-def save_subscribers(email_list):
-    current_emails = load_subscribers()
+def save_subscribers(email_list, tenant=None):
+    current_emails = load_subscribers(tenant)
+    existing = set(current_emails)
     added_count = 0
     for email in email_list:
         email = str(email).strip()
-        if email and email not in current_emails:
+        if email and email not in existing:
             current_emails.append(email)
+            existing.add(email)
             added_count += 1
             
     if added_count > 0:
-        df = pd.DataFrame({'email': current_emails})
-        df.to_csv(SUBSCRIBERS_FILE, index=False)
+        _write_subscribers(current_emails, tenant)
     return added_count
 
-def remove_subscriber(email):
-    return remove_subscribers([email])
+def remove_subscriber(email, tenant=None):
+    return remove_subscribers([email], tenant)
 
-def remove_subscribers(email_list):
-    current_emails = load_subscribers()
+def remove_subscribers(email_list, tenant=None):
+    current_emails = load_subscribers(tenant)
     # Normalize removal list too
-    targets = [str(e).strip() for e in email_list]
+    targets = {str(e).strip() for e in email_list}
     
     # Filter out emails to be removed
     new_emails = [e for e in current_emails if e not in targets]
     
     if len(new_emails) != len(current_emails):
-        df = pd.DataFrame({'email': new_emails})
-        df.to_csv(SUBSCRIBERS_FILE, index=False)
+        _write_subscribers(new_emails, tenant)
         return True
     return False
 
 def generate_monthly_plan(api_key, grade, month_name):
-    if not api_key: return "API Key Missing"
+    """Preview helper: the plan text, or the error as text (drafts use build_monthly_plan)."""
+    try:
+        return build_monthly_plan(api_key, grade, month_name)[0]
+    except Exception as e:
+        return f"Error generating content: {e}"
+
+def build_monthly_plan(api_key, grade, month_name):
+    """Generates and repairs one grade's plan. Returns (text, remaining problems); raises on API errors."""
+    if not api_key:
+        raise ValueError("API Key Missing")
     
-    genai.configure(api_key=api_key)
     # Using 'gemini-3-flash-preview' as defined in app.py for the Chatbot
-    model = genai.GenerativeModel('gemini-3-flash-preview') 
+    model_name = 'gemini-3-flash-preview'
+    template = plan_template.load_template() # Section layout comes from the Guide DOCX
     
     prompt = f"""
     You are an expert US College Admissions Consultant (Elite Level).
@@ -69,80 +104,383 @@ def generate_monthly_plan(api_key, grade, month_name):
     Create a highly motivating, professional 'Monthly Action Plan' for this specific month.
     
     Structure:
-    0. **Title**: # {month_name} Monthly Action Plan
-    1. **Greeting**: Start with "Welcome, {grade} Students." followed by a motivating opening about where they are in the academic year (e.g., "pivotal milestone", "halfway mark").
-    2. **Target Focus** (1 clear headline starting with "Target Focus:")
-    3. **Checklist** (3-4 specific, actionable items. MUST use bulleted checkboxes format: "- [ ] Item text...")
-    4. **Consultant's Tip** (Headline: "### Consultant's Tip", followed by bold advice)
+    {plan_template.prompt_structure(grade, month_name, template)}
     
     IMPORTANT: Do NOT use strikethrough (~~text~~) formatting. If something is important, use **Bold** instead.
     Output in English. Use Markdown formatting.
     """
     
+    client = llm_client.get_client(api_key)
+    for _ in range(MAX_PLAN_GENERATIONS):
+        response = client.generate(model_name, prompt, call_site="monthly_plan", tags={"grade": grade})
+        text = response.text
+        try:
+            text = repair_monthly_plan(client, model_name, grade, month_name, text, template)
+            break
+        except plan_template.SectionNotFound as e:
+            print(f"   🔁 {grade}: {e}, regenerating the whole plan")
+    return text, plan_template.validate_plan(text, template)
+
+def repair_monthly_plan(client, model_name, grade, month_name, text, template=None, rounds=MAX_REPAIR_ROUNDS):
+    """Re-requests only the parts validate_plan() flags, instead of regenerating the whole plan.
+    Raises plan_template.SectionNotFound when a flagged section has no heading to splice into."""
+    for _ in range(rounds):
+        problems = plan_template.validate_plan(text, template)
+        if not problems:
+            break
+        missing = [k for k in plan_template.unlocated_sections(text, template) if k in problems]
+        if missing:
+            raise plan_template.SectionNotFound(
+                f"{', '.join(plan_template.part_label(k, template) for k in missing)} not found in the plan")
+        for key, problem in problems.items():
+            print(f"   🔧 Repairing {grade} / {plan_template.part_label(key, template)}: {problem}")
+            prompt = plan_template.repair_prompt(key, problem, grade, month_name, text, template)
+            response = client.generate(model_name, prompt, call_site="monthly_plan_repair",
+                                       tags={"grade": grade, "section": key})
+            text = plan_template.splice_section(text, key, response.text, template)
+    return text
+
+# --- Monthly Newsletter Draft (shared by app.py STAGE 1, auto_sender, the scheduler and the job runner) ---
+# A draft is a JSON-able dict with one section per grade. Each section carries its own status,
+# so a failed or malformed grade is regenerated on its own while the good ones are kept,
+# and the email can only be assembled once every section is "ok".
+NEWSLETTER_GRADES = ["9th Grade", "10th Grade", "11th Grade", "12th Grade"]
+
+NEWSLETTER_FOOTER = tenants.SUWANEE_FOOTER # Signature of the original branch; see tenants.json for others
+
+SECTION_PENDING = "pending"
+SECTION_OK = "ok"
+SECTION_INVALID = "invalid" # Generated, but still off-template after repair
+SECTION_FAILED = "failed"   # The API call failed
+
+def newsletter_subject(month_name):
+    return f"[{month_name}] Monthly Academic Master Plan"
+
+def new_draft(month_name, grades=None, tenant=None):
+    return {
+        "month": month_name,
+        "tenant": tenant,
+        "sections": [{"grade": g, "status": SECTION_PENDING, "content": "", "error": None, "problems": {},
+                      "attempts": 0, "edited": False} for g in grades or NEWSLETTER_GRADES],
+    }
+
+def pending_sections(draft):
+    return [s["grade"] for s in draft["sections"] if s["status"] != SECTION_OK]
+
+def draft_ready(draft):
+    return bool(draft["sections"]) and not pending_sections(draft)
+
+def generate_section(api_key, month_name, section):
+    """Fills one section dict in place from a fresh generation."""
+    section["attempts"] += 1
     try:
-        response = model.generate_content(prompt)
-        return response.text
+        text, problems = build_monthly_plan(api_key, section["grade"], month_name)
+        section.update(content=text, problems=problems, error=None, edited=False,
+                       status=SECTION_INVALID if problems else SECTION_OK)
     except Exception as e:
-        return f"Error generating content: {e}"
+        print(f"   ❌ Error generating {section['grade']}: {e}")
+        section.update(status=SECTION_FAILED, error=f"{type(e).__name__}: {e}")
+    return section
 
-def send_email(sender_email, sender_password, recipients, subject, body_markdown):
-    # Force reload environment variables to get the latest password
-    from dotenv import load_dotenv
-    load_dotenv(override=True)
-    
-    # If arguments are passed as None/Empty by caller who might have old state, try fetching from env again
-    if not sender_password or sender_password.startswith("!"):
-        sender_password = os.getenv("SENDER_PASSWORD")
-        
-    if not recipients: return False, "No recipients"
-    
+def fill_draft(api_key, draft, grades=None, on_progress=None, max_workers=DRAFT_WORKERS):
+    """(Re)generates the given grades, default every section that isn't ok, concurrently.
+    Sections not selected are left untouched. on_progress(done, total, section) is optional."""
+    wanted = set(grades) if grades else set(pending_sections(draft))
+    targets = [s for s in draft["sections"] if s["grade"] in wanted]
+    if not targets:
+        return draft
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        futures = [pool.submit(generate_section, api_key, draft["month"], s) for s in targets]
+        for done, future in enumerate(as_completed(futures), start=1):
+            section = future.result()
+            if on_progress:
+                on_progress(done, len(targets), section)
+    return draft
+
+def complete_draft(api_key, draft, rounds=MAX_SECTION_ATTEMPTS, on_progress=None):
+    """fill_draft() until every section is ok, at most `rounds` times (unattended runs)."""
+    for _ in range(rounds):
+        if draft_ready(draft):
+            break
+        fill_draft(api_key, draft, on_progress=on_progress)
+    return draft
+
+def edit_section(draft, grade, content):
+    """A hand edit is taken as reviewed: the section becomes ok whatever the validator says."""
+    for section in draft["sections"]:
+        if section["grade"] == grade:
+            section.update(content=content, status=SECTION_OK, error=None, edited=True,
+                           problems=plan_template.validate_plan(content))
+    return draft
+
+def draft_summary(draft):
+    return ", ".join(f"{s['grade']}: {s['status']}" for s in draft["sections"])
+
+def draft_body(draft, tenant=None):
+    """Header, every grade section and the branch footer. Refuses incomplete drafts."""
+    if not draft_ready(draft):
+        raise ValueError(f"Draft is incomplete ({draft_summary(draft)})")
+    tenant = tenant or draft.get("tenant")
+    body = f"# Elite Prep – {draft['month']} Academic Master Plan\n\n"
+    for section in draft["sections"]:
+        body += f"## 📌 {section['grade']}\n{section['content']}\n\n---\n\n"
+    # Append Footer Signature (per branch)
+    return body + (tenants.get_tenant(tenant).footer if tenant else NEWSLETTER_FOOTER)
+
+def split_newsletter_body(body):
+    """Inverse of draft_body: [(grade, plan markdown), ...] in order."""
+    sections = []
+    for chunk in body.split("\n## ")[1:]:
+        header, _, content = chunk.partition("\n")
+        content = content.split("\n---\n")[0]
+        sections.append((header.replace("📌", "").strip(), content.strip()))
+    return sections
+
+def newsletter_docx_bytes(body, month_name, tenant=None):
+    """The newsletter laid out like the Master Plan Guide DOCX."""
+    footer = tenants.get_tenant(tenant).footer if tenant else NEWSLETTER_FOOTER
+    return plan_template.plans_docx_bytes(month_name, split_newsletter_body(body), footer)
+
+# --- SMTP Settings (override via .env for a local relay / test sink) ---
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") != "0"
+SMTP_CA_FILE = os.getenv("SMTP_CA_FILE") # Extra CA to trust for STARTTLS (a local relay / test sink)
+MAX_SEND_RETRIES = 2 # Per recipient, for dropped connections / temporary 4xx errors
+SEND_METRICS_FILE = "send_metrics.jsonl" # Per branch
+DELIVERY_LOG_DIR = "delivery_logs" # Per campaign: addresses already sent, so a resumed send skips them
+
+
+class SendMetrics:
+    """Timing and outcome counters for one send_email() batch."""
+
+    def __init__(self, recipients_total):
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.recipients_total = recipients_total
+        self.phases = {"connect": 0.0, "starttls": 0.0, "login": 0.0, "render": 0.0, "build": 0.0, "send": 0.0, "quit": 0.0}
+        self.build_times = []
+        self.send_times = []
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0 # Already delivered by an earlier (interrupted) run of the same campaign
+        self.retries = 0
+        self.reconnects = 0
+        self.error_classes = {}
+        self.message_bytes = 0
+        self.total_s = 0.0
+        self._t0 = time.perf_counter()
+
+    def timed(self, phase):
+        metrics = self
+
+        class _Timer:
+            def __enter__(self):
+                self.t = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                self.elapsed = time.perf_counter() - self.t
+                metrics.phases[phase] += self.elapsed
+                return False
+        return _Timer()
+
+    def error(self, e):
+        name = type(e).__name__
+        self.error_classes[name] = self.error_classes.get(name, 0) + 1
+
+    def finish(self):
+        self.total_s = time.perf_counter() - self._t0
+        return self
+
+    def as_dict(self):
+        def pct(values, p):
+            if not values:
+                return 0.0
+            values = sorted(values)
+            return values[min(len(values) - 1, int(round((len(values) - 1) * p)))] * 1000
+
+        send_phase = self.phases["send"] + self.phases["build"]
+        return {
+            "started_at": self.started_at,
+            "recipients_total": self.recipients_total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "retries": self.retries,
+            "reconnects": self.reconnects,
+            "error_classes": dict(self.error_classes),
+            "total_s": round(self.total_s, 3),
+            "phases_s": {k: round(v, 4) for k, v in self.phases.items()},
+            "recipients_per_sec": round(self.sent / send_phase, 2) if send_phase else 0.0,
+            "build_p50_ms": round(pct(self.build_times, 0.5), 2),
+            "send_p50_ms": round(pct(self.send_times, 0.5), 2),
+            "send_p95_ms": round(pct(self.send_times, 0.95), 2),
+            "avg_message_kb": round(self.message_bytes / self.sent / 1024, 1) if self.sent else 0.0,
+        }
+
+
+def send_metrics_path(tenant=None):
+    return tenants.get_tenant(tenant).path(SEND_METRICS_FILE)
+
+
+def load_send_history(limit=20, tenant=None):
+    path = send_metrics_path(tenant)
+    if not os.path.exists(path):
+        return []
     try:
-        # Connect to Gmail SMTP once for the batch
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()[-limit:]
+        return [json.loads(line) for line in lines if line.strip()]
+    except Exception:
+        return []
 
-        # Convert Markdown to HTML for Email
-        html_content = markdown.markdown(body_markdown)
-        
-        # Determine Logo HTML with CID/Resize Logic
-        # We process the logo ONCE, then attach readability to each email
-        logo_cid = "logo_image"
-        has_logo = False
-        img_data = None
-        
-        if os.path.exists("logo.png"):
-            has_logo = True
-            try:
-                from PIL import Image
-                import io
-                with open("logo.png", "rb") as f:
-                    raw_data = f.read()
-                    try:
-                         with Image.open(io.BytesIO(raw_data)) as img:
-                            base_width = 75 # REDUCED TO 75px AS REQUESTED
-                            w_percent = (base_width / float(img.size[0]))
-                            h_size = int((float(img.size[1]) * float(w_percent)))
-                            img = img.resize((base_width, h_size), Image.Resampling.LANCZOS)
-                            
-                            byte_io = io.BytesIO()
-                            img.save(byte_io, 'PNG')
-                            img_data = byte_io.getvalue()
-                    except Exception as resize_err:
-                        print(f"Resize failed, using original: {resize_err}")
-                        img_data = raw_data
-            except Exception as e:
-                print(f"Error processing logo: {e}")
-                has_logo = False
 
-        # Logo HTML for body
-        if has_logo:
-             logo_html = f'<div style="text-align: center; margin-bottom: 20px;"><img src="cid:{logo_cid}" alt="Elite Prep Logo" style="max-width: 75px;"></div>'
-        else:
-             logo_html = ""
+def format_send_metrics(m):
+    if not m:
+        return "No send metrics."
+    phases = ", ".join(f"{k}={v:.2f}s" for k, v in m["phases_s"].items() if v)
+    errors = ", ".join(f"{k}×{v}" for k, v in m["error_classes"].items()) or "none"
+    return (f"sent={m['sent']}/{m['recipients_total']} failed={m['failed']} skipped={m.get('skipped', 0)} retries={m['retries']} "
+            f"rate={m['recipients_per_sec']}/s total={m['total_s']}s [{phases}] "
+            f"send p50={m['send_p50_ms']}ms p95={m['send_p95_ms']}ms errors: {errors}")
+
+
+def _record_send_metrics(metrics, tenant=None):
+    """Appends one batch to the branch's send history and returns its metrics dict."""
+    result = metrics.finish().as_dict()
+    path = send_metrics_path(tenant)
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    except Exception as e:
+        print(f"Error writing send metrics: {e}")
+    return result
+
+
+# --- Delivery log (per recipient, so an interrupted campaign never double-sends) ---
+def delivery_log_path(subject, body_markdown, tenant=None):
+    """One log per campaign, keyed by its content: a retried or resubmitted send of the same
+    newsletter resumes where the previous one stopped."""
+    campaign_id = hashlib.sha256(f"{subject}\0{body_markdown}".encode("utf-8")).hexdigest()[:16]
+    log_dir = tenants.get_tenant(tenant).path(DELIVERY_LOG_DIR) if tenant else DELIVERY_LOG_DIR
+    return os.path.join(log_dir, f"{campaign_id}.log")
+
 
-        # Construct Full HTML Body
-        full_html_template = f"""
+def load_delivered(path):
+    """Addresses already delivered according to a delivery log (lowercased)."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip().lower() for line in f if line.strip()}
+
+
+def _connect_smtp(sender_email, sender_password, metrics):
+    import smtplib
+    with metrics.timed("connect"):
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+    if SMTP_STARTTLS:
+        import ssl
+        with metrics.timed("starttls"):
+            server.starttls(context=ssl.create_default_context(cafile=SMTP_CA_FILE))
+    if sender_password:
+        with metrics.timed("login"):
+            server.login(sender_email, sender_password)
+    return server
+
+
+def _is_transient_smtp_error(e):
+    import smtplib
+    if isinstance(e, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+        return True
+    code = getattr(e, "smtp_code", None)
+    return isinstance(code, int) and 400 <= code < 500
+
+
+def prepare_logo():
+    """Returns resized logo PNG bytes (or None)."""
+    if not os.path.exists("logo.png"):
+        return None
+    try:
+        from PIL import Image
+        import io
+        with open("logo.png", "rb") as f:
+            raw_data = f.read()
+        try:
+            with Image.open(io.BytesIO(raw_data)) as img:
+                base_width = 75 # REDUCED TO 75px AS REQUESTED
+                w_percent = (base_width / float(img.size[0]))
+                h_size = int((float(img.size[1]) * float(w_percent)))
+                img = img.resize((base_width, h_size), Image.Resampling.LANCZOS)
+
+                byte_io = io.BytesIO()
+                img.save(byte_io, 'PNG')
+                return byte_io.getvalue()
+        except Exception as resize_err:
+            print(f"Resize failed, using original: {resize_err}")
+            return raw_data
+    except Exception as e:
+        print(f"Error processing logo: {e}")
+        return None
+
+
+# --- Rendering (once per campaign) ---
+# The newsletter is rendered once into immutable bytes: a MIME body holding the HTML part
+# (CSS inlined, minified), a plain-text part and the logo, already encoded, CRLF-normalised
+# and dot-stuffed for SMTP DATA. Per recipient only a few header lines are built; the shared
+# body bytes are written to the socket as they are (see _deliver).
+EMAIL_STYLES = {
+    "h1": "font-size: 22px; color: #005bea; margin: 0 0 16px;",
+    "h2": "font-size: 19px; color: #005bea; margin: 24px 0 12px;",
+    "h3": "font-size: 16px; color: #333; margin: 20px 0 8px;",
+    "p": "margin: 0 0 12px;",
+    "ul": "margin: 0 0 12px; padding-left: 22px;",
+    "ol": "margin: 0 0 12px; padding-left: 22px;",
+    "li": "margin: 0 0 6px;",
+    "hr": "margin: 24px 0; border: 0; border-top: 1px solid #eee;",
+    "table": "border-collapse: collapse; width: 100%;",
+    "th": "border: 1px solid #e0e0e0; padding: 6px 10px; text-align: left; background: #f8f9fa;",
+    "td": "border: 1px solid #e0e0e0; padding: 6px 10px; text-align: left;",
+    "a": "color: #005bea;",
+}
+RENDER_CACHE_SIZE = 4
+
+_STYLED_TAG = re.compile(r"<(%s)(\s[^>]*?)?(\s*/)?>" % "|".join(EMAIL_STYLES)) # Group 3: "/" of <hr />
+_BLOCK_BREAK = re.compile(r"\s*\n\s*(?=</?(?:p|h[1-6]|ul|ol|li|div|table|thead|tbody|tr|th|td|hr|img|html|head|body|blockquote)\b)")
+_render_cache = OrderedDict()
+_render_lock = threading.Lock()
+
+
+def inline_css(html):
+    """Adds EMAIL_STYLES as style attributes (mail clients drop <style> blocks)."""
+    def add_style(m):
+        attrs = (m.group(2) or "").rstrip()
+        if "style=" in attrs:
+            return m.group(0)
+        return f'<{m.group(1)}{attrs} style="{EMAIL_STYLES[m.group(1)]}"{" /" if m.group(3) else ""}>'
+    return _STYLED_TAG.sub(add_style, html)
+
+
+def minify_html(html):
+    html = re.sub(r"<!--.*?-->", "", html, flags=re.DOTALL)
+    html = _BLOCK_BREAK.sub("", html.strip())
+    return re.sub(r"[ \t]*\n[ \t]*", "\n", html)
+
+
+def render_email_html(body_markdown, has_logo, logo_cid="logo_image"):
+    import markdown
+
+    # Convert Markdown to HTML for Email
+    html_content = inline_css(markdown.markdown(body_markdown))
+
+    # Logo HTML for body
+    if has_logo:
+         logo_html = f'<div style="text-align: center; margin-bottom: 20px;"><img src="cid:{logo_cid}" alt="Elite Prep Logo" style="max-width: 75px;"></div>'
+    else:
+         logo_html = ""
+
+    # Construct Full HTML Body
+    return minify_html(f"""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
@@ -152,45 +490,240 @@ def send_email(sender_email, sender_password, recipients, subject, body_markdown
             </div>
         </body>
         </html>
-        """
+        """)
+
+
+def markdown_to_text(body_markdown):
+    """Readable plain-text alternative: no <br> tags, bold markers or Markdown link syntax."""
+    lines = []
+    for line in body_markdown.splitlines():
+        line = re.sub(r"<br\s*/?>", "", line, flags=re.IGNORECASE).rstrip()
+        line = re.sub(r"\*\*(.+?)\*\*|__(.+?)__", lambda m: m.group(1) or m.group(2), line)
+        line = re.sub(r"!?\[([^\]]*)\]\(([^)]+)\)", r"\1 <\2>", line)
+        heading = re.match(r"^(#{1,6})\s+(.*)$", line.strip())
+        if heading:
+            text = heading.group(2).strip()
+            lines += ["", text] + (["=" * len(text)] if len(heading.group(1)) == 1 else
+                                   ["-" * len(text)] if len(heading.group(1)) == 2 else [])
+            continue
+        if line.strip() in ("---", "***", "___"):
+            lines += ["", "-" * 40, ""]
+            continue
+        line = re.sub(r"^(\s*)[-*+]\s+\[([ xX])\]\s+", lambda m: f"{m.group(1)}[{m.group(2)}] ", line)
+        line = re.sub(r"^(\s*)[-*+]\s+", r"\1- ", line)
+        lines.append(line)
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
+class RenderedNewsletter:
+    """One campaign's message, rendered once. `body` is the shared, SMTP-ready MIME body (bytes)."""
+
+    def __init__(self, subject, html, text, body):
+        self.subject = subject
+        self.html = html
+        self.text = text
+        self.body = body
+        from email.header import Header
+        self._subject_header = Header(subject, "utf-8").encode() if not subject.isascii() else subject
+
+    def head(self, sender_email, recipient):
+        """Per-recipient header lines; everything else is shared."""
+        if "\r" in recipient or "\n" in recipient:
+            raise ValueError(f"Invalid recipient address: {recipient!r}")
+        return (f"From: {sender_email}\r\nTo: {recipient}\r\nSubject: {self._subject_header}\r\n").encode("utf-8")
+
+    def message(self, sender_email, recipient):
+        """Whole message as bytes (for tools and tests; delivery sends head and body separately)."""
+        return self.head(sender_email, recipient) + self.body
+
+
+def _transfer_encoding(text):
+    # Quoted-printable keeps mostly-English text near its raw size; base64 is smaller for Korean-heavy text
+    non_ascii = sum(1 for c in text if ord(c) > 127)
+    return "base64" if non_ascii > len(text) * 0.15 else "quoted-printable"
+
+
+def render_newsletter(subject, body_markdown, logo_cid="logo_image"):
+    """Renders (or returns the cached rendering of) a newsletter. Safe to share between threads."""
+    key = hashlib.sha256(f"{subject}\0{body_markdown}\0{logo_cid}".encode("utf-8")).hexdigest()
+    logo_mtime = os.path.getmtime("logo.png") if os.path.exists("logo.png") else None
+    with _render_lock:
+        cached = _render_cache.get((key, logo_mtime))
+        if cached:
+            _render_cache.move_to_end((key, logo_mtime))
+            return cached
+
+    from email import policy
+    from email.message import EmailMessage
+
+    img_data = prepare_logo()
+    html = render_email_html(body_markdown, bool(img_data), logo_cid)
+    text = markdown_to_text(body_markdown)
+
+    # multipart/alternative: plain text, then HTML (+ inline logo as multipart/related)
+    mime = EmailMessage(policy=policy.SMTP)
+    mime.set_content(text, cte=_transfer_encoding(text))
+    mime.add_alternative(html, subtype="html", cte=_transfer_encoding(html))
+    if img_data:
+        mime.get_payload()[1].add_related(img_data, "image", "png", cid=f"<{logo_cid}>",
+                                          disposition="inline", filename="logo.png")
+    body = mime.as_bytes(policy=policy.SMTP)
+    if not body.endswith(b"\r\n"):
+        body += b"\r\n"
+    body = body.replace(b"\r\n.", b"\r\n..") # SMTP dot-stuffing, done once
+
+    rendered = RenderedNewsletter(subject, html, text, body)
+    with _render_lock:
+        _render_cache[(key, logo_mtime)] = rendered
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return rendered
+
+
+def _deliver(server, sender_email, recipient, head, body):
+    """Like server.sendmail(), but writes the shared body bytes to the socket without copying them."""
+    import smtplib
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(sender_email)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, sender_email)
+    code, resp = server.rcpt(recipient)
+    if code not in (250, 251):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused({recipient: (code, resp)})
+    code, resp = server.docmd("data")
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    # One scatter/gather write on a plain socket: no joined copy of the body, and no small
+    # trailing packets held back by Nagle's algorithm while we wait for the reply
+    import ssl
+    parts = (head, body, b".\r\n")
+    sock = server.sock
+    if sock is None:
+        raise smtplib.SMTPServerDisconnected("please run connect() first")
+    try:
+        if isinstance(sock, ssl.SSLSocket):
+            sock.sendall(b"".join(parts)) # After STARTTLS: SSLSocket has no sendmsg(); one record write instead
+        elif hasattr(sock, "sendmsg"):
+            sent = sock.sendmsg(parts)
+            if sent < sum(len(p) for p in parts):
+                sock.sendall(b"".join(parts)[sent:]) # Rare partial write
+        else:
+            sock.sendall(b"".join(parts)) # No sendmsg (Windows)
+    except Exception as e:
+        # The server is now somewhere inside DATA: drop the connection so the caller reconnects
+        server.close()
+        raise smtplib.SMTPServerDisconnected(f"Write failed during DATA: {type(e).__name__}: {e}") from e
+    code, resp = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+def send_email(sender_email, sender_password, recipients, subject, body_markdown, delivery_log=None, tenant=None):
+    """Sends the newsletter to each recipient individually. Returns (success, message, metrics dict);
+    the metrics are also appended to the branch's send history.
+
+    With `delivery_log` (see delivery_log_path), each delivered address is appended to the log
+    right after its DATA is accepted, and addresses already in the log are skipped."""
+    # Force reload environment variables to get the latest password
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+    
+    # If arguments are passed as None/Empty by caller who might have old state, try fetching from env again
+    if not sender_password or sender_password.startswith("!"):
+        sender_password = os.getenv("SENDER_PASSWORD")
+        
+    if not recipients: return False, "No recipients", None
+
+    import smtplib
+
+    metrics = SendMetrics(len(recipients))
+    server = None
+    log_file = None
+    try:
+        # Connect to SMTP once for the batch
+        server = _connect_smtp(sender_email, sender_password, metrics)
+
+        # Render the whole MIME body ONCE (cached per campaign); each email only adds its headers
+        with metrics.timed("render"):
+            rendered = render_newsletter(subject, body_markdown)
+
+        delivered = load_delivered(delivery_log)
+        if delivery_log:
+            os.makedirs(os.path.dirname(delivery_log) or ".", exist_ok=True)
+            log_file = open(delivery_log, "a", encoding="utf-8")
 
         # LOOP THROUGH RECIPIENTS AND SEND INDIVIDUALLY
         sent_count = 0
         failed_recipients = []
-        
-        from email.mime.image import MIMEImage
 
         for recipient in recipients:
+            if recipient.strip().lower() in delivered:
+                metrics.skipped += 1
+                continue
             try:
-                msg = MIMEMultipart("related")
-                msg["From"] = sender_email
-                msg["To"] = recipient # Individual To
-                msg["Subject"] = subject
-                
-                msg_alternative = MIMEMultipart("alternative")
-                msg.attach(msg_alternative)
-                
-                msg_alternative.attach(MIMEText(body_markdown, "plain"))
-                msg_alternative.attach(MIMEText(full_html_template, "html"))
-                
-                # Attach Logo if exists
-                if has_logo and img_data:
-                    img_attachment = MIMEImage(img_data)
-                    img_attachment.add_header('Content-ID', f'<{logo_cid}>')
-                    img_attachment.add_header('Content-Disposition', 'inline', filename="logo.png")
-                    msg.attach(img_attachment)
-                
-                server.sendmail(sender_email, recipient, msg.as_string())
-                sent_count += 1
+                with metrics.timed("build") as t:
+                    head = rendered.head(sender_email, recipient)
+                metrics.build_times.append(t.elapsed)
             except Exception as e:
-                print(f"Failed to send to {recipient}: {e}")
+                print(f"Failed to build message for {recipient}: {e}")
+                metrics.error(e)
                 failed_recipients.append(recipient)
+                continue
+
+            attempt = 0
+            while True:
+                try:
+                    with metrics.timed("send") as t:
+                        _deliver(server, sender_email, recipient, head, rendered.body)
+                    metrics.send_times.append(t.elapsed)
+                    metrics.message_bytes += len(head) + len(rendered.body)
+                    metrics.sent += 1
+                    sent_count += 1
+                    if log_file:
+                        log_file.write(recipient.strip() + "\n")
+                        log_file.flush()
+                    break
+                except Exception as e:
+                    metrics.error(e)
+                    if attempt < MAX_SEND_RETRIES and _is_transient_smtp_error(e):
+                        attempt += 1
+                        metrics.retries += 1
+                        if isinstance(e, (smtplib.SMTPServerDisconnected, ConnectionError)):
+                            try:
+                                server = _connect_smtp(sender_email, sender_password, metrics)
+                                metrics.reconnects += 1
+                            except Exception as conn_err:
+                                metrics.error(conn_err)
+                        else:
+                            time.sleep(attempt)
+                        continue
+                    print(f"Failed to send to {recipient}: {e}")
+                    failed_recipients.append(recipient)
+                    break
 
-        server.quit()
+        if log_file:
+            log_file.close()
+        metrics.failed = len(failed_recipients)
+        with metrics.timed("quit"):
+            try:
+                server.quit()
+            except Exception:
+                pass
+        result = _record_send_metrics(metrics, tenant)
         
+        skipped = f" Skipped {metrics.skipped} already delivered." if metrics.skipped else ""
+        if failed_recipients and not sent_count and not metrics.skipped:
+            return False, f"No recipient could be sent to. Failed: {', '.join(failed_recipients)}", result
         if failed_recipients:
-            return True, f"Sent individually to {sent_count} recipients. Failed: {', '.join(failed_recipients)}"
-        return True, f"Emails sent individually to {sent_count} recipients."
+            return True, f"Sent individually to {sent_count} recipients.{skipped} Failed: {', '.join(failed_recipients)}", result
+        return True, f"Emails sent individually to {sent_count} recipients.{skipped}", result
         
     except Exception as e:
-        return False, str(e)
+        if log_file:
+            log_file.close()
+        metrics.error(e)
+        metrics.failed = len(recipients) - metrics.sent - metrics.skipped
+        return False, str(e), _record_send_metrics(metrics, tenant)
@@ -0,0 +1,378 @@
+import os
+import re
+
+# Monthly Master Plan format, compiled from "Elite Prep- Master Plan Guide format.docx".
+#
+# The guide holds one sample plan per grade: a title line, a greeting, then numbered
+# sections ("1. Target Focus", "2. Checklist", "3. Consultant's Tip"), followed by the
+# branch signature. It is parsed once (and again only when the file changes) into a
+# template that drives:
+#   - the "Structure:" part of the generation prompt  (prompt_structure)
+#   - validation of what the model returned            (validate_plan)
+#   - section-level repair of a malformed plan         (repair_prompt / splice_section; a section
+#     that can't be located raises SectionNotFound and the whole plan is regenerated)
+#   - the DOCX export in the guide's layout            (plans_to_docx)
+
+GUIDE_DOCX = "Elite Prep- Master Plan Guide format.docx"
+
+# Used when the guide (or python-docx) is unavailable; mirrors the January guide
+DEFAULT_TEMPLATE = {
+    "title": "Elite Prep 의 Master Plan Guide - {month}",
+    "grades": ["9th Grade", "10th Grade", "11th Grade", "12th Grade"],
+    "sections": [
+        {"number": 1, "key": "target_focus", "heading": "Target Focus", "kind": "headline"},
+        {"number": 2, "key": "checklist", "heading": "Checklist", "kind": "checklist", "min_items": 3, "max_items": 4},
+        {"number": 3, "key": "consultants_tip", "heading": "Consultant's Tip", "kind": "quote"},
+    ],
+    "footer": ["Sent by Elite Prep Master Plan & Academic Consulting"],
+    "source": None,
+}
+
+# Preamble parts every plan has before the numbered sections
+TITLE = "title"
+GREETING = "greeting"
+
+_MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December")
+_GRADE_LINE = re.compile(r"^(\d{1,2})(st|nd|rd|th) Grade$")
+_SECTION_LINE = re.compile(r"^(\d)\.\s*([A-Za-z][^()]*?)\s*(\(.*\))?$")
+# Section headings as models write them: "### 2. Checklist", "### Consultant's Tip", "**Target Focus:**",
+# "Checklist:". Unnumbered ones only count when their text names a template section.
+_MD_SECTION = re.compile(r"^#{2,4}\s*(?:\*\*)?\s*(?:(\d)[.)]\s*)?(.+?)\s*(?:\*\*)?\s*:?\s*$")
+_BOLD_SECTION = re.compile(r"^\*\*\s*(?:(\d)[.)]\s*)?([^*]+?)\s*:?\s*\*\*\s*:?\s*(.*)$")
+_PLAIN_SECTION = re.compile(r"^(?:(\d)[.)]\s*)?([A-Za-z][A-Za-z'’ ]*?)\s*:?$")
+_MD_TITLE = re.compile(r"^#\s+(.+)$")
+_CHECK_ITEM = re.compile(r"^[-*+]\s+\[[ xX]\]\s+\S")
+_GUIDE_ITEM = re.compile(r"^\[[ xX]\]\s*")
+
+_cache = {"key": None, "template": None}
+
+
+def _clean(text):
+    return text.replace("\xa0", " ").strip()
+
+
+def _slug(heading):
+    return re.sub(r"[^a-z0-9]+", "_", heading.lower().replace("'", "").replace("’", "")).strip("_")
+
+
+class SectionNotFound(Exception):
+    """A section flagged for repair isn't in the plan under any recognizable heading, so its
+    content may be hiding in another part; the caller should regenerate the whole plan."""
+
+
+def compile_guide(paragraphs):
+    """Builds the template dict from the guide's paragraph texts (blank ones already dropped)."""
+    lines = [_clean(p) for p in paragraphs if _clean(p)]
+    title = DEFAULT_TEMPLATE["title"]
+    if lines and not _GRADE_LINE.match(lines[0]):
+        title = lines[0]
+        for month in _MONTHS:
+            if title.endswith(month):
+                title = title[: -len(month)] + "{month}"
+                break
+
+    grades, sections, footer = [], {}, []
+    current = None # Section spec the following sample lines belong to
+    samples = {}   # section key -> list of per-grade line lists
+    for line in lines[1:]:
+        if line.startswith("Sent by"):
+            footer = [line]
+            current = "footer"
+            continue
+        if current == "footer":
+            footer.append(line)
+            continue
+        if _GRADE_LINE.match(line):
+            grades.append(line)
+            current = None
+            continue
+        m = _SECTION_LINE.match(line)
+        if m and grades:
+            heading = m.group(2).strip()
+            key = _slug(heading)
+            sections.setdefault(key, {"number": int(m.group(1)), "key": key, "heading": heading})
+            samples.setdefault(key, []).append([])
+            current = key
+            continue
+        if current in samples:
+            samples[current][-1].append(line)
+
+    if not grades or not sections:
+        return None
+
+    # Infer what each section looks like from the samples
+    for key, spec in sections.items():
+        blocks = [b for b in samples.get(key, []) if b]
+        items = [sum(1 for l in b if _GUIDE_ITEM.match(l)) for b in blocks]
+        if items and all(items):
+            spec.update(kind="checklist", min_items=min(items), max_items=max(items))
+        elif blocks and all(len(b) == 1 for b in blocks):
+            spec["kind"] = "headline"
+        else:
+            spec["kind"] = "quote"
+
+    return {
+        "title": title,
+        "grades": grades,
+        "sections": sorted(sections.values(), key=lambda s: s["number"]),
+        "footer": footer or DEFAULT_TEMPLATE["footer"],
+    }
+
+
+def load_template(path=GUIDE_DOCX):
+    """Compiled guide, cached until the file's mtime changes. Falls back to DEFAULT_TEMPLATE."""
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    key = (os.path.abspath(path), mtime)
+    if _cache["key"] != key:
+        template = None
+        if mtime is not None:
+            try:
+                import docx
+                template = compile_guide([p.text for p in docx.Document(path).paragraphs])
+            except Exception as e:
+                print(f"⚠️ Could not read plan guide {path}: {e}")
+        if template:
+            template["source"] = path
+        _cache["template"] = template or DEFAULT_TEMPLATE
+        _cache["key"] = key
+    return _cache["template"]
+
+
+def section_heading(section):
+    return f"### {section['number']}. {section['heading']}"
+
+
+def section_instruction(section):
+    if section["kind"] == "checklist":
+        return (f"{section['min_items']}-{section['max_items']} specific, actionable items. "
+                f"MUST use bulleted checkboxes format: \"- [ ] **Item title:** details...\"")
+    if section["kind"] == "headline":
+        return "1 clear headline on a single line, in bold"
+    return "A short quoted headline in bold (e.g. **\"...\"**), followed by 1-2 paragraphs of advice"
+
+
+def prompt_structure(grade, month_name, template=None):
+    """The numbered 'Structure:' block of the monthly plan prompt."""
+    template = template or load_template()
+    lines = [
+        f"0. **Title**: # {month_name} Monthly Action Plan",
+        f"1. **Greeting**: Start with \"Welcome, {grade} Students.\" followed by a motivating opening "
+        "about where they are in the academic year (e.g., \"pivotal milestone\", \"halfway mark\").",
+    ]
+    for i, section in enumerate(template["sections"], start=2):
+        lines.append(f"{i}. **{section['heading']}** (Heading line exactly \"{section_heading(section)}\"), "
+                     f"followed by: {section_instruction(section)}")
+    return "\n    ".join(lines)
+
+
+def _match_section(line, by_slug, by_number):
+    """(section key, text after the heading on the same line) if the line heads a template section."""
+    m = _MD_SECTION.match(line)
+    if m:
+        key = by_slug.get(_slug(m.group(2))) or (m.group(1) and by_number.get(int(m.group(1))))
+        return (key, "") if key else None
+    m = _BOLD_SECTION.match(line)
+    if m:
+        key = by_slug.get(_slug(m.group(2)))
+        return (key, m.group(3).strip()) if key else None
+    m = _PLAIN_SECTION.match(line)
+    key = m and by_slug.get(_slug(m.group(2)))
+    return (key, "") if key else None
+
+
+def _split(markdown_text, template):
+    """split_plan() plus the keys of sections whose heading appears more than once."""
+    by_number = {s["number"]: s["key"] for s in template["sections"]}
+    by_slug = {s["key"]: s["key"] for s in template["sections"]}
+    parts = {}
+    repeated = set()
+    current = GREETING
+    body = []
+
+    def flush():
+        text = "\n".join(body).strip()
+        if current in parts:
+            repeated.add(current) # Keep the first; validate_plan flags the repeat
+        elif text or current != GREETING:
+            parts[current] = text
+
+    for line in markdown_text.splitlines():
+        stripped = line.strip()
+        title = _MD_TITLE.match(stripped)
+        if title and TITLE not in parts and current == GREETING and not "".join(body).strip():
+            parts[TITLE] = title.group(1).strip()
+            continue
+        heading = _match_section(stripped, by_slug, by_number)
+        if heading:
+            flush()
+            current, body = heading[0], [heading[1]] if heading[1] else []
+            continue
+        body.append(line)
+    flush()
+    return parts, repeated
+
+
+def split_plan(markdown_text, template=None):
+    """Splits a generated plan into {title, greeting, <section key>: body}. Missing parts are absent."""
+    return _split(markdown_text, template or load_template())[0]
+
+
+def join_plan(parts, template=None):
+    template = template or load_template()
+    out = []
+    if parts.get(TITLE):
+        out.append(f"# {parts[TITLE]}\n")
+    if parts.get(GREETING):
+        out.append(parts[GREETING] + "\n")
+    for section in template["sections"]:
+        if section["key"] in parts:
+            out.append(f"{section_heading(section)}\n{parts[section['key']]}\n")
+    return "\n".join(out).strip() + "\n"
+
+
+def validate_plan(markdown_text, template=None):
+    """Returns {part: problem} for every missing or malformed part; empty means the plan is well-formed."""
+    template = template or load_template()
+    parts, repeated = _split(markdown_text, template)
+    problems = {}
+    if not parts.get(TITLE):
+        problems[TITLE] = "missing '# ...' title line"
+    if not parts.get(GREETING):
+        problems[GREETING] = "missing greeting paragraph"
+    for section in template["sections"]:
+        key = section["key"]
+        body = parts.get(key)
+        if body is None:
+            problems[key] = f"missing section '{section_heading(section)}'"
+            continue
+        lines = [l.strip() for l in body.splitlines() if l.strip()]
+        if not lines:
+            problems[key] = "section is empty"
+        elif section["kind"] == "checklist":
+            items = [l for l in lines if _CHECK_ITEM.match(l)]
+            if not section["min_items"] <= len(items) <= section["max_items"]:
+                problems[key] = (f"expected {section['min_items']}-{section['max_items']} '- [ ]' checklist items, "
+                                 f"found {len(items)}")
+        elif section["kind"] == "headline" and len(lines) > 2:
+            problems[key] = "expected a single headline"
+        elif section["kind"] == "quote" and len(lines) < 2:
+            problems[key] = "expected a quoted headline followed by advice"
+    for key in repeated:
+        problems.setdefault(key, f"section '{part_label(key, template)}' appears more than once")
+    for key, body in parts.items():
+        if key not in problems and "~~" in body:
+            problems[key] = "uses strikethrough (~~text~~)"
+    return problems
+
+
+def part_label(key, template=None):
+    if key == TITLE:
+        return "Title"
+    if key == GREETING:
+        return "Greeting"
+    template = template or load_template()
+    return next((s["heading"] for s in template["sections"] if s["key"] == key), key)
+
+
+def repair_prompt(key, problem, grade, month_name, markdown_text, template=None):
+    """Asks for one part only; the rest of the plan is given as context and kept as is."""
+    template = template or load_template()
+    section = next((s for s in template["sections"] if s["key"] == key), None)
+    if key == TITLE:
+        wanted = f"the title line, exactly: # {month_name} Monthly Action Plan"
+    elif key == GREETING:
+        wanted = (f"the greeting paragraph. Start with \"Welcome, {grade} Students.\" followed by a motivating "
+                  "opening about where they are in the academic year. No heading.")
+    else:
+        wanted = (f"the body of the \"{section['heading']}\" section (without its heading line): "
+                  f"{section_instruction(section)}")
+    return f"""
+    You are an expert US College Admissions Consultant (Elite Level).
+    Below is a '{month_name} Monthly Action Plan' for {grade} students. Its {part_label(key, template)} part has a problem: {problem}.
+
+    Rewrite ONLY {wanted}
+    Output only that part, nothing else. Do NOT use strikethrough (~~text~~). Output in English. Use Markdown formatting.
+
+    --- CURRENT PLAN ---
+    {markdown_text}
+    """
+
+
+def unlocated_sections(markdown_text, template=None):
+    """Template sections with no recognizable heading in the plan (repair can't place them)."""
+    template = template or load_template()
+    parts = split_plan(markdown_text, template)
+    return [s["key"] for s in template["sections"] if s["key"] not in parts]
+
+
+def splice_section(markdown_text, key, new_text, template=None):
+    """Replaces one part of the plan with the re-requested text and returns the re-joined plan.
+    Raises SectionNotFound for a section the plan doesn't have (it is never appended)."""
+    template = template or load_template()
+    parts = split_plan(markdown_text, template)
+    if key not in (TITLE, GREETING) and key not in parts:
+        raise SectionNotFound(f"section '{part_label(key, template)}' not found in the plan")
+    new_text = new_text.strip()
+    if key == TITLE:
+        m = _MD_TITLE.match(new_text.splitlines()[0].strip()) if new_text else None
+        new_text = m.group(1).strip() if m else new_text.lstrip("# ").strip()
+    elif key != GREETING:
+        # Drop a repeated heading line if the model included one
+        lines = new_text.splitlines()
+        by_slug = {s["key"]: s["key"] for s in template["sections"]}
+        by_number = {s["number"]: s["key"] for s in template["sections"]}
+        heading = _match_section(lines[0].strip(), by_slug, by_number) if lines else None
+        if heading:
+            new_text = "\n".join(([heading[1]] if heading[1] else []) + lines[1:]).strip()
+    parts[key] = new_text
+    return join_plan(parts, template)
+
+
+# --- DOCX in the guide's layout ---
+def plans_to_docx(month_name, grade_plans, footer=None, template_path=GUIDE_DOCX):
+    """grade_plans: [(grade, plan markdown), ...] -> python-docx Document laid out like the guide."""
+    import doc_render
+    template = load_template(template_path)
+    doc = doc_render._new_document(template_path)
+    bullet = doc_render._style(doc, "List Bullet")
+
+    def bold_line(text):
+        doc.add_paragraph().add_run(text.replace("**", "")).bold = True
+
+    bold_line(template["title"].format(month=month_name))
+    for grade, markdown_text in grade_plans:
+        parts = split_plan(markdown_text, template)
+        bold_line(f"📌 {grade}")
+        if parts.get(TITLE):
+            bold_line(parts[TITLE])
+        for para in (parts.get(GREETING) or "").split("\n\n"):
+            if para.strip():
+                doc_render._add_runs(doc.add_paragraph(), " ".join(para.split()))
+        for section in template["sections"]:
+            body = parts.get(section["key"])
+            if body is None:
+                continue
+            bold_line(f"{section['number']}. {section['heading']}")
+            for line in body.splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                if _CHECK_ITEM.match(line):
+                    doc_render._add_runs(doc.add_paragraph(style=bullet), "[ ] " + re.sub(r"^[-*+]\s+\[[ xX]\]\s+", "", line))
+                else:
+                    doc_render._add_runs(doc.add_paragraph(), line)
+        doc.add_paragraph()
+
+    footer_lines = [l.strip() for l in doc_render._HTML_BREAK.sub("\n", footer).splitlines()] if footer else template["footer"]
+    for line in footer_lines:
+        if line:
+            doc.add_paragraph(line)
+    return doc
+
+
+def plans_docx_bytes(month_name, grade_plans, footer=None, template_path=GUIDE_DOCX):
+    import io
+    buffer = io.BytesIO()
+    plans_to_docx(month_name, grade_plans, footer, template_path).save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,391 @@
+import re
+import json
+import bisect
+import llm_client
+
+# Structured parsing of the free-text "Profile Summary" (GPA, Test Scores, ECs).
+# The raw text stays the source of truth; the parsed fields are stored next to it
+# in the profile record so the roster can be filtered and prompts stay compact.
+
+PROFILE_SCHEMA_VERSION = 3 # v2: word-anchored scores, "ambiguous" lines; v3: GPA scales and UW/W pairs
+
+LABEL_RE = re.compile(r"^\s*[-*•]?\s*([A-Za-z][A-Za-z /&]{0,30}?)\s*[:：]\s*(.*)$")
+# A UW/W marker or a number, optionally "a/b" (value/scale, or a UW/W pair)
+GPA_TOKEN_RE = re.compile(r"\b(unweighted|weighted|uw|w)\b|\b(\d+(?:\.\d+)?)(?:\s*/\s*(\d+(?:\.\d+)?))?", re.I)
+GPA_SCALES = (4.0, 5.0, 100.0) # The only numbers read as a scale after "/"
+GPA_MAX = 5.5
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+SAT_RE = re.compile(r"\bSAT\b", re.I)
+ACT_RE = re.compile(r"\bACT\b", re.I)
+AP_ITEM_RE = re.compile(r"^(.*?)\s*[\(:\-=]?\s*([1-5])\s*\)?$")
+
+SAT_SECTIONS = {
+    "ebrw": r"(?:EBRW|ERW|RW|Reading(?:\s*&\s*Writing)?|Verbal|English)",
+    "math": r"(?:Math|M)",
+}
+ACT_SECTIONS = {
+    "english": r"(?:English|Eng|E)",
+    "math": r"(?:Math|M)",
+    "reading": r"(?:Reading|Read|R)",
+    "science": r"(?:Science|Sci|S)",
+}
+
+EC_LABELS = ("ec", "ecs", "extracurricular", "extracurriculars", "activities", "activity")
+AP_LABELS = ("ap", "aps", "ap scores", "ap exams")
+
+
+def empty_profile():
+    return {
+        "version": PROFILE_SCHEMA_VERSION,
+        "gpa_unweighted": None,
+        "gpa_weighted": None,
+        "sat": {},
+        "act": {},
+        "ap": [],
+        "ecs": [],
+        "notes": [],
+        "ambiguous": [], # Lines with numbers the rules could not place; the raw text goes to the prompt too
+        "source": "rules",
+    }
+
+
+def _split_items(text):
+    return [p.strip(" .") for p in re.split(r"[,;/]|\s\|\s", text) if p.strip(" .")]
+
+
+def _is_weighted(marker):
+    return marker.lower() in ("w", "weighted")
+
+
+def _set_gpa(profile, weighted, value):
+    key = "gpa_weighted" if weighted else "gpa_unweighted"
+    if profile[key] is not None or not 0 < value <= GPA_MAX:
+        return False
+    profile[key] = value
+    return True
+
+
+def _parse_gpa(line, profile):
+    """GPA values with their UW/W marker, before ("UW 3.9", "Weighted GPA 4.4") or after ("3.9 UW").
+    "a/b" is value/scale only for a known scale; under a "UW/W" label it's an unweighted/weighted pair.
+    Anything the rules can't place marks the line ambiguous, so its raw text reaches the prompt."""
+    gpa_at = line.lower().index("gpa")
+    tokens = list(GPA_TOKEN_RE.finditer(line))
+    pending = [] # Markers waiting for their value, in order ("GPA (UW/W): 3.9/4.4" -> [False, True])
+    found = uncertain = False
+    i = 0
+    while i < len(tokens):
+        m = tokens[i]
+        i += 1
+        if m.group(1):
+            pending.append(_is_weighted(m.group(1)))
+            continue
+        if m.start() < gpa_at:
+            continue # "Grade: 11 GPA: 3.8" - a number before "GPA" isn't one
+        # Markers right after the value ("3.9 UW", "3.9 (W)") belong to it
+        after = []
+        while i < len(tokens) and tokens[i].group(1) and re.fullmatch(r"[\s()/]*", line[tokens[i - 1].end():tokens[i].start()]):
+            after.append(_is_weighted(tokens[i].group(1)))
+            i += 1
+        markers = after or pending
+        value = float(m.group(2))
+        second = float(m.group(3)) if m.group(3) else None
+
+        if second is not None and second not in GPA_SCALES:
+            if len(markers) < 2 or markers[0] == markers[1]:
+                uncertain = True # "3.9/4.4" with no UW/W label: pair or typo, don't guess
+                continue
+            placed = [_set_gpa(profile, markers[0], value), _set_gpa(profile, markers[1], second)]
+            del markers[:2]
+        elif second == 100.0:
+            uncertain = True # Percentage GPA doesn't fit the 4/5-point fields
+            continue
+        else:
+            if second is not None and value > second:
+                uncertain = True
+                continue
+            if markers:
+                weighted = markers.pop(0)
+            else:
+                weighted = (second or 0) > 4.0 or value > 4.0
+            placed = [_set_gpa(profile, weighted, value)]
+        found = found or any(placed)
+        uncertain = uncertain or not all(placed)
+        pending.extend(after) # Unused trailing markers wait for the next value
+
+    if found and (uncertain or pending):
+        profile["ambiguous"].append(line)
+    return found
+
+
+def _parse_sections(line, sections, lo, hi):
+    """Section scores ("Math 780", "E: 35") and the line with those matches blanked out."""
+    scores = {}
+    for key, pattern in sections.items():
+        m = re.search(r"\b" + pattern + r"(?![A-Za-z])\s*[:=]?\s*(\d{1,3})\b", line, re.I)
+        if m and lo <= int(m.group(1)) <= hi:
+            scores[key] = int(m.group(1))
+            line = line[:m.start()] + " " * (m.end() - m.start()) + line[m.end():]
+    return scores, line
+
+
+def _parse_sat(line, profile):
+    body = SAT_RE.split(line, 1)[1]
+    scores, rest = _parse_sections(body, SAT_SECTIONS, 200, 800)
+    numbers = [int(n) for n in re.findall(r"\b(\d{3,4})\b", rest)]
+    total = next((n for n in numbers if 400 <= n <= 1600), None)
+    if total is None and {"ebrw", "math"} <= scores.keys():
+        total = scores["ebrw"] + scores["math"]
+    if total is None and not scores:
+        return False
+    if total is not None:
+        scores["total"] = total
+    profile["sat"].update(scores)
+    if len(NUMBER_RE.findall(rest)) > (1 if total in numbers else 0):
+        profile["ambiguous"].append(line)
+    return True
+
+
+def _parse_act(line, profile):
+    body = ACT_RE.split(line, 1)[1]
+    scores, rest = _parse_sections(body, ACT_SECTIONS, 1, 36)
+    # The composite is the first number that isn't a section score ("ACT 34 (E 35, M 33, ...)")
+    composite = re.search(r"^\D*?\b(\d{1,2})\b", rest)
+    if composite and 1 <= int(composite.group(1)) <= 36:
+        scores["composite"] = int(composite.group(1))
+    if not scores:
+        return False
+    profile["act"].update(scores)
+    if len(NUMBER_RE.findall(rest)) > (1 if "composite" in scores else 0):
+        profile["ambiguous"].append(line)
+    return True
+
+
+def _parse_ap(text, profile):
+    found = False
+    for item in re.split(r"[,;]", text):
+        item = item.strip(" .")
+        m = AP_ITEM_RE.match(item)
+        if not item or not m or not m.group(1).strip():
+            continue
+        subject = re.sub(r"^AP\s+", "", m.group(1).strip(" (:-"), flags=re.I)
+        profile["ap"].append({"subject": subject, "score": int(m.group(2))})
+        found = True
+    return found
+
+
+def parse_profile_rules(text):
+    """Rule-based parse of the Profile Summary text into typed fields."""
+    profile = empty_profile()
+    if not text:
+        return profile
+
+    current_list = None
+    for raw_line in str(text).splitlines():
+        line = raw_line.strip()
+        if not line:
+            current_list = None
+            continue
+
+        # Bullet continuation of the previous "ECs:" / "AP:" block
+        if current_list and line[0] in "-*•":
+            item = line.lstrip("-*• ").strip()
+            if current_list == "ecs":
+                profile["ecs"].append(item)
+                continue
+            if current_list == "ap" and _parse_ap(item, profile):
+                continue
+
+        m = LABEL_RE.match(line)
+        label = m.group(1).strip().lower() if m else ""
+        value = m.group(2).strip() if m else line
+        current_list = None
+        consumed = False
+
+        if "gpa" in line.lower():
+            consumed = _parse_gpa(line, profile)
+        elif SAT_RE.search(line) and not line.lower().startswith("act"):
+            consumed = _parse_sat(line, profile)
+        elif ACT_RE.search(line):
+            consumed = _parse_act(line, profile)
+        elif label in AP_LABELS:
+            current_list = "ap"
+            consumed = _parse_ap(value, profile) or not value
+        elif label in EC_LABELS:
+            current_list = "ecs"
+            profile["ecs"].extend(_split_items(value))
+            consumed = True
+        elif re.match(r"^AP\s+\S", line) and AP_ITEM_RE.match(line):
+            consumed = _parse_ap(line, profile)
+
+        if not consumed:
+            profile["notes"].append(line)
+
+    return profile
+
+
+def has_structured_fields(profile):
+    return bool(
+        profile.get("gpa_unweighted") is not None
+        or profile.get("gpa_weighted") is not None
+        or profile.get("sat")
+        or profile.get("act")
+        or profile.get("ap")
+        or profile.get("ecs")
+    )
+
+
+def parse_profile_llm(text, api_key, model_name="gemini-3-flash-preview"):
+    """Asks the model to extract the same fields as JSON. Returns None on failure."""
+    if not api_key or not text:
+        return None
+    prompt = f"""
+    Extract the student's academic profile from the text below and answer with JSON only.
+    Schema: {{"gpa_unweighted": number|null, "gpa_weighted": number|null,
+      "sat": {{"total": int, "ebrw": int, "math": int}},
+      "act": {{"composite": int, "english": int, "math": int, "reading": int, "science": int}},
+      "ap": [{{"subject": str, "score": int}}], "ecs": [str], "notes": [str]}}
+    Omit unknown keys inside "sat"/"act". Put anything else in "notes".
+
+    Text:
+    {text}
+    """
+    try:
+        raw = llm_client.get_client(api_key).generate_text(model_name, prompt, timeout=30, call_site="profile_parse").strip()
+        raw = re.sub(r"^```(?:json)?|```$", "", raw, flags=re.M).strip()
+        parsed = json.loads(raw)
+    except Exception as e:
+        print(f"LLM profile parse failed: {e}")
+        return None
+
+    profile = empty_profile()
+    for key in ("gpa_unweighted", "gpa_weighted"):
+        if isinstance(parsed.get(key), (int, float)):
+            profile[key] = float(parsed[key])
+    for key in ("sat", "act"):
+        if isinstance(parsed.get(key), dict):
+            profile[key] = {k: int(v) for k, v in parsed[key].items() if isinstance(v, (int, float))}
+    profile["ap"] = [
+        {"subject": str(a.get("subject", "")).strip(), "score": int(a["score"])}
+        for a in parsed.get("ap") or []
+        if isinstance(a, dict) and isinstance(a.get("score"), (int, float))
+    ]
+    profile["ecs"] = [str(e).strip() for e in parsed.get("ecs") or [] if str(e).strip()]
+    profile["notes"] = [str(n).strip() for n in parsed.get("notes") or [] if str(n).strip()]
+    profile["source"] = "llm"
+    return profile
+
+
+def parse_profile(text, api_key=None):
+    """Parses the Profile Summary; falls back to the model only when the rules find nothing."""
+    profile = parse_profile_rules(text)
+    if api_key and text and not has_structured_fields(profile):
+        llm_profile = parse_profile_llm(text, api_key)
+        if llm_profile:
+            return llm_profile
+    return profile
+
+
+def get_profile_fields(record):
+    """Returns the parsed fields of a saved student record, parsing older records on the fly."""
+    parsed = record.get("profile")
+    if isinstance(parsed, dict) and parsed.get("version") == PROFILE_SCHEMA_VERSION:
+        return parsed
+    return parse_profile_rules(record.get("status", ""))
+
+
+def format_profile_compact(profile, notes=True):
+    """Renders parsed fields as a short single block for prompts."""
+    parts = []
+    gpa = []
+    if profile.get("gpa_unweighted") is not None:
+        gpa.append(f"{profile['gpa_unweighted']:g} UW")
+    if profile.get("gpa_weighted") is not None:
+        gpa.append(f"{profile['gpa_weighted']:g} W")
+    if gpa:
+        parts.append("GPA " + " / ".join(gpa))
+
+    sat = profile.get("sat") or {}
+    if sat:
+        detail = ", ".join(f"{k.upper() if k == 'ebrw' else k.title()} {v}" for k, v in sat.items() if k != "total")
+        parts.append(f"SAT {sat.get('total', '')}".strip() + (f" ({detail})" if detail else ""))
+
+    act = profile.get("act") or {}
+    if act:
+        detail = ", ".join(f"{k.title()} {v}" for k, v in act.items() if k != "composite")
+        parts.append(f"ACT {act.get('composite', '')}".strip() + (f" ({detail})" if detail else ""))
+
+    if profile.get("ap"):
+        parts.append("AP: " + ", ".join(f"{a['subject']} {a['score']}" for a in profile["ap"]))
+    if profile.get("ecs"):
+        parts.append("ECs: " + "; ".join(profile["ecs"]))
+    if profile.get("notes") and notes:
+        parts.append("Notes: " + " ".join(profile["notes"]))
+    return " | ".join(parts)
+
+
+def profile_for_prompt(record_or_text):
+    """Compact prompt text for a record or raw status.
+
+    The raw text is kept when nothing parsed, and appended when the parse is partial
+    (unparsed lines) or ambiguous (numbers the rules could not place), so a misread
+    never reaches the model as the only version of the facts.
+    """
+    if isinstance(record_or_text, dict):
+        raw = record_or_text.get("status", "")
+        profile = get_profile_fields(record_or_text)
+    else:
+        raw = record_or_text or ""
+        profile = parse_profile_rules(raw)
+    if not has_structured_fields(profile):
+        return raw
+    if profile.get("notes") or profile.get("ambiguous"):
+        return f"{format_profile_compact(profile, notes=False)}\n  (As written: {' '.join(str(raw).split())})"
+    return format_profile_compact(profile)
+
+
+# --- Roster Index (for analytics / fast filtering) ---
+NUMERIC_FIELDS = {
+    "gpa_unweighted": lambda p: p.get("gpa_unweighted"),
+    "gpa_weighted": lambda p: p.get("gpa_weighted"),
+    "sat_total": lambda p: (p.get("sat") or {}).get("total"),
+    "act_composite": lambda p: (p.get("act") or {}).get("composite"),
+    "ap_count": lambda p: len(p.get("ap") or []),
+    "ap_avg": lambda p: round(sum(a["score"] for a in p["ap"]) / len(p["ap"]), 2) if p.get("ap") else None,
+    "ec_count": lambda p: len(p.get("ecs") or []),
+}
+
+
+def roster_row(name, record):
+    profile = get_profile_fields(record)
+    row = {"name": name, "grade": record.get("grade", "")}
+    for field, getter in NUMERIC_FIELDS.items():
+        row[field] = getter(profile)
+    return row
+
+
+class RosterIndex:
+    """Sorted per-field index over the roster, so range filters don't rescan every profile."""
+
+    def __init__(self, data):
+        self.rows = {name: roster_row(name, record) for name, record in data.items()}
+        self.sorted = {}
+        for field in NUMERIC_FIELDS:
+            pairs = sorted((row[field], name) for name, row in self.rows.items() if row[field] is not None)
+            self.sorted[field] = ([v for v, _ in pairs], [n for _, n in pairs])
+        self.by_grade = {}
+        for name, row in self.rows.items():
+            self.by_grade.setdefault(row["grade"], set()).add(name)
+
+    def range(self, field, low=None, high=None):
+        values, names = self.sorted[field]
+        start = 0 if low is None else bisect.bisect_left(values, low)
+        end = len(values) if high is None else bisect.bisect_right(values, high)
+        return set(names[start:end])
+
+    def filter(self, grade=None, **ranges):
+        """filter(grade="11th Grade", sat_total=(1450, None), gpa_unweighted=(3.8, None))"""
+        result = set(self.rows) if grade is None else set(self.by_grade.get(grade, set()))
+        for field, (low, high) in ranges.items():
+            result &= self.range(field, low, high)
+        return [self.rows[name] for name in sorted(result)]
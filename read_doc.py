@@ -1,12 +1,19 @@
+import json
 import docx
 import sys
+import plan_template
 
+# Dumps the Master Plan Guide paragraphs and the template compiled from them (see plan_template.py)
+
+path = sys.argv[1] if len(sys.argv) > 1 else plan_template.GUIDE_DOCX
 try:
-    doc = docx.Document("Elite Prep- Master Plan Guide format.docx")
+    doc = docx.Document(path)
     print("--- START OF DOC ---")
     for i, para in enumerate(doc.paragraphs):
         if para.text.strip():
             print(f"[{i}] {para.text}")
     print("--- END OF DOC ---")
+    print("--- COMPILED TEMPLATE ---")
+    print(json.dumps(plan_template.load_template(path), indent=2, ensure_ascii=False))
 except Exception as e:
     print(f"Error: {e}")
@@ -0,0 +1,211 @@
+import os
+import atexit
+import shutil
+import threading
+from collections import OrderedDict
+import profile_parser
+import student_store
+
+# Prompt / request assembly for the Master Plan and Chatbot tabs.
+# Shared by app.py and the benchmark suite, so it must not depend on Streamlit.
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".doc": "application/msword",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".xls": "application/vnd.ms-excel",
+    ".csv": "text/csv",
+    ".txt": "text/plain",
+}
+CHAT_ACK = "네, 학생의 자료와 정보를 숙지했습니다. 무엇이든 물어보세요!"
+# Attachments above this size are passed as file references ({"path", "mime_type", "size"}) and
+# uploaded once by the Gemini backend, instead of being read into memory as inline bytes.
+INLINE_MAX_BYTES = int(os.getenv("INLINE_ATTACHMENT_MAX_MB", "4")) * 1024 * 1024
+SPOOL_CACHE_SIZE = 32 # Spooled uploads kept per app worker; the least recently used is deleted
+
+
+def extract_text_from_docx(file_stream):
+    """Extracts text from a docx file stream."""
+    try:
+        import docx # Added for .docx support (imported on first use; it pulls in lxml)
+        doc = docx.Document(file_stream)
+        full_text = []
+        for para in doc.paragraphs:
+            full_text.append(para.text)
+        return '\\n'.join(full_text)
+    except Exception as e:
+        print(f"Error reading docx: {e}")
+        return ""
+
+
+def mime_type_for_path(file_path):
+    ext = os.path.splitext(file_path)[1].lower()
+    return MIME_TYPES.get(ext, "application/pdf")
+
+
+def file_ref(file_path, mime_type, size=None, sha256=None):
+    """File-backed attachment part; sha256 (when known) keeps request coalescing content-based."""
+    digest = student_store.file_digest(file_path) if sha256 is None else (size, sha256)
+    ref = {"mime_type": mime_type, "path": file_path, "size": size if size is not None else os.path.getsize(file_path)}
+    if digest:
+        ref["sha256"] = digest[1]
+    return ref
+
+
+_spooled = OrderedDict() # (file id, size) -> (path, size, sha256), least recently used first
+_spool_lock = threading.Lock()
+
+
+def _remove_spooled(spooled):
+    shutil.rmtree(os.path.dirname(spooled[0]), ignore_errors=True)
+
+
+def spool_once(uploaded_file):
+    """Spools a large new upload to disk once; later chat turns reuse the same file."""
+    key = (getattr(uploaded_file, "file_id", None) or uploaded_file.name, getattr(uploaded_file, "size", None))
+    with _spool_lock:
+        spooled = _spooled.get(key)
+        if spooled is not None and os.path.exists(spooled[0]):
+            _spooled.move_to_end(key)
+            return spooled
+    spooled = student_store.spool_upload(uploaded_file)
+    with _spool_lock:
+        _spooled[key] = spooled
+        _spooled.move_to_end(key)
+        while len(_spooled) > SPOOL_CACHE_SIZE:
+            _remove_spooled(_spooled.popitem(last=False)[1])
+    return spooled
+
+
+@atexit.register
+def clear_spooled():
+    """Deletes every upload this process spooled (also run at exit)."""
+    with _spool_lock:
+        while _spooled:
+            _remove_spooled(_spooled.popitem()[1])
+
+
+def file_context_part(file_source):
+    """Returns the prompt part for one selected file (text for .docx, inline blob otherwise), or None."""
+    # Case A: UploadedFile object
+    if hasattr(file_source, "type"):
+        file = file_source
+        if file.type == DOCX_MIME or file.name.endswith(".docx"):
+            extracted_text = extract_text_from_docx(file)
+            if extracted_text:
+                return f"\\n[Attached Document Content: {file.name}]\\n{extracted_text}\\n"
+            return None
+        if (getattr(file, "size", None) or 0) > INLINE_MAX_BYTES:
+            path, size, sha256 = spool_once(file)
+            return file_ref(path, file.type, size, sha256)
+        return {"mime_type": file.type, "data": file.getvalue()}
+
+    # Case B: File Path (Saved file)
+    file_path = file_source
+    if not os.path.exists(file_path):
+        return None
+    if os.path.splitext(file_path)[1].lower() == ".docx":
+        try:
+            with open(file_path, "rb") as f:
+                extracted_text = extract_text_from_docx(f)
+            if extracted_text:
+                return f"\\n[Attached Document Content: {os.path.basename(file_path)}]\\n{extracted_text}\\n"
+        except Exception as e:
+            print(f"Error reading docx {file_path}: {e}")
+        return None
+    try:
+        if os.path.getsize(file_path) > INLINE_MAX_BYTES:
+            return file_ref(file_path, mime_type_for_path(file_path))
+        with open(file_path, "rb") as f:
+            return {"mime_type": mime_type_for_path(file_path), "data": f.read()}
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return None
+
+
+def build_context_parts(selected_filenames, available_files, blobs_last=False):
+    """Collects prompt parts for the selected files. With blobs_last, text parts come first."""
+    texts, blobs, ordered = [], [], []
+    for fname in selected_filenames or []:
+        part = file_context_part(available_files[fname])
+        if part is None:
+            continue
+        ordered.append(part)
+        (texts if isinstance(part, str) else blobs).append(part)
+    return texts + blobs if blobs_last else ordered
+
+
+def build_master_plan_prompt(student_name, student_grade, target_university, intended_major, current_status):
+    return f"""
+                        You are an expert US College Admissions Consultant (Elite Level).
+                        You strictly follow the 2026 US Common App & University specific trends.
+
+                        [Student Profile]
+                        - Name: {student_name}
+                        - Grade: {student_grade}
+                        - Target Colleges: {target_university}
+                        - Intended Major: {intended_major}
+                        - Profile Summary: {profile_parser.profile_for_prompt(current_status)}
+
+                        [Request]
+                        Create a highly detailed 'US College Admissions Master Plan' in Korean.
+
+                        1. **Holistic Review Strategy**: Analyze GPA (Weighted/Unweighted), Rigor (AP/IB), Standardized Tests (SAT/ACT), and Extracurriculars. Identify the student's "Spike" or "Theme".
+                        2. **Timeline & Monthly Action Plan**: Provide a month-by-month checklist up to graduation. Include specific times for SAT/ACT attempts, Summer Programs (RSI, TASP, etc.), Internship hunting, and Essay brainstorming.
+                        3. **College List Strategy**: Suggest a balanced list (Reach, Match, Safety) if targets are unrealistic, or refine strategies for the targets.
+                        4. **Application Strategy**: Early Decision (ED) vs Early Action (EA) vs Regular Decision (RD) recommendations.
+
+                        Output in clean Markdown (Korean). Use a Table for the Monthly Action Plan.
+                        """
+
+
+def build_master_plan_request(student_name, student_grade, target_university, intended_major, current_status,
+                              selected_filenames, available_files):
+    """Full generate_content payload for the Master Plan: prompt, .docx text, then attachments."""
+    system_prompt = build_master_plan_prompt(student_name, student_grade, target_university, intended_major, current_status)
+    return [system_prompt] + build_context_parts(selected_filenames, available_files, blobs_last=True)
+
+
+def build_chat_system_text(student_name, student_grade, target_university, intended_major, current_status):
+    return f"""
+                    You are a knowledgeable US College Admissions Chatbot.
+                    Student Info: {student_name}, {student_grade}, Target: {target_university}, Major: {intended_major}.
+                    Profile: {profile_parser.profile_for_prompt(current_status)}
+
+                    [Attached Documents]
+                    The user has provided the following files (Transcripts, Essays, etc.).
+                    Use the information in these files to answer specific questions (e.g., "What is my GPA?", "Critique my essay").
+
+                    Answer questions about Common App, Essays, SAT/ACT, Financial Aid, and specific university culture.
+                    Be concise and encouraging.
+                    IMPORTANT: Always answer in Korean (한국어).
+                    """
+
+
+def build_chat_history(chat_context_parts, messages):
+    """Construct history for API (System Context + User Turn)."""
+    # Note: We inject the files into the very first turn to serve as "Context"
+    history_for_api = [
+        {"role": "user", "parts": chat_context_parts}
+    ]
+
+    # Add Model acknowledgment to simulate a history where model knows context
+    history_for_api.append({"role": "model", "parts": [CHAT_ACK]})
+
+    # Append actual conversation history
+    for m in messages:
+        role = "user" if m["role"] == "user" else "model"
+        history_for_api.append({"role": role, "parts": [m["content"]]})
+    return history_for_api
+
+
+def build_chat_request(student_name, student_grade, target_university, intended_major, current_status,
+                       selected_filenames, available_files, messages):
+    """Full generate_content payload for one chatbot turn."""
+    chat_context_parts = [build_chat_system_text(student_name, student_grade, target_university, intended_major, current_status)]
+    chat_context_parts += build_context_parts(selected_filenames, available_files)
+    return build_chat_history(chat_context_parts, messages)
@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+import newsletter_utils
+import tenants
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+# Built-in scheduler for newsletter campaigns (replaces the external cron for auto_sender.py).
+#
+#   python scheduler.py                 # run forever
+#   python scheduler.py --once          # one tick (e.g. from a cron / Task Scheduler)
+#   python scheduler.py --dry-run       # show what would be generated/sent, change nothing
+#   python scheduler.py --tenant duluth # only one branch
+#
+# Every branch (tenants.py) has its own campaigns.json, state, drafts and send lock under its
+# root directory; each tick fans out over all branches. Campaigns are defined as:
+#   [{"name": "monthly", "schedule": "0 9 1 * *", "segment": "all",
+#     "template": "monthly_master_plan", "lead_minutes": 120, "catch_up_hours": 72}]
+# Content is generated `lead_minutes` before the send time, so the send itself is pure delivery.
+
+CAMPAIGNS_FILE = "campaigns.json"
+STATE_FILE = "scheduler_state.json"
+DRAFTS_DIR = "scheduled_drafts"
+DAEMON_LOCK = "scheduler.lock"
+SEND_LOCK = "newsletter_send.lock" # Per branch; also taken by auto_sender.py so runs never overlap
+TICK_SECONDS = 60
+GENERATE_BACKOFF_MINUTES = 5 # After a failed generation; doubles per failure
+GENERATE_BACKOFF_MAX_MINUTES = 60
+
+DEFAULT_CAMPAIGNS = [{
+    "name": "monthly",
+    "schedule": "0 9 1 * *", # 09:00 on the 1st of every month
+    "segment": "all",
+    "template": "monthly_master_plan",
+    "lead_minutes": 120,
+    "catch_up_hours": 72,
+}]
+
+
+# --- Cron expressions (minute hour day-of-month month day-of-week) ---
+CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_cron_field(field, lo, hi):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = end = int(part)
+            if step > 1:
+                end = hi
+        if start < lo or end > hi or start > end:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def parse_cron(expr):
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron expression needs 5 fields: {expr}")
+    parsed = [_parse_cron_field(f, lo, hi) for f, (lo, hi) in zip(fields, CRON_RANGES)]
+    if 7 in parsed[4]: # 0 and 7 are both Sunday
+        parsed[4] = (parsed[4] - {7}) | {0}
+    # Like cron: when both day-of-month and day-of-week are restricted, either may match
+    parsed.append(fields[2] != "*" and fields[4] != "*")
+    return parsed
+
+
+def _day_matches(cron, dt):
+    dom_ok = dt.day in cron[2]
+    dow_ok = (dt.weekday() + 1) % 7 in cron[4] # Python: Monday=0, cron: Sunday=0
+    return (dom_ok or dow_ok) if cron[5] else (dom_ok and dow_ok)
+
+
+def next_run(expr, after):
+    """First time strictly after `after` matching the cron expression (minute resolution)."""
+    cron = parse_cron(expr)
+    dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = dt + timedelta(days=366 * 4)
+    while dt < limit:
+        if dt.month not in cron[3]:
+            dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        if not _day_matches(cron, dt):
+            dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if dt.hour not in cron[1]:
+            dt = dt.replace(minute=0) + timedelta(hours=1)
+            continue
+        if dt.minute in cron[0]:
+            return dt
+        dt += timedelta(minutes=1)
+    raise ValueError(f"Cron expression never matches: {expr}")
+
+
+def last_run(expr, before, earliest):
+    """Latest scheduled time in (earliest, before], or None."""
+    found = None
+    t = next_run(expr, earliest)
+    while t <= before:
+        found = t
+        t = next_run(expr, t)
+    return found
+
+
+# --- Campaigns, segments & templates ---
+def load_campaigns(tenant=None):
+    tenant = tenants.get_tenant(tenant)
+    path = tenant.path(CAMPAIGNS_FILE)
+    if not os.path.exists(path):
+        campaigns = [dict(c) for c in DEFAULT_CAMPAIGNS]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            campaigns = json.load(f)
+    for c in campaigns:
+        c["tenant"] = tenant.id
+        for key, value in DEFAULT_CAMPAIGNS[0].items():
+            c.setdefault(key, value)
+        parse_cron(c["schedule"]) # Fail fast on a bad schedule
+        if c["template"] not in TEMPLATES:
+            raise ValueError(f"Unknown template '{c['template']}' in campaign {c['name']}")
+    return campaigns
+
+
+def segment_recipients(segment, subscribers=None, tenant=None):
+    """"all", "domain:<example.com>", or an explicit list of addresses (within one branch)."""
+    subscribers = newsletter_utils.load_subscribers(tenant) if subscribers is None else subscribers
+    if isinstance(segment, list):
+        wanted = {e.lower() for e in segment}
+        return [e for e in subscribers if e.lower() in wanted]
+    if not segment or segment == "all":
+        return subscribers
+    if segment.startswith("domain:"):
+        domain = segment.split(":", 1)[1].lower().lstrip("@")
+        return [e for e in subscribers if e.lower().endswith("@" + domain)]
+    raise ValueError(f"Unknown segment: {segment}")
+
+
+def render_monthly_master_plan(api_key, campaign, run_time, previous=None):
+    """Returns (subject, body, sections); body is None while a grade is still failing.
+    `previous` is an incomplete saved draft whose good sections are kept."""
+    month = run_time.strftime("%B")
+    draft = (previous or {}).get("sections") or newsletter_utils.new_draft(
+        month, campaign.get("grades"), campaign["tenant"])
+    newsletter_utils.complete_draft(
+        api_key, draft,
+        on_progress=lambda done, total, section: print(f"   > {section['grade']}: {section['status']} ({done}/{total})"))
+    body = newsletter_utils.draft_body(draft) if newsletter_utils.draft_ready(draft) else None
+    return newsletter_utils.newsletter_subject(month), body, draft
+
+
+TEMPLATES = {
+    "monthly_master_plan": render_monthly_master_plan,
+}
+
+
+# --- State, drafts & locks ---
+def load_state(tenant=None):
+    path = tenants.get_tenant(tenant).path(STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading scheduler state: {e}")
+        return {}
+
+
+def save_state(state, tenant=None):
+    tenant = tenants.get_tenant(tenant)
+    tenant.ensure_dirs()
+    path = tenant.path(STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _draft_path(campaign, run_time):
+    drafts_dir = tenants.get_tenant(campaign["tenant"]).path(DRAFTS_DIR)
+    return os.path.join(drafts_dir, f"{campaign['name']}_{run_time.strftime('%Y%m%d%H%M')}.json")
+
+
+def load_draft(campaign, run_time):
+    path = _draft_path(campaign, run_time)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_draft(campaign, run_time, subject, body, sections=None):
+    os.makedirs(os.path.dirname(_draft_path(campaign, run_time)), exist_ok=True)
+    with open(_draft_path(campaign, run_time), "w", encoding="utf-8") as f:
+        json.dump({"subject": subject, "body": body, "sections": sections, "generated_at": time.time()},
+                  f, ensure_ascii=False)
+
+
+def draft_complete(draft):
+    return bool(draft and draft.get("body"))
+
+
+_held_locks = {} # path -> open lock file, kept open while the lock is held
+
+
+def _try_lock(f):
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def acquire_lock(path):
+    """OS file lock (flock / msvcrt) on a lock file that is never deleted. Returns True if acquired.
+    The OS drops the lock when its holder dies, so there is no stale lock to take over and two
+    processes can never both end up holding it. The file holds the owner's pid, for information."""
+    if path in _held_locks:
+        return False
+    f = open(path, "a+")
+    if not _try_lock(f):
+        f.close()
+        return False
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    _held_locks[path] = f
+    return True
+
+
+def release_lock(path):
+    f = _held_locks.pop(path, None)
+    if f is not None:
+        f.close() # Releases the lock; the file stays, removing it would let two holders lock different files
+
+
+# --- Scheduler ---
+def plan_campaign(campaign, state, now):
+    """Decides what a campaign needs right now: ("send"|"skip"|"generate"|None, run_time)."""
+    entry = state.get(campaign["name"], {})
+    if "last_run" not in entry:
+        # First sight of this campaign: start from now, don't backfill history
+        entry["last_run"] = now.isoformat(timespec="minutes")
+        state[campaign["name"]] = entry
+    last = datetime.fromisoformat(entry["last_run"])
+
+    due = last_run(campaign["schedule"], now, last)
+    if due is not None:
+        if now - due > timedelta(hours=campaign["catch_up_hours"]):
+            return "skip", due
+        return "send", due
+
+    upcoming = next_run(campaign["schedule"], max(last, now))
+    if now >= upcoming - timedelta(minutes=campaign["lead_minutes"]) and not draft_complete(load_draft(campaign, upcoming)):
+        return "generate", upcoming
+    return None, upcoming
+
+
+def _credentials(tenant):
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'), override=True)
+    return (os.getenv("GOOGLE_API_KEY"),) + tenant.sender_credentials()
+
+
+def _defer_generation(state, campaign, run_time, error):
+    """Records a failed generation and backs off (5, 10, 20... minutes) instead of retrying every tick."""
+    entry = state[campaign["name"]]
+    entry["generate_failures"] = failures = entry.get("generate_failures", 0) + 1
+    delay = min(GENERATE_BACKOFF_MAX_MINUTES, GENERATE_BACKOFF_MINUTES * 2 ** (failures - 1))
+    retry_at = datetime.now() + timedelta(minutes=delay)
+    entry["generate_retry_at"] = retry_at.isoformat(timespec="seconds")
+    entry["generate_error"] = f"{datetime.now().isoformat(timespec='seconds')} run {run_time}: {error}"
+    save_state(state, campaign["tenant"])
+    print(f"⚠️ [{campaign['tenant']}/{campaign['name']}] Generation failed ({error}), "
+          f"retrying at {retry_at:%H:%M} (failure {failures})")
+
+
+def run_campaign(campaign, action, run_time, state, dry_run=False):
+    name = campaign["name"]
+    tenant = tenants.get_tenant(campaign["tenant"])
+    label = f"{tenant.id}/{name}"
+    if action == "skip":
+        print(f"⏭️ [{label}] Missed run {run_time} is older than {campaign['catch_up_hours']}h, skipping")
+        if not dry_run:
+            state[name]["last_run"] = run_time.isoformat(timespec="minutes")
+            save_state(state, tenant)
+        return True
+
+    recipients = segment_recipients(campaign["segment"], tenant=tenant)
+    if dry_run:
+        draft = load_draft(campaign, run_time)
+        draft = "ready" if draft_complete(draft) else "incomplete" if draft else "not generated"
+        print(f"🧪 [{label}] Would {action} run {run_time}: {len(recipients)} recipients, "
+              f"template={campaign['template']}, draft {draft}")
+        if state.get(name, {}).get("last_error"):
+            print(f"   Last error: {state[name]['last_error']}")
+        if state.get(name, {}).get("generate_retry_at"):
+            print(f"   Generation failed ({state[name]['generate_error']}), backing off until "
+                  f"{state[name]['generate_retry_at']}")
+        return True
+
+    retry_at = state[name].get("generate_retry_at")
+    if retry_at and datetime.now() < datetime.fromisoformat(retry_at) and not draft_complete(load_draft(campaign, run_time)):
+        return False # Backing off after a failed generation
+
+    send_lock = tenant.path(SEND_LOCK)
+    if not acquire_lock(send_lock):
+        print(f"🔒 [{label}] Another newsletter run is in progress, will retry next tick")
+        return False
+    try:
+        api_key, sender_email, sender_password = _credentials(tenant)
+        draft = load_draft(campaign, run_time)
+        if not draft_complete(draft):
+            if not api_key:
+                print("❌ Error: GOOGLE_API_KEY is missing.")
+                _defer_generation(state, campaign, run_time, "GOOGLE_API_KEY is missing")
+                return False
+            print(f"📊 [{label}] Generating content for run {run_time}")
+            try:
+                subject, body, sections = TEMPLATES[campaign["template"]](api_key, campaign, run_time, draft)
+            except Exception as e:
+                _defer_generation(state, campaign, run_time, e)
+                raise
+            save_draft(campaign, run_time, subject, body, sections)
+            if body is None:
+                # Good grades stay in the saved draft; only the failing ones are retried after the backoff
+                _defer_generation(state, campaign, run_time,
+                                  f"draft incomplete ({newsletter_utils.draft_summary(sections)})")
+                return False
+            for key in ("generate_failures", "generate_retry_at", "generate_error"):
+                state[name].pop(key, None)
+            save_state(state, tenant)
+            draft = {"subject": subject, "body": body}
+        if action == "generate":
+            return True
+
+        if not sender_email or not sender_password:
+            print(f"❌ Error: Email credentials ({tenant.sender_email_env}, {tenant.sender_password_env}) are missing.")
+            return False
+        if not recipients:
+            print(f"⚠️ [{label}] No recipients in segment {campaign['segment']}")
+        else:
+            print(f"📤 [{label}] Sending to {len(recipients)} recipients")
+            # Delivered addresses are logged one by one: a retry after a crash or a failed tick
+            # only sends to the rest
+            delivery_log = newsletter_utils.delivery_log_path(draft["subject"], draft["body"], tenant.id)
+            success, msg, metrics = newsletter_utils.send_email(
+                sender_email, sender_password, recipients, draft["subject"], draft["body"],
+                delivery_log=delivery_log, tenant=tenant.id)
+            metrics = metrics or {}
+            print(f"{'✅ Success' if success else '❌ Failed'}: {msg}")
+            print(f"📈 Delivery metrics: {newsletter_utils.format_send_metrics(metrics)}")
+            delivered = metrics.get("sent", 0) + metrics.get("skipped", 0)
+            when = f"{datetime.now().isoformat(timespec='seconds')} run {run_time}"
+            if not success or not delivered:
+                # Nothing reached anyone: the run stays due and is retried next tick
+                state[name]["last_error"] = f"{when}: 0/{len(recipients)} delivered ({msg})"
+                save_state(state, tenant)
+                print(f"🚨 [{label}] {state[name]['last_error']}, will retry next tick")
+                return False
+            if metrics.get("failed"):
+                state[name]["last_error"] = f"{when}: {metrics['failed']}/{len(recipients)} failed ({msg})"
+                print(f"⚠️ [{label}] {state[name]['last_error']}")
+            else:
+                state[name].pop("last_error", None)
+        state[name]["last_run"] = run_time.isoformat(timespec="minutes")
+        state[name]["last_sent_at"] = datetime.now().isoformat(timespec="seconds")
+        save_state(state, tenant)
+        os.remove(_draft_path(campaign, run_time))
+        if recipients and os.path.exists(delivery_log):
+            os.remove(delivery_log)
+        return True
+    finally:
+        release_lock(send_lock)
+
+
+def tick_tenant(tenant, now=None, dry_run=False):
+    now = now or datetime.now()
+    state = load_state(tenant)
+    for campaign in load_campaigns(tenant):
+        try:
+            # A campaign can have a missed run to catch up and then its next pre-generation
+            for _ in range(3):
+                action, run_time = plan_campaign(campaign, state, now)
+                if action is None:
+                    if dry_run:
+                        print(f"🗓️ [{tenant.id}/{campaign['name']}] Next run {run_time}")
+                    break
+                if not run_campaign(campaign, action, run_time, state, dry_run) or dry_run:
+                    break
+        except Exception as e:
+            print(f"❌ [{tenant.id}/{campaign['name']}] Error: {e}")
+    if not dry_run:
+        save_state(state, tenant)
+
+
+def tick(now=None, dry_run=False, only=None):
+    """One pass over every branch's campaigns (or just `only`, a tenant id)."""
+    for tenant in tenants.list_tenants():
+        if only and tenant.id != only:
+            continue
+        try:
+            tick_tenant(tenant, now, dry_run)
+        except Exception as e:
+            print(f"❌ [{tenant.id}] Error: {e}")
+
+
+def run_forever(only=None, dry_run=False):
+    if not dry_run and not acquire_lock(DAEMON_LOCK):
+        print("🔒 Scheduler already running (scheduler.lock). Exiting.")
+        return
+    print(f"--- 🗓️ Newsletter Scheduler Started ({datetime.now()}) ---")
+    try:
+        while True:
+            tick(dry_run=dry_run, only=only)
+            time.sleep(TICK_SECONDS)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_lock(DAEMON_LOCK)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Newsletter campaign scheduler.")
+    parser.add_argument("--tenant", help="Only this branch (default: all branches in tenants.json)")
+    parser.add_argument("--once", action="store_true", help="Run a single tick and exit")
+    parser.add_argument("--dry-run", action="store_true", help="Report planned actions without generating or sending")
+    args = parser.parse_args(argv)
+    if args.tenant:
+        tenants.get_tenant(args.tenant) # Fail fast on an unknown branch
+    if args.once or args.dry_run:
+        tick(dry_run=args.dry_run, only=args.tenant)
+    else:
+        run_forever(args.tenant)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import hashlib
+from datetime import datetime, timedelta
+import tenants
+import student_store
+
+# Storage maintenance for student_docs (per branch).
+#
+#   python storage_maintenance.py report                 # per-student usage
+#   python storage_maintenance.py reconcile [--dry-run]  # profiles <-> disk <-> manifests
+#   python storage_maintenance.py gc [--dry-run]         # delete orphaned / leftover files
+#   python storage_maintenance.py archive --days 365     # zip docs of students not updated in a year
+#   python storage_maintenance.py restore "Alex Kim"
+#
+# Add --tenant <id> to limit a command to one branch (default: all branches).
+
+ARCHIVE_DIR = "student_archive"
+GC_MIN_AGE_HOURS = 24 # Never delete files younger than this (uploads/jobs may still be using them)
+JOB_FILES_MAX_AGE_DAYS = 7
+
+
+def _norm(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(student_store.CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _student_files_on_disk(student_dir):
+    if not os.path.isdir(student_dir):
+        return []
+    return [e for e in os.scandir(student_dir) if e.is_file() and e.name != student_store.MANIFEST_FILE]
+
+
+def reconcile_student(data, student_name, tenant=None, dry_run=False):
+    """Drops missing paths from one profile and syncs that student's manifest. Returns a change summary."""
+    record = data.get(student_name, {})
+    files = record.get("files", [])
+    existing = [p for p in files if os.path.exists(p)]
+    summary = {"student": student_name, "missing_refs": [p for p in files if p not in existing],
+               "manifest_added": [], "manifest_removed": []}
+
+    student_dir = os.path.join(student_store.docs_dir(tenant), student_name)
+    if os.path.isdir(student_dir):
+        manifest = student_store.load_manifest(student_dir)
+        on_disk = {e.name: e for e in _student_files_on_disk(student_dir)}
+        for name in list(manifest):
+            if name not in on_disk:
+                summary["manifest_removed"].append(name)
+                del manifest[name]
+        for name, entry in on_disk.items():
+            current = manifest.get(name)
+            if name.endswith(".part"):
+                continue
+            if current is None or current.get("size") != entry.stat().st_size:
+                summary["manifest_added"].append(name)
+                if not dry_run:
+                    manifest[name] = {"size": entry.stat().st_size, "sha256": _hash_file(entry.path)}
+        if not dry_run and (summary["manifest_added"] or summary["manifest_removed"]):
+            student_store.save_manifest(student_dir, manifest)
+
+    if summary["missing_refs"] and not dry_run:
+        record["files"] = existing
+    return summary
+
+
+def reconcile(tenant=None, dry_run=False):
+    data = student_store.load_data(tenant)
+    results = [reconcile_student(data, name, tenant, dry_run) for name in data]
+    if not dry_run and any(r["missing_refs"] for r in results):
+        student_store.save_data(data, tenant)
+    return [r for r in results if r["missing_refs"] or r["manifest_added"] or r["manifest_removed"]]
+
+
+def find_orphans(tenant=None, min_age_hours=GC_MIN_AGE_HOURS):
+    """Files under student_docs that no profile references (incl. folders of deleted students)."""
+    data = student_store.load_data(tenant)
+    referenced = {_norm(p) for record in data.values() for p in record.get("files", [])}
+    docs_dir = student_store.docs_dir(tenant)
+    cutoff = time.time() - min_age_hours * 3600
+    orphans = []
+    if not os.path.isdir(docs_dir):
+        return orphans
+    for student_dir in os.scandir(docs_dir):
+        if not student_dir.is_dir():
+            continue
+        for entry in _student_files_on_disk(student_dir.path):
+            if _norm(entry.path) in referenced or entry.stat().st_mtime > cutoff:
+                continue
+            orphans.append({"path": entry.path, "student": student_dir.name, "bytes": entry.stat().st_size,
+                            "reason": "partial upload" if entry.name.endswith(".part") else "unreferenced"})
+    return orphans
+
+
+def collect_garbage(tenant=None, dry_run=False, min_age_hours=GC_MIN_AGE_HOURS):
+    """Deletes orphaned docs (and their manifest entries) plus stale job staging and upload spool folders."""
+    orphans = find_orphans(tenant, min_age_hours)
+    freed = 0
+    touched = {}
+    for orphan in orphans:
+        freed += orphan["bytes"]
+        if dry_run:
+            continue
+        os.remove(orphan["path"])
+        touched.setdefault(os.path.dirname(orphan["path"]), []).append(os.path.basename(orphan["path"]))
+    for student_dir, names in touched.items():
+        manifest = student_store.load_manifest(student_dir)
+        for name in names:
+            manifest.pop(name, None)
+        if _student_files_on_disk(student_dir):
+            student_store.save_manifest(student_dir, manifest)
+        else:
+            shutil.rmtree(student_dir, ignore_errors=True) # Nothing left (e.g. a deleted student)
+
+    # Uploads staged for background jobs (job_runner.stage_files) are only needed while the job runs
+    import job_runner
+    stale_jobs = []
+    if os.path.isdir(job_runner.JOB_FILES_DIR):
+        cutoff = time.time() - JOB_FILES_MAX_AGE_DAYS * 86400
+        for entry in os.scandir(job_runner.JOB_FILES_DIR):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                stale_jobs.append(entry.path)
+                freed += size
+                if not dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+    # Large chat uploads spooled by request_builder.spool_once, left behind by a crashed worker
+    stale_spools = []
+    if os.path.isdir(student_store.SPOOL_DIR):
+        cutoff = time.time() - min_age_hours * 3600
+        for entry in os.scandir(student_store.SPOOL_DIR):
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                freed += sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                stale_spools.append(entry.path)
+                if not dry_run:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+    return {"orphans": orphans, "job_files": stale_jobs, "upload_spool": stale_spools, "freed_bytes": freed}
+
+
+def _last_updated(record):
+    try:
+        return datetime.fromisoformat(record.get("last_updated", ""))
+    except ValueError:
+        return None
+
+
+def archive_stale(tenant=None, days=365, dry_run=False):
+    """Zips the documents of students not updated for `days` and frees the originals.
+
+    The profile keeps a pointer to the archive (`archived`), so `restore` can bring them back.
+    """
+    data = student_store.load_data(tenant)
+    archive_dir = tenants.get_tenant(tenant).path(ARCHIVE_DIR)
+    cutoff = datetime.now() - timedelta(days=days)
+    archived = []
+    for name, record in data.items():
+        updated = _last_updated(record)
+        files = [p for p in record.get("files", []) if os.path.exists(p)]
+        if not files or updated is None or updated > cutoff:
+            continue
+        zip_path = os.path.join(archive_dir, f"{name}.zip")
+        size = sum(os.path.getsize(p) for p in files)
+        archived.append({"student": name, "files": len(files), "bytes": size, "archive": zip_path})
+        if dry_run:
+            continue
+        os.makedirs(archive_dir, exist_ok=True)
+        with zipfile.ZipFile(zip_path, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+            existing = set(zf.namelist())
+            for path in files:
+                if os.path.basename(path) not in existing:
+                    zf.write(path, arcname=os.path.basename(path))
+        for path in files:
+            os.remove(path)
+        student_dir = os.path.join(student_store.docs_dir(tenant), name)
+        if not _student_files_on_disk(student_dir):
+            shutil.rmtree(student_dir, ignore_errors=True)
+        record["archived"] = {"path": zip_path, "files": files, "at": str(datetime.now())}
+        record["files"] = []
+    if archived and not dry_run:
+        student_store.save_data(data, tenant)
+    return archived
+
+
+def restore(student_name, tenant=None):
+    """Unpacks an archived student's documents back to their original paths."""
+    data = student_store.load_data(tenant)
+    record = data.get(student_name)
+    if not record or not record.get("archived"):
+        return []
+    info = record["archived"]
+    with zipfile.ZipFile(info["path"]) as zf:
+        for path in info["files"]:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with zf.open(os.path.basename(path)) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst, student_store.CHUNK_SIZE)
+    record["files"] = list(dict.fromkeys(record.get("files", []) + info["files"]))
+    del record["archived"]
+    reconcile_student(data, student_name, tenant)
+    student_store.save_data(data, tenant)
+    os.remove(info["path"])
+    return info["files"]
+
+
+def usage_report(tenant=None):
+    """Per student: referenced files, bytes on disk, missing references, orphan bytes, archive size."""
+    data = student_store.load_data(tenant)
+    docs_dir = student_store.docs_dir(tenant)
+    orphan_bytes = {}
+    for orphan in find_orphans(tenant, min_age_hours=0):
+        orphan_bytes[orphan["student"]] = orphan_bytes.get(orphan["student"], 0) + orphan["bytes"]
+
+    names = set(data)
+    if os.path.isdir(docs_dir):
+        names.update(e.name for e in os.scandir(docs_dir) if e.is_dir())
+    rows = []
+    for name in sorted(names):
+        record = data.get(name, {})
+        files = record.get("files", [])
+        archive = record.get("archived", {}).get("path")
+        rows.append({
+            "student": name,
+            "in_roster": name in data,
+            "files": len(files),
+            "disk_bytes": student_store.student_usage(name, tenant),
+            "missing_refs": sum(1 for p in files if not os.path.exists(p)),
+            "orphan_bytes": orphan_bytes.get(name, 0),
+            "archive_bytes": os.path.getsize(archive) if archive and os.path.exists(archive) else 0,
+            "last_updated": record.get("last_updated", ""),
+        })
+    return rows
+
+
+def _fmt_bytes(n):
+    return f"{n / (1024 * 1024):.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.0f} KB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="student_docs maintenance.")
+    parser.add_argument("command", choices=["report", "reconcile", "gc", "archive", "restore"])
+    parser.add_argument("student", nargs="?", help="Student name (restore)")
+    parser.add_argument("--tenant", help="Only this branch (default: all branches)")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would change")
+    parser.add_argument("--days", type=int, default=365, help="archive: students not updated for this many days")
+    parser.add_argument("--json", action="store_true", help="Print JSON")
+    args = parser.parse_args(argv)
+
+    branches = [tenants.get_tenant(args.tenant)] if args.tenant else tenants.list_tenants()
+    output = {}
+    for tenant in branches:
+        if args.command == "report":
+            result = usage_report(tenant)
+        elif args.command == "reconcile":
+            result = reconcile(tenant, args.dry_run)
+        elif args.command == "gc":
+            result = collect_garbage(tenant, args.dry_run)
+        elif args.command == "archive":
+            result = archive_stale(tenant, args.days, args.dry_run)
+        else:
+            if not args.student:
+                parser.error("restore needs a student name")
+            result = restore(args.student, tenant)
+        output[tenant.id] = result
+
+        if args.json:
+            continue
+        print(f"== {tenant.name} ({tenant.id})")
+        if args.command == "report":
+            for r in result:
+                flags = ("" if r["in_roster"] else " [not in roster]") + (f" missing={r['missing_refs']}" if r["missing_refs"] else "")
+                print(f"   {r['student']:<24} {r['files']:>3} files  {_fmt_bytes(r['disk_bytes']):>9}  "
+                      f"orphans {_fmt_bytes(r['orphan_bytes']):>9}  archive {_fmt_bytes(r['archive_bytes']):>9}{flags}")
+            print(f"   Total on disk: {_fmt_bytes(sum(r['disk_bytes'] for r in result))}")
+        elif args.command == "reconcile":
+            for r in result:
+                print(f"   {r['student']}: -{len(r['missing_refs'])} missing refs, "
+                      f"+{len(r['manifest_added'])}/-{len(r['manifest_removed'])} manifest entries")
+            print(f"   {len(result)} students {'would change' if args.dry_run else 'updated'}")
+        elif args.command == "gc":
+            for o in result["orphans"]:
+                print(f"   {'would delete' if args.dry_run else 'deleted'} {o['path']} ({o['reason']}, {_fmt_bytes(o['bytes'])})")
+            for path in result["job_files"]:
+                print(f"   {'would delete' if args.dry_run else 'deleted'} {path} (job staging)")
+            for path in result["upload_spool"]:
+                print(f"   {'would delete' if args.dry_run else 'deleted'} {path} (spooled upload)")
+            print(f"   {'Would free' if args.dry_run else 'Freed'} {_fmt_bytes(result['freed_bytes'])}")
+        elif args.command == "archive":
+            for a in result:
+                print(f"   {a['student']}: {a['files']} files, {_fmt_bytes(a['bytes'])} -> {a['archive']}")
+        else:
+            print(f"   Restored {len(result)} files")
+    if args.json:
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
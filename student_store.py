@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import tempfile
+import tenants
+
+# Student profile storage (students_data.json + student_docs/<name>/).
+# Kept free of Streamlit so auto_sender, benchmarks and maintenance scripts can use it.
+# Every function takes an optional tenant (branch); None means the original layout below.
+
+DATA_FILE = "students_data.json"
+DOCS_DIR = "student_docs" # Directory to save files
+MANIFEST_FILE = ".manifest.json" # Per student folder: {file name: {"size", "sha256"}}
+PLANS_DIR = "student_plans" # Generated Master Plans: student_plans/<name>/<YYYYmmdd-HHMMSS>.md
+SPOOL_DIR = "upload_spool" # Large chat uploads spooled to disk (one folder each); swept by storage_maintenance gc
+
+# Uploads are streamed to disk in fixed-size chunks (hashing as they go) instead of being
+# copied into memory, and are capped per file and per student.
+CHUNK_SIZE = 1024 * 1024
+MAX_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_MB", "50")) * 1024 * 1024
+MAX_STUDENT_BYTES = int(os.getenv("MAX_STUDENT_DOCS_MB", "200")) * 1024 * 1024
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, message, saved=None):
+        super().__init__(message)
+        self.saved = saved or [] # Files of the same batch that were stored before the limit hit
+
+
+def data_file(tenant=None):
+    return tenants.get_tenant(tenant).data_file if tenant else DATA_FILE
+
+
+def docs_dir(tenant=None):
+    return tenants.get_tenant(tenant).docs_dir if tenant else DOCS_DIR
+
+
+def plans_dir(tenant=None):
+    return tenants.get_tenant(tenant).path(PLANS_DIR) if tenant else PLANS_DIR
+
+
+def load_data(tenant=None):
+    path = data_file(tenant)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_data(data, tenant=None):
+    if tenant:
+        tenants.get_tenant(tenant).ensure_dirs()
+    with open(data_file(tenant), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def stream_to_file(source, dest_path, max_bytes=None):
+    """Copies a file-like object to dest_path in CHUNK_SIZE pieces. Returns (size, sha256).
+
+    Writes to a temporary file first, so a failed or oversized upload never replaces an existing file.
+    """
+    if hasattr(source, "seek"):
+        source.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path) or ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise QuotaExceeded(f"{os.path.basename(dest_path)} exceeds the {max_bytes // (1024 * 1024)} MB per-file limit")
+                digest.update(chunk)
+                out.write(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if hasattr(source, "seek"):
+            source.seek(0)
+    return size, digest.hexdigest()
+
+
+def load_manifest(student_dir):
+    path = os.path.join(student_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def save_manifest(student_dir, manifest):
+    with open(os.path.join(student_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+
+def file_digest(file_path):
+    """(size, sha256) for a saved file, from its folder manifest when it is current."""
+    entry = load_manifest(os.path.dirname(file_path)).get(os.path.basename(file_path))
+    if entry and os.path.exists(file_path) and os.path.getsize(file_path) == entry.get("size"):
+        return entry["size"], entry["sha256"]
+    return None
+
+
+def student_usage(student_name, tenant=None):
+    """Bytes stored in a student's document folder."""
+    student_dir = os.path.join(docs_dir(tenant), student_name)
+    if not os.path.isdir(student_dir):
+        return 0
+    return sum(e.stat().st_size for e in os.scandir(student_dir) if e.is_file() and e.name != MANIFEST_FILE)
+
+
+def save_uploaded_files(student_name, uploaded_files, tenant=None):
+    if not uploaded_files:
+        return []
+
+    student_dir = os.path.join(docs_dir(tenant), student_name)
+    os.makedirs(student_dir, exist_ok=True)
+
+    saved_file_paths = []
+    manifest = load_manifest(student_dir)
+    usage = student_usage(student_name, tenant)
+
+    try:
+        for file in uploaded_files:
+            file_path = os.path.join(student_dir, os.path.basename(file.name))
+            replaced = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            # The per-student cap leaves room for the file this upload replaces
+            room = MAX_STUDENT_BYTES - usage + replaced
+            if room <= 0:
+                raise QuotaExceeded(f"'{student_name}' has reached the {MAX_STUDENT_BYTES // (1024 * 1024)} MB document limit",
+                                    saved_file_paths)
+            try:
+                size, sha256 = stream_to_file(file, file_path, min(MAX_FILE_BYTES, room))
+            except QuotaExceeded as e:
+                if room < MAX_FILE_BYTES:
+                    raise QuotaExceeded(f"{file.name} would exceed the {MAX_STUDENT_BYTES // (1024 * 1024)} MB document limit for '{student_name}'",
+                                        saved_file_paths)
+                raise QuotaExceeded(str(e), saved_file_paths)
+            usage += size - replaced
+            manifest[os.path.basename(file_path)] = {"size": size, "sha256": sha256}
+            saved_file_paths.append(file_path)
+    finally:
+        save_manifest(student_dir, manifest)
+
+    return saved_file_paths
+
+
+def spool_upload(uploaded_file, spool_dir=None):
+    """Streams an in-memory upload to a file so it can be passed on by path (default: a new folder
+    under SPOOL_DIR, which the caller removes when done)."""
+    if spool_dir is None:
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        spool_dir = tempfile.mkdtemp(prefix="upload_", dir=SPOOL_DIR)
+    path = os.path.join(spool_dir, os.path.basename(uploaded_file.name))
+    size, sha256 = stream_to_file(uploaded_file, path, MAX_FILE_BYTES)
+    return path, size, sha256
+
+
+def delete_data(student_name, tenant=None):
+    if not student_name: return False
+
+    # 1. Remove from JSON
+    data = load_data(tenant)
+    if student_name in data:
+        del data[student_name]
+        save_data(data, tenant)
+
+        # 2. Remove Files (Optional - strictly remove only if exists to avoid errors)
+        import shutil
+        student_dir = os.path.join(docs_dir(tenant), student_name)
+        if os.path.exists(student_dir):
+            try:
+                shutil.rmtree(student_dir)
+            except Exception as e:
+                print(f"Error deleting directory: {e}")
+
+        # 3. Remove chatbot conversations
+        import chat_store
+        chat_store.delete_student(student_name, tenant)
+        return True
+    return False
+
+
+def save_plan(student_name, plan_text, tenant=None):
+    """Stores a generated Master Plan; every generation is kept, newest is the current one."""
+    from datetime import datetime
+    student_dir = os.path.join(plans_dir(tenant), student_name)
+    os.makedirs(student_dir, exist_ok=True)
+    path = os.path.join(student_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(plan_text)
+    return path
+
+
+def latest_plan(student_name, tenant=None):
+    """{"path", "text", "created"} for the newest saved plan, or None."""
+    student_dir = os.path.join(plans_dir(tenant), student_name)
+    if not os.path.isdir(student_dir):
+        return None
+    names = sorted(n for n in os.listdir(student_dir) if n.endswith(".md"))
+    if not names:
+        return None
+    path = os.path.join(student_dir, names[-1])
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    created = names[-1][:-3]
+    return {"path": path, "text": text, "created": f"{created[:4]}-{created[4:6]}-{created[6:8]} {created[9:11]}:{created[11:13]}"}
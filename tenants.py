@@ -0,0 +1,112 @@
+import os
+import re
+import json
+
+# Branch (tenant) partitioning. Every branch keeps its profiles, documents, subscribers,
+# campaigns and scheduler state under its own root directory, and has its own sender
+# credentials and newsletter signature. Branches are defined in tenants.json:
+#
+#   {"duluth": {"name": "Elite Prep Duluth", "footer": "...",
+#               "sender_email_env": "SENDER_EMAIL_DULUTH", "sender_password_env": "SENDER_PASSWORD_DULUTH"}}
+#
+# Without tenants.json there is a single "suwanee" branch rooted at the working directory,
+# i.e. exactly the original single-branch layout.
+
+TENANTS_FILE = "tenants.json"
+TENANTS_DIR = "tenants" # Default root for branches other than the original one: tenants/<id>/
+DEFAULT_TENANT = "suwanee"
+
+SUWANEE_FOOTER = """
+Sent by Elite Prep Master Plan & Academic Consulting
+
+Andy Lee  | Branch Director <br>
+Elite Prep Suwanee powered by Elite Open School <br>
+1291 Old Peachtree Rd. NW #127, Suwanee, GA 30024 <br>
+Tel & Text: 470.253.1004
+"""
+
+DEFAULT_TENANTS = {
+    DEFAULT_TENANT: {
+        "name": "Elite Prep Suwanee",
+        "root": ".",
+        "footer": SUWANEE_FOOTER,
+        "sender_email_env": "SENDER_EMAIL",
+        "sender_password_env": "SENDER_PASSWORD",
+    },
+}
+
+_TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+class Tenant:
+    """One branch: its namespace on disk plus sender/signature settings."""
+
+    def __init__(self, tenant_id, config):
+        if not _TENANT_ID.match(tenant_id):
+            raise ValueError(f"Invalid tenant id: {tenant_id!r} (use lowercase letters, digits, - and _)")
+        self.id = tenant_id
+        self.name = config.get("name") or tenant_id
+        self.root = config.get("root") or os.path.join(TENANTS_DIR, tenant_id)
+        self.footer = config.get("footer") or ""
+        suffix = tenant_id.upper().replace("-", "_")
+        self.sender_email_env = config.get("sender_email_env") or f"SENDER_EMAIL_{suffix}"
+        self.sender_password_env = config.get("sender_password_env") or f"SENDER_PASSWORD_{suffix}"
+
+    def path(self, name):
+        """Path of a per-branch file; the original branch (root ".") keeps its bare file names."""
+        return name if self.root in (".", "") else os.path.join(self.root, name)
+
+    @property
+    def data_file(self):
+        return self.path("students_data.json")
+
+    @property
+    def docs_dir(self):
+        return self.path("student_docs")
+
+    @property
+    def subscribers_file(self):
+        return self.path("newsletter_subscribers.csv")
+
+    def sender_credentials(self):
+        return os.getenv(self.sender_email_env), os.getenv(self.sender_password_env)
+
+    def ensure_dirs(self):
+        if self.root not in (".", ""):
+            os.makedirs(self.root, exist_ok=True)
+
+    def __repr__(self):
+        return f"Tenant({self.id!r})"
+
+
+_cache = {"key": None, "tenants": None}
+
+
+def load_tenants():
+    """All branches, in file order. Re-read only when tenants.json changes."""
+    mtime = os.path.getmtime(TENANTS_FILE) if os.path.exists(TENANTS_FILE) else None
+    key = (os.path.abspath(TENANTS_FILE), mtime)
+    if _cache["key"] != key:
+        config = DEFAULT_TENANTS
+        if mtime is not None:
+            with open(TENANTS_FILE, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        _cache["tenants"] = {tid: Tenant(tid, cfg) for tid, cfg in config.items()}
+        _cache["key"] = key
+    return _cache["tenants"]
+
+
+def list_tenants():
+    return list(load_tenants().values())
+
+
+def get_tenant(tenant=None):
+    """Accepts a Tenant, a tenant id, or None (the default branch)."""
+    if isinstance(tenant, Tenant):
+        return tenant
+    tenants = load_tenants()
+    if tenant is None:
+        return tenants.get(DEFAULT_TENANT) or next(iter(tenants.values()))
+    if tenant not in tenants:
+        raise KeyError(f"Unknown tenant: {tenant}")
+    return tenants[tenant]